@@ -0,0 +1,10 @@
+"""
+Benchmarks of each stage of the FastSlow code on synthetic TNS databases (see synthetic.py and bench.py).
+
+Run from the FastSlow directory, e.g.:
+    python -m benchmark.bench run --scales 10k 150k --out results.json
+    python -m benchmark.bench compare old.json new.json
+
+Author: George Hume
+2023
+"""
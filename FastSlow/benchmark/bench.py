@@ -0,0 +1,287 @@
+"""
+Script to benchmark each stage of the FastSlow code on synthetic TNS databases of different sizes, recording the
+wall time and peak memory of every stage into a JSON results file, and to compare two results files to flag any
+stages that have got slower or use more memory.
+
+The stages run in this process are timed first and then run again under tracemalloc for their peak memory (so the
+tracing doesn't slow down the timings). The checker scripts in TNS/Checking are run as separate processes and their
+peak memory is the peak resident set size of that process (from /proc, so only on linux).
+
+Run from the FastSlow directory (python -m benchmark.bench), with the ephemerides file 'de421.bsp' in it.
+
+Author: George Hume
+2023
+"""
+
+### IMPORTS ###
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import subprocess
+import numpy as np
+import datetime as dt
+from functions import *
+from benchmark.synthetic import SCALES, make_database, make_update, write_csv
+
+#stages that can be benchmarked (in the order they are run)
+STAGES = ["loadDB", "DandU", "Visibility", "pscore", "priority_list", "visplots", "checker", "checker1.5", "checker2"]
+
+#directory of the checker scripts
+CHECKING = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "TNS", "Checking")
+
+################################################################################
+
+def measure(func, *args, repeat = 1, memory = True):
+    """
+    Times a function (the best of repeat runs) and finds its peak memory with tracemalloc.
+    Arguments:
+        - func: the function to benchmark
+        - args: the arguments to give it
+        - repeat: number of times to time it (default is 1)
+        - memory: if True it is run once more under tracemalloc for the peak memory (default is True)
+    Outputs:
+        - result: dictionary with "wall_s" (seconds), "peak_mb" (megabytes, None if memory is False) and "rows" (the
+                  number of rows the function gave back, None if it isn't an array)
+        - output: what the function gave back (from the last run)
+    """
+
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        output = func(*args)
+        times.append(time.perf_counter() - start)
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        output = func(*args)
+        peak = tracemalloc.get_traced_memory()[1]/1e6
+        tracemalloc.stop()
+
+    rows = len(output) if isinstance(output,(np.ndarray,list)) else None
+    return {"wall_s":min(times), "peak_mb":peak, "rows":rows}, output
+
+#runs a script and then saves the peak resident set size of its process (VmHWM, which unlike ru_maxrss isn't carried
+#over from the parent process on linux) to the file given as the first argument
+WRAPPER = """
+import sys, runpy
+peakname, script = sys.argv[1], sys.argv[2]
+sys.argv = sys.argv[2:]
+try:
+    runpy.run_path(script, run_name = "__main__")
+finally:
+    with open("/proc/self/status") as status, open(peakname, "w") as out:
+        out.write([line.split()[1] for line in status if line.startswith("VmHWM")][0])
+"""
+
+def run_script(script, *args):
+    """
+    Runs a script as a separate process (output thrown away) and finds its wall time and peak memory.
+    Arguments:
+        - script: path of the python script
+        - args: the arguments to give it
+    Outputs:
+        - result: dictionary with "wall_s" (seconds), "peak_mb" (peak resident set size of the process in megabytes,
+                  None if it couldn't be found) and "returncode" (non-zero if the script failed, e.g., a missing package)
+    """
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        peakname = f"{tmpdir}/peak"
+        start = time.perf_counter()
+        returncode = subprocess.call([sys.executable, "-c", WRAPPER, peakname, script, *args],
+                                     stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+        wall = time.perf_counter() - start
+
+        peak = None
+        if os.path.exists(peakname):
+            with open(peakname) as file:
+                peak = int(file.read())/1e3 #VmHWM is in kilobytes
+
+    return {"wall_s":wall, "peak_mb":peak, "returncode":returncode}
+
+################################################################################
+
+def run_scale(nrows, workdir, stages = STAGES, nupdate = 1000, repeat = 1, memory = True, checker_max = 20000):
+    """
+    Makes a synthetic database and update file of a given size and benchmarks the stages on them.
+    Arguments:
+        - nrows: number of entries in the database
+        - workdir: directory to save the synthetic files and the outputs of the stages in
+        - stages: list of the stages to run (default is STAGES - i.e., all of them)
+        - nupdate: number of entries in the update file (default is 1000)
+        - repeat: number of times each stage is timed, the fastest is kept (default is 1)
+        - memory: if True the peak memory of each stage is found too (default is True)
+        - checker_max: the checker scripts loop over every ID so are skipped for databases bigger than this
+                       (default is 20000)
+    Outputs:
+        - results: dictionary of the results of each stage (see measure and run_script)
+    """
+
+    #synthetic database and update file (the update covers the day before the database's date)
+    date, headers, database = make_database(nrows)
+    yesterday = dt.datetime.strptime(date,'%Y-%m-%d %H:%M:%S') - dt.timedelta(days=1)
+    udate, headers, updates = make_update(database,nupdate,yesterday)
+    DBname = f"{workdir}/tns_public_objects_synthetic.csv"
+    UDname = f"{workdir}/tns_public_objects_{udate}.csv"
+    #the night cache, grid and sky table are kept in the workdir too (never the server's)
+    cachename = f"{workdir}/night_cache.json"
+    gridname = f"{workdir}/night_grid.npz"
+    tablename = f"{workdir}/sky_table.npz"
+    write_csv(DBname,date,headers,database)
+    write_csv(UDname,date,headers,updates)
+    del database
+
+    results = {}
+    def record(stage, result):
+        results[stage] = result
+        print(f"  {stage:<14} {result['wall_s']:9.3f} s" + ("" if result["peak_mb"] is None else f"  {result['peak_mb']:9.1f} MB"))
+
+    #loading in the database (needed by every stage after)
+    result, (date, headers, database) = measure(loadDB, DBname, memory = memory and ("loadDB" in stages))
+    if "loadDB" in stages:
+        record("loadDB", result)
+
+    if "DandU" in stages:
+        #applying the update and saving the database (everything DandU does after the download)
+        today = dt.datetime.strptime(date,'%Y-%m-%d %H:%M:%S')
+        result, output = measure(apply_update, UDname, today, database, headers, workdir, repeat = repeat, memory = memory)
+        record("DandU", result)
+
+    #visibility of the targets in the survey windows (the inputs of pscore), only if a stage needs it as it needs the
+    #ephemerides
+    if ("Visibility" in stages) or ("pscore" in stages):
+        lat, long, elv = SITES["LT"]
+        good, windows, DB, ra, dec = candidates(database,date)
+        Visibility(ra[:1], dec[:1], lat, long, elv, cachename = cachename) #so the night and ephemerides are loaded first
+        result, (t_obs, l_sep, mill) = measure(Visibility, ra, dec, lat, long, elv, 'de421.bsp', "batch", cachename,
+                                               repeat = repeat, memory = memory and ("Visibility" in stages))
+        if "Visibility" in stages:
+            result["rows"] = len(ra)
+            record("Visibility", result)
+
+    if "pscore" in stages:
+        #the Slow list's targets with their visibility, as in survey_lists
+        allDB = np.array([DB.T[0],DB.T[1],DB.T[2],DB.T[3],DB.T[4],DB.T[5],DB.T[6],DB.T[7],t_obs,l_sep,DB.T[8]]).T
+        newDB = allDB[np.searchsorted(good,windows["Slow"])]
+        result, output = measure(pscore, newDB, WEIGHTS["Slow"], mill, "ordinal", THRESHOLDS["Slow"],
+                                 repeat = repeat, memory = memory)
+        record("pscore", result)
+
+    if ("priority_list" in stages) or ("visplots" in stages):
+        #both lists as the nightly run made them before priority_lists
+        both = lambda: [priority_list(database,date,Slow=False,cachename=cachename,gridname=gridname,tablename=tablename),
+                        priority_list(database,date,Slow=True,cachename=cachename,gridname=gridname,tablename=tablename)]
+        result, lists = measure(both, repeat = repeat, memory = memory)
+        if "priority_list" in stages:
+            record("priority_list", result)
+
+    if "visplots" in stages:
+        from visplots import plot_lists #only needed for the plots (needs matplotlib)
+        plots = [("transient_list-F.csv", lists[0]), ("transient_list-S.csv", lists[1])]
+        result, output = measure(plot_lists, plots, None, workdir, cachename, gridname, repeat = repeat, memory = memory)
+        record("visplots", result)
+
+    #the checker scripts compare the database before and after the update (saved by the DandU stage, otherwise
+    #written here)
+    if ("DandU" not in stages) and any(script in stages for script in ["checker", "checker1.5", "checker2"]):
+        write_csv(f"{workdir}/tns_public_objects.csv",date,headers,upsert(database,updates))
+    for script in ["checker", "checker1.5", "checker2"]:
+        if script not in stages:
+            continue
+        if nrows > checker_max:
+            print(f"  {script:<14} skipped (database bigger than {checker_max} rows)")
+            continue
+        record(script, run_script(os.path.join(CHECKING,f"{script}.py"), DBname, f"{workdir}/tns_public_objects.csv"))
+
+    return results
+
+################################################################################
+
+def compare(old, new, tolerance = 0.2, min_wall = 0.05, min_mem = 1.0):
+    """
+    Compares two results files and flags the stages that have got slower or use more memory.
+    Arguments:
+        - old, new: dictionaries loaded from the results files
+        - tolerance: fractional increase that counts as a regression (default is 0.2 - i.e., 20%)
+        - min_wall: increases in wall time smaller than this many seconds are ignored as noise (default is 0.05)
+        - min_mem: increases in peak memory smaller than this many megabytes are ignored (default is 1.0)
+    Outputs:
+        - regressions: list of (scale, stage, quantity, old value, new value) of every regression
+    """
+
+    regressions = []
+    for scale in new["scales"]:
+        if scale not in old["scales"]:
+            continue
+        print(f"\n{scale}:")
+        for stage, res in new["scales"][scale]["stages"].items():
+            if stage not in old["scales"][scale]["stages"]:
+                continue
+            prev = old["scales"][scale]["stages"][stage]
+
+            line = f"  {stage:<14}"
+            for quantity, floor, unit in [("wall_s", min_wall, "s"), ("peak_mb", min_mem, "MB")]:
+                if (res.get(quantity) is None) or (prev.get(quantity) is None):
+                    continue
+                a, b = prev[quantity], res[quantity]
+                flag = (b > a*(1 + tolerance)) and (b - a > floor)
+                if flag:
+                    regressions.append((scale, stage, quantity, a, b))
+                line += f"  {a:9.3f} -> {b:9.3f} {unit:<2}" + (" REGRESSION" if flag else "           ")
+            print(line)
+
+    return regressions
+
+################################################################################
+
+if __name__ == "__main__":
+
+    ### SYSTEM ARGUMENTS ###
+    parser = argparse.ArgumentParser(description = """
+    Benchmarks the stages of the FastSlow code on synthetic TNS databases, or compares two sets of results.
+    """)
+    subparsers = parser.add_subparsers(dest = "command", required = True)
+
+    run = subparsers.add_parser("run", help = "Run the benchmarks.")
+    run.add_argument('--scales' , type = str, nargs = "+", default = ["10k"], help = f'Sizes of the databases, numbers or any of: {", ".join(SCALES)} (default is 10k).')
+    run.add_argument('--stages' , type = str, nargs = "+", default = STAGES, choices = STAGES, help = 'Stages to benchmark (default is all of them).')
+    run.add_argument('--update' , type = int, default = 1000, help = 'Number of entries in the update file (default is 1000).')
+    run.add_argument('--repeat' , type = int, default = 1, help = 'Number of times each stage is timed, the fastest is kept (default is 1).')
+    run.add_argument('--no-memory' , action = "store_true", help = 'Skip the peak memory runs.')
+    run.add_argument('--checker-max' , type = int, default = 20000, help = 'Largest database the checker scripts are run on (default is 20000).')
+    run.add_argument('--workdir' , type = str, default = None, help = 'Directory for the synthetic files (default is a temporary directory).')
+    run.add_argument('--out' , type = str, default = 'benchmark_results.json', help = 'Path of the JSON results file.')
+
+    comp = subparsers.add_parser("compare", help = "Compare two results files.")
+    comp.add_argument('old' , type = str, help = 'Path of the results file to compare against.')
+    comp.add_argument('new' , type = str, help = 'Path of the new results file.')
+    comp.add_argument('--tolerance' , type = float, default = 0.2, help = 'Fractional increase that counts as a regression (default is 0.2).')
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.old) as file:
+            old = json.load(file)
+        with open(args.new) as file:
+            new = json.load(file)
+        regressions = compare(old, new, args.tolerance)
+        print(f"\n{len(regressions)} regressions")
+        exit(1 if len(regressions) != 0 else 0)
+
+    results = {"date":dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), "python":platform.python_version(),
+               "numpy":np.__version__, "machine":platform.machine(), "cpus":os.cpu_count(), "scales":{}}
+
+    for scale in args.scales:
+        nrows = SCALES[scale] if scale in SCALES else int(scale)
+        print(f"\n{scale} ({nrows} rows):")
+        with tempfile.TemporaryDirectory(dir = args.workdir) as workdir:
+            stages = run_scale(nrows, workdir, args.stages, args.update, args.repeat, not args.no_memory, args.checker_max)
+        results["scales"][scale] = {"rows":nrows, "stages":stages}
+
+        #saved after every scale so the smaller ones are kept if a bigger one fails
+        with open(args.out, 'w') as file:
+            json.dump(results, file, indent = 2)
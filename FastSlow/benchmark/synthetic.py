@@ -0,0 +1,203 @@
+"""
+Functions for making synthetic TNS databases and daily update files with the same columns and formats as
+tns_public_objects.csv, so each stage can be benchmarked at sizes bigger than the real database (e.g., 10k, 150k
+and 1M rows) without downloading anything.
+
+The discovery dates are spread evenly over the last few years and each entry was last modified at a random time
+between its discovery and the date of the database, so a realistic fraction of the entries fall in the Fast and
+Slow time windows. Update files modify a mix of existing entries and add new ones.
+
+Can be run as a script to write a database and an update file to disk.
+
+Author: George Hume
+2023
+"""
+
+### IMPORTS ###
+import csv
+import argparse
+import numpy as np
+import datetime as dt
+
+#columns of the TNS database
+HEADERS = ["objid","name_prefix","name","ra","declination","redshift","typeid","type","reporting_groupid",
+           "reporting_group","source_groupid","source_group","discoverydate","discoverymag","discmagfilter","filter",
+           "reporters","time_received","internal_names","creationdate","lastmodified"]
+
+#named sizes of the databases
+SCALES = {"10k": 10000, "150k": 150000, "1M": 1000000}
+
+#(group, filter, internal name prefix) of the surveys reporting the transients
+GROUPS = [("ZTF","r-ZTF","ZTF"), ("ATLAS","orange-ATLAS","ATLAS"), ("Pan-STARRS","w-PS1","PS"),
+          ("GaiaAlerts","G-Gaia","Gaia"), ("GOTO","L-GOTO","GOTO")]
+
+#classifications of the few entries that have one
+TYPES = [("1","SN Ia"), ("3","SN II"), ("10","SN Ib/c"), ("120","TDE")]
+
+LETTERS = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+
+################################################################################
+
+def _letters(index, nletters):
+    "Turns integers into lower-case letter codes (as used in the TNS names), e.g., 0 -> 'aaa'"
+    chars = []
+    for k in range(nletters):
+        chars.append(LETTERS[(index // 26**(nletters-1-k)) % 26])
+    return ["".join(c) for c in zip(*chars)]
+
+def _dates(epochs_ms, ms = False):
+    "Formats epochs in milliseconds as the TNS date strings (with milliseconds for discovery dates)"
+    times = np.array(epochs_ms,dtype="datetime64[ms]")
+    strings = np.datetime_as_string(times,unit="ms" if ms else "s")
+    return [s.replace("T"," ") for s in strings]
+
+################################################################################
+
+def make_rows(objids, disc, mod, rng):
+    """
+    Makes the rows of TNS entries.
+    Arguments:
+        - objids: array of the object IDs
+        - disc: array of the discovery times (milliseconds since the Unix epoch)
+        - mod: array of the last modified times (milliseconds since the Unix epoch)
+        - rng: numpy random generator
+    Outputs:
+        - rows: numpy object array of the entries (one row per object, columns as HEADERS)
+    """
+
+    n = objids.size
+    years = np.array(disc,dtype="datetime64[ms]").astype("datetime64[Y]").astype(int) + 1970
+
+    #names are the year of discovery plus a letter code
+    names = [f"{y}{code}" for y, code in zip(years,_letters(rng.integers(0,26**4,n),4))]
+    prefix = np.where(rng.random(n) < 0.1,"SN","AT")
+
+    group = rng.integers(0,len(GROUPS),n)
+    typed = rng.random(n) < 0.1
+    kind = rng.integers(0,len(TYPES),n)
+    codes = _letters(rng.integers(0,26**7,n),7)
+
+    rows = np.empty((n,len(HEADERS)),dtype="object")
+    rows[:,0] = objids.astype(str)
+    rows[:,1] = prefix
+    rows[:,2] = names
+    rows[:,3] = [f"{x:.7f}" for x in rng.uniform(0,360,n)]
+    rows[:,4] = [f"{x:.7f}" for x in np.degrees(np.arcsin(rng.uniform(-0.95,0.99,n)))]
+    rows[:,5] = ["" if not t else f"{z:.4f}" for t, z in zip(typed,rng.uniform(0.01,0.2,n))]
+    rows[:,6] = ["" if not t else TYPES[k][0] for t, k in zip(typed,kind)]
+    rows[:,7] = ["" if not t else TYPES[k][1] for t, k in zip(typed,kind)]
+    rows[:,8] = [str(g+1) for g in group]
+    rows[:,9] = [GROUPS[g][0] for g in group]
+    rows[:,10] = rows[:,8]
+    rows[:,11] = rows[:,9]
+    rows[:,12] = _dates(disc,ms=True)
+    rows[:,13] = [f"{m:.2f}" for m in rng.uniform(14,21.5,n)]
+    rows[:,14] = [GROUPS[g][1].split("-")[0] for g in group]
+    rows[:,15] = [GROUPS[g][1] for g in group]
+    rows[:,16] = [f"{GROUPS[g][0]} Bot, J. Smith, A. N. Other" for g in group]
+    rows[:,17] = _dates(disc + rng.integers(0,86400000,n))
+    rows[:,18] = [f"{GROUPS[g][2]}{y % 100}{c}" + (", ATLAS" + f"{y % 100}{c[:3]}" if g == 0 else "")
+                  for g, y, c in zip(group,years,codes)]
+    rows[:,19] = rows[:,17]
+    rows[:,20] = _dates(mod)
+
+    return rows
+
+def make_database(nrows, date = None, years = 8, seed = 0):
+    """
+    Makes a synthetic TNS database.
+    Arguments:
+        - nrows: number of entries
+        - date: the date of the database as a datetime object (default is None - i.e., today at midnight)
+        - years: the discovery dates are spread over this many years before date (default is 8)
+        - seed: seed of the random generator (default is 0)
+    Outputs:
+        - datestr: the date of the database as a string in the format '%Y-%m-%d %H:%M:%S'
+        - headers: the column headers as a list
+        - database: numpy object array of the entries (newest objid at the top, like the TNS)
+    """
+
+    if date is None:
+        date = dt.datetime.combine(dt.datetime.now(), dt.datetime.min.time())
+    rng = np.random.default_rng(seed)
+    now = int(np.datetime64(date,"ms").astype(np.int64))
+
+    #discovered at any time over the last few years and modified since then
+    disc = np.sort(now - rng.integers(0,int(years*365.25*86400000),nrows))[::-1]
+    mod = disc + (rng.random(nrows)*(now - disc)).astype(np.int64)
+    objids = np.arange(nrows,0,-1) + 100000
+
+    return date.strftime('%Y-%m-%d %H:%M:%S'), list(HEADERS), make_rows(objids, disc, mod, rng)
+
+def make_update(database, nrows, date = None, new = 0.5, seed = 1):
+    """
+    Makes a synthetic daily update file for a database, where some entries are modified and some are new.
+    Arguments:
+        - database: numpy object array of the database being updated
+        - nrows: number of entries in the update
+        - date: the date of the database being updated as a datetime object, the update covers the following day
+                (default is None - i.e., yesterday at midnight)
+        - new: fraction of the update that are new entries (default is 0.5)
+        - seed: seed of the random generator (default is 1)
+    Outputs:
+        - udate: the date of the update as a string in the format '%Y%m%d' (as in the update file's name)
+        - headers: the column headers as a list
+        - updates: numpy object array of the entries
+    """
+
+    if date is None:
+        date = dt.datetime.combine(dt.datetime.now(), dt.datetime.min.time()) - dt.timedelta(days=1)
+    rng = np.random.default_rng(seed)
+    start = int(np.datetime64(date,"ms").astype(np.int64))
+
+    #new entries were discovered during the day, with IDs above the database's
+    nnew = int(round(nrows*new))
+    top = int(database[0][0]) if len(database) != 0 else 100000
+    disc = np.sort(start + rng.integers(0,86400000,nnew))[::-1]
+    mod = disc + (rng.random(nnew)*(start + 86400000 - disc)).astype(np.int64)
+    new_rows = make_rows(np.arange(top+nnew,top,-1), disc, mod, rng)
+
+    #the rest are existing entries modified during the day (recent entries are more likely to be)
+    nold = min(nrows - nnew, len(database))
+    picks = np.unique(np.minimum(rng.exponential(len(database)/20,nold).astype(int),len(database)-1))
+    old_rows = database[picks].copy()
+    old_rows[:,20] = _dates(start + rng.integers(0,86400000,picks.size))
+
+    updates = np.concatenate((new_rows,old_rows),axis=0)
+    return date.strftime('%Y%m%d'), list(HEADERS), updates
+
+################################################################################
+
+def write_csv(filename, date, headers, rows):
+    """
+    Saves a database or update file in the format of the TNS (date, headers then the entries).
+    """
+    with open(filename, 'w') as file:
+        csvwriter = csv.writer(file,delimiter=",") # create a csvwriter object
+        csvwriter.writerow([date]) #add date to first row
+        csvwriter.writerow(headers) #add the headers
+        csvwriter.writerows(rows) # write the rest of the data
+
+################################################################################
+
+if __name__ == "__main__":
+
+    ### SYSTEM ARGUMENTS ###
+    parser = argparse.ArgumentParser(description = """
+    Makes a synthetic TNS database and daily update file.
+    """)
+
+    #adding arguments to praser object
+    parser.add_argument('scale' , type = str, help = f'Number of entries, either a number or one of: {", ".join(SCALES)}.')
+    parser.add_argument('--out' , type = str, default = '.', help = 'Directory to save the files in (default is the current directory).')
+    parser.add_argument('--update' , type = int, default = 1000, help = 'Number of entries in the update file (default is 1000).')
+    parser.add_argument('--seed' , type = int, default = 0, help = 'Seed of the random generator (default is 0).')
+    args = parser.parse_args()
+
+    nrows = SCALES[args.scale] if args.scale in SCALES else int(args.scale)
+    date, headers, database = make_database(nrows,seed=args.seed)
+    write_csv(f"{args.out}/tns_public_objects.csv",date,headers,database)
+
+    yesterday = dt.datetime.strptime(date,'%Y-%m-%d %H:%M:%S') - dt.timedelta(days=1)
+    udate, headers, updates = make_update(database,args.update,yesterday,seed=args.seed+1)
+    write_csv(f"{args.out}/tns_public_objects_{udate}.csv",f"{date}",headers,updates)
@@ -0,0 +1,260 @@
+"""
+Functions for saving the TNS database as a columnar binary store, so that each stage only has to read the
+columns it needs rather than re-parsing the whole of tns_public_objects.csv.
+
+The store is a directory (usually 'tns_public_objects.cols') containing:
+    - meta.json: the date the database was updated, the column headers and the number of rows
+    - <column>.offsets.npy and <column>.chars.npy: every column as UTF-8 bytes with the start/end offsets of each row,
+      so the CSV can be exported exactly as it was read in
+    - <column>.f8.npy: float64 copies of ra, declination and discoverymag (NaN where blank)
+    - <column>.i8.npy: int64 copies of discoverydate and lastmodified as milliseconds since the Unix epoch (UTC)
+All the .npy files are memory-mapped when loaded so only the parts that are used are read from disk.
+
+Can be run as a script to build the store from the CSV or to export the CSV from the store.
+
+Author: George Hume
+2023
+"""
+
+### IMPORTS ###
+import csv
+import os
+import json
+import shutil
+import argparse
+import numpy as np
+
+#columns that are also saved as typed arrays
+FLOAT_COLS = ["ra", "declination", "discoverymag"]
+EPOCH_COLS = ["discoverydate", "lastmodified"]
+
+#int64 value used for blank dates (same as NaT)
+NAT = np.iinfo(np.int64).min
+
+################################################################################
+
+def to_float(column):
+    """
+    Converts a column of strings into a float64 array, with blank or non-numeric entries set to NaN.
+    Arguments:
+        - column: numpy object array (or list) of strings
+    Outputs:
+        - values: numpy float64 array
+    """
+    values = np.empty(len(column),dtype=np.float64)
+    for i, entry in enumerate(column):
+        try:
+            values[i] = float(entry)
+        except ValueError: #blank or not a number
+            values[i] = np.nan
+    return values
+
+################################################################################
+
+def to_epoch(column):
+    """
+    Converts a column of TNS date strings (format '%Y-%m-%d %H:%M:%S' with optional fractions of seconds) into
+    milliseconds since the Unix epoch, with blank entries set to NAT.
+    Arguments:
+        - column: numpy object array (or list) of strings
+    Outputs:
+        - epochs: numpy int64 array
+    """
+    #numpy parses the ISO-like TNS dates in one go (blank strings become NaT)
+    epochs = np.array(list(column),dtype="datetime64[ms]")
+    return epochs.astype(np.int64)
+
+################################################################################
+
+def saveColumns(dirname,date,headers,database):
+    """
+    Saves the TNS database as a columnar binary store. The store is written to a temporary directory first
+    and then moved into place, so readers never see a half-written store.
+    Arguments:
+        - dirname: path of the directory to save the store to (usually 'tns_public_objects.cols')
+        - date: the date the TNS database was updated as a string in the format '%Y-%m-%d %H:%M:%S'
+        - headers: list of the column headers of the database
+        - database: numpy object array containg all the entries of the TNS database
+    Outputs:
+        - the store saved in the directory dirname
+    """
+
+    tmpdir = dirname.rstrip("/")+".tmp"
+    if os.path.exists(tmpdir):
+        shutil.rmtree(tmpdir)
+    os.makedirs(tmpdir)
+
+    nrows = len(database)
+
+    for k, header in enumerate(headers):
+        column = database.T[k] if nrows != 0 else []
+
+        #every column saved as a buffer of bytes and the offsets of each row in it
+        encoded = [entry.encode("utf-8") for entry in column]
+        offsets = np.zeros(nrows+1,dtype=np.int64)
+        offsets[1:] = np.cumsum([len(entry) for entry in encoded])
+        chars = np.frombuffer(b"".join(encoded),dtype=np.uint8)
+        np.save(os.path.join(tmpdir,f"{header}.offsets.npy"),offsets)
+        np.save(os.path.join(tmpdir,f"{header}.chars.npy"),chars)
+
+        #typed copies of the numerical columns
+        if header in FLOAT_COLS:
+            np.save(os.path.join(tmpdir,f"{header}.f8.npy"),to_float(column))
+        elif header in EPOCH_COLS:
+            np.save(os.path.join(tmpdir,f"{header}.i8.npy"),to_epoch(column))
+
+    meta = {"date":date, "headers":list(headers), "nrows":nrows}
+    with open(os.path.join(tmpdir,"meta.json"),"w") as fp:
+        json.dump(meta,fp,indent=4)
+
+    #swap the new store in for the old one
+    if os.path.exists(dirname):
+        olddir = dirname.rstrip("/")+".old"
+        os.replace(dirname,olddir)
+        os.replace(tmpdir,dirname)
+        shutil.rmtree(olddir)
+    else:
+        os.replace(tmpdir,dirname)
+
+################################################################################
+
+class TNSColumns:
+    """
+    Read-only view of a columnar TNS store. Columns are memory-mapped the first time they are used.
+        - date: the date the TNS database was updated as a string in the format '%Y-%m-%d %H:%M:%S'
+        - headers: list of the column headers
+        - nrows: number of entries in the database
+    """
+
+    def __init__(self,dirname):
+        self.dirname = dirname
+        with open(os.path.join(dirname,"meta.json")) as fp:
+            meta = json.load(fp)
+        self.date = meta["date"]
+        self.headers = meta["headers"]
+        self.nrows = meta["nrows"]
+        self._maps = {} #memory-mapped arrays that have already been opened
+
+    def __len__(self):
+        return self.nrows
+
+    def _array(self,fname):
+        "Memory-maps (once) and returns the array saved in fname"
+        if fname not in self._maps:
+            self._maps[fname] = np.load(os.path.join(self.dirname,fname),mmap_mode="r")
+        return self._maps[fname]
+
+    def _name(self,column):
+        "Converts a column index into its header name"
+        if isinstance(column,str):
+            return column
+        return self.headers[column]
+
+    def floats(self,column):
+        "float64 array of one of the columns in FLOAT_COLS"
+        return self._array(f"{self._name(column)}.f8.npy")
+
+    def epochs(self,column):
+        "int64 array (milliseconds since the Unix epoch) of one of the columns in EPOCH_COLS"
+        return self._array(f"{self._name(column)}.i8.npy")
+
+    def datetimes(self,column):
+        "datetime64[ms] array of one of the columns in EPOCH_COLS"
+        return np.asarray(self.epochs(column)).view("datetime64[ms]")
+
+    def strings(self,column,idx=None):
+        """
+        Decodes a column (or only the rows in idx) back into the strings from the CSV.
+        Arguments:
+            - column: the header name or index of the column
+            - idx: optional array of row indices to decode (default is every row)
+        Outputs:
+            - numpy object array of strings
+        """
+        name = self._name(column)
+        offsets = self._array(f"{name}.offsets.npy")
+        chars = self._array(f"{name}.chars.npy")
+
+        if idx is None:
+            buf = chars.tobytes() #one read of the whole column
+            starts, ends = offsets[:-1], offsets[1:]
+            strings = [buf[s:e].decode("utf-8") for s, e in zip(starts.tolist(),ends.tolist())]
+        else:
+            idx = np.asarray(idx,dtype=np.int64)
+            starts, ends = offsets[idx], offsets[idx+1]
+            strings = [chars[s:e].tobytes().decode("utf-8") for s, e in zip(starts.tolist(),ends.tolist())]
+
+        column = np.empty(len(strings),dtype="object")
+        column[:] = strings
+        return column
+
+    def take(self,idx,columns=None):
+        """
+        Builds a numpy object array, like the one loadDB gives, from only the rows in idx.
+        Arguments:
+            - idx: array of row indices
+            - columns: optional list of header names or indices to include (default is all columns)
+        Outputs:
+            - numpy object array with one row per index in idx
+        """
+        if columns is None:
+            columns = self.headers
+        return np.array([self.strings(c,idx) for c in columns],dtype="object").reshape(len(columns),len(idx)).T
+
+################################################################################
+
+def loadColumns(dirname):
+    """
+    Function to load in the TNS database from its columnar store
+    Arguments:
+        - dirname: path of the directory the store is saved in (usually 'tns_public_objects.cols')
+    Outputs:
+        - date: the date the TNS database was updated as a string in the format '%Y-%m-%d %H:%M:%S'
+        - headers: the column headers of the database as a list
+        - database: TNSColumns object giving memory-mapped access to each column
+    """
+    database = TNSColumns(dirname)
+    return database.date, database.headers, database
+
+################################################################################
+
+def exportCSV(dirname,filename):
+    """
+    Writes the columnar store back out as a CSV in the same layout as tns_public_objects.csv
+    (date on the first row, then the headers, then the entries).
+    Arguments:
+        - dirname: path of the directory the store is saved in
+        - filename: path of the CSV file to write
+    Outputs:
+        - the CSV file saved as filename
+    """
+    date, headers, database = loadColumns(dirname)
+    columns = [database.strings(h) for h in headers]
+
+    with open(filename, 'w') as file:
+        csvwriter = csv.writer(file,delimiter=",") # create a csvwriter object
+        csvwriter.writerow([date]) #add date to first row
+        csvwriter.writerow(headers) #then the headers
+        csvwriter.writerows(zip(*columns)) # write the rest of the data
+
+################################################################################
+
+if __name__ == "__main__":
+    from functions import loadDB
+
+    ### SYSTEM ARGUMENTS ###
+    parser = argparse.ArgumentParser(description = """
+    Converts the TNS database between its CSV file and its columnar binary store.
+    """)
+
+    #adding arguments to praser object
+    parser.add_argument('mode' , type = str, choices = ["build","export"], help = 'build the store from the CSV, or export the CSV from the store.')
+    parser.add_argument('csv' , type = str, help = 'Path to the TNS CSV database.')
+    parser.add_argument('store' , type = str, help = 'Path to the directory of the columnar store.')
+    args = parser.parse_args()
+
+    if args.mode == "build":
+        date, headers, database = loadDB(args.csv)
+        saveColumns(args.store,date,headers,database)
+    else:
+        exportCSV(args.store,args.csv)
@@ -0,0 +1,165 @@
+"""
+Functions for keeping the TNS database as a base snapshot plus an append-only log of the daily updates, so each
+update only writes the rows that changed rather than rewriting the whole of tns_public_objects.csv.
+
+The log is a directory (usually 'tns_delta') containing:
+    - base.csv: a snapshot of the database in the same layout as tns_public_objects.csv (date, headers, entries)
+    - log/<YYYYMMDDhhmmss>.csv: one segment per update, dated (first row) with the date of the database once it is applied,
+      holding the update's rows with the newest at the top
+Readers load the base and apply every segment newer than it in date order with upsert (an objid index), so later
+updates win for any objid. The log is compacted into a new base every COMPACT_SEGMENTS updates (or on demand).
+
+Every file is written to a temporary file first and then moved into place, and segments are only deleted once the
+base that includes them is in place, so a crash part way through an update or compaction never loses the database
+(a segment that is already in the base is skipped by its date).
+
+While the log is used tns_public_objects.csv is only rewritten when the log is compacted (see compact), so scripts
+that read the CSV directly (e.g., Follow-up/fup_funcs.py and the Filtering scripts) use a database up to
+COMPACT_SEGMENTS days old. Use load_delta (or fastslow.load_database) for the current database.
+
+Can be run as a script to start a log from the CSV database, compact it or export the merged database as a CSV.
+
+Author: George Hume
+2023
+"""
+
+### IMPORTS ###
+import os
+import csv
+import argparse
+import numpy as np
+import datetime as dt
+
+#the log is compacted into a new base once it has this many segments
+COMPACT_SEGMENTS = 7
+
+################################################################################
+
+def _write(filename, date, headers, rows):
+    "Writes rows in the layout of the TNS CSV files, to a temporary file first that is then moved into place"
+    tmpname = filename+".tmp"
+    with open(tmpname, 'w') as file:
+        csvwriter = csv.writer(file,delimiter=",") # create a csvwriter object
+        csvwriter.writerow([date]) #add date to first row
+        csvwriter.writerow(headers) #add the headers
+        csvwriter.writerows(rows) # write the rest of the data
+    os.replace(tmpname,filename)
+
+def _date(datestr):
+    "Converts the date of a database ('%Y-%m-%d %H:%M:%S') into the name of its segment ('%Y%m%d%H%M%S')"
+    return dt.datetime.strptime(datestr,'%Y-%m-%d %H:%M:%S').strftime('%Y%m%d%H%M%S')
+
+def segments(logdir):
+    """
+    Gives the segments of the log in date order.
+    Arguments:
+        - logdir: path of the log directory
+    Outputs:
+        - names: list of the paths of the segments, oldest first
+    """
+    segdir = os.path.join(logdir,"log")
+    if not os.path.exists(segdir):
+        return []
+    return [os.path.join(segdir,name) for name in sorted(os.listdir(segdir)) if name.endswith(".csv")]
+
+################################################################################
+
+def init_log(logdir, date, headers, database):
+    """
+    Starts a log with the database as its base.
+    Arguments:
+        - logdir: path of the log directory to make
+        - date: the date of the database as a string in the format '%Y-%m-%d %H:%M:%S'
+        - headers: the column headers of the database as a list
+        - database: numpy object array of the TNS database
+    """
+    os.makedirs(os.path.join(logdir,"log"),exist_ok=True)
+    _write(os.path.join(logdir,"base.csv"),date,headers,database)
+
+def append_update(logdir, date, headers, updates):
+    """
+    Adds an update to the log as a new segment (the only file written for an update).
+    Arguments:
+        - logdir: path of the log directory
+        - date: the date of the database once the update is applied, as a string in the format '%Y-%m-%d %H:%M:%S'
+        - headers: the column headers of the database as a list
+        - updates: numpy object array of the update's rows, newest at the top (several days of updates can be
+                   stacked newest first, as upsert applies them from the bottom up)
+    """
+    os.makedirs(os.path.join(logdir,"log"),exist_ok=True)
+    _write(os.path.join(logdir,"log",f"{_date(date)}.csv"),date,headers,updates)
+
+def load_delta(logdir):
+    """
+    Loads the database from the log by applying every segment newer than the base to it.
+    Arguments:
+        - logdir: path of the log directory
+    Outputs:
+        - date: the date of the database (that of the newest segment) as a string in the format '%Y-%m-%d %H:%M:%S'
+        - headers: the column headers of the database as a list
+        - database: numpy object array of the TNS database
+    """
+    from functions import loadDB, upsert
+
+    date, headers, database = loadDB(os.path.join(logdir,"base.csv"))
+
+    #segments already compacted into the base are skipped
+    updates = []
+    for name in segments(logdir):
+        segdate, dummy, rows = loadDB(name)
+        if _date(segdate) <= _date(date):
+            continue
+        date = segdate
+        if rows.size != 0:
+            updates.append(rows)
+
+    #newest segment on top, so upsert applies them in date order and later updates win
+    if len(updates) != 0:
+        database = upsert(database,np.concatenate(updates[::-1],axis=0))
+
+    return date, headers, database
+
+def compact(logdir, date = None, headers = None, database = None, csvname = None):
+    """
+    Writes the merged database as the new base and then deletes the segments it includes.
+    Arguments:
+        - logdir: path of the log directory
+        - date, headers, database: the merged database if it is already in memory (default is None - i.e., loaded
+                                   from the log with load_delta)
+        - csvname: path of the TNS CSV database to also write the merged database to, for the scripts that read it
+                   directly (default is None - i.e., not written)
+    """
+    if database is None:
+        date, headers, database = load_delta(logdir)
+
+    _write(os.path.join(logdir,"base.csv"),date,headers,database)
+    if csvname is not None:
+        _write(csvname,date,headers,database)
+
+    for name in segments(logdir):
+        if os.path.basename(name)[:-4] <= _date(date):
+            os.remove(name)
+
+################################################################################
+
+if __name__ == "__main__":
+    from functions import loadDB
+
+    ### SYSTEM ARGUMENTS ###
+    parser = argparse.ArgumentParser(description = """
+    Starts, compacts or exports the append-only log of the TNS database.
+    """)
+
+    #adding arguments to praser object
+    parser.add_argument('mode' , type = str, choices = ["init","compact","export"], help = 'init the log from the CSV, compact the log, or export the merged CSV.')
+    parser.add_argument('--log' , type = str, default = '/home/pha17gh/TNS/tns_delta', help = 'Path to the log directory.')
+    parser.add_argument('--csv' , type = str, default = '/home/pha17gh/TNS/tns_public_objects.csv', help = 'Path to the TNS CSV database.')
+    args = parser.parse_args()
+
+    if args.mode == "init":
+        init_log(args.log,*loadDB(args.csv))
+    elif args.mode == "compact":
+        compact(args.log,csvname=args.csv)
+    else:
+        date, headers, database = load_delta(args.log)
+        _write(args.csv,date,headers,database)
@@ -0,0 +1,79 @@
+"""
+Analytic approximations to the positions skyfield gives, for the "fast" visibility method. The targets' RA and Dec
+are precessed from J2000 to the mean equator and equinox of date with one rotation matrix per night (IAU 1976
+precession) and the sidereal time comes from the IAU 1982 formula for the Greenwich mean sidereal time.
+
+Nutation, aberration, light deflection and refraction are all left out. Each is at most tens of arcseconds, which
+changes the transit times by seconds and the time above a 35 degree altitude limit by well under a minute (see
+validate_fast.py for the deviations from the precise method over a random sample of the sky).
+
+Author: George Hume
+2023
+"""
+
+### IMPORTS ###
+import numpy as np
+
+#TT Julian date of J2000
+J2000 = 2451545.0
+
+################################################################################
+
+def precession_matrix(tt):
+    """
+    Rotation matrix from the mean equator and equinox of J2000 to those of date (IAU 1976 precession).
+    Arguments:
+        - tt: TT Julian date
+    Outputs:
+        - P: 3x3 numpy array
+    """
+
+    T = (tt - J2000)/36525 #Julian centuries since J2000
+    arcsec = np.pi/(180*3600)
+    zeta = (2306.2181*T + 0.30188*T**2 + 0.017998*T**3)*arcsec
+    z = (2306.2181*T + 1.09468*T**2 + 0.018203*T**3)*arcsec
+    theta = (2004.3109*T - 0.42665*T**2 - 0.041833*T**3)*arcsec
+
+    cz, sz = np.cos(zeta), np.sin(zeta)
+    cZ, sZ = np.cos(z), np.sin(z)
+    ct, st = np.cos(theta), np.sin(theta)
+
+    return np.array([[cz*ct*cZ - sz*sZ, -sz*ct*cZ - cz*sZ, -st*cZ],
+                     [cz*ct*sZ + sz*cZ, -sz*ct*sZ + cz*cZ, -st*sZ],
+                     [cz*st,            -sz*st,            ct]])
+
+def mean_of_date(ra, dec, tt):
+    """
+    Precesses J2000 positions to the mean equator and equinox of date.
+    Arguments:
+        - ra: array of right ascensions (in decimal degrees, J2000)
+        - dec: array of declinations (in decimal degrees, J2000)
+        - tt: TT Julian date to precess to (e.g., the middle of the night)
+    Outputs:
+        - ra_date: array of the right ascensions of date (in decimal hours)
+        - dec_date: array of the declinations of date (in decimal degrees)
+    """
+
+    raR = np.radians(np.asarray(ra,dtype=float))
+    decR = np.radians(np.asarray(dec,dtype=float))
+    pos = np.array([np.cos(decR)*np.cos(raR), np.cos(decR)*np.sin(raR), np.sin(decR)])
+    x, y, z = np.tensordot(precession_matrix(tt),pos,axes=1)
+
+    ra_date = (np.degrees(np.arctan2(y,x))/15) % 24
+    dec_date = np.degrees(np.arcsin(np.clip(z,-1,1)))
+    return ra_date, dec_date
+
+################################################################################
+
+def gmst(ut1):
+    """
+    Greenwich mean sidereal time (IAU 1982).
+    Arguments:
+        - ut1: UT1 Julian date (number or array)
+    Outputs:
+        - gmst: sidereal time in decimal hours
+    """
+
+    d = np.asarray(ut1,dtype=float) - J2000
+    T = d/36525
+    return (18.697374558 + 24.06570982441908*d + 0.000026*T**2) % 24
@@ -13,62 +13,175 @@ Author: George Hume
 
 ### IMPORTS ###
 import csv
+import os
+import argparse
 import numpy as np
 import datetime as dt
 from functions import *
 import pandas as pd
 
-# loads in the tns database as numpy array along with the date it was released as a string and a list of the headers
-date, headers, database = loadDB("/home/pha17gh/TNS/tns_public_objects.csv")
-#create a new list of headers for the new database (as have removed columns and added new ones)
-newHeaders = flatten([headers[0:5], [headers[12], headers[-1],headers[13], "observable_time", "lunar_sep", "priority_score", "fink_url"]])
-
-#line to go before headers to give context in CSV
-Tday = dt.datetime.combine(dt.datetime.now(), dt.datetime.min.time()) #today's data at turn of the day
-todaySTR = Tday.strftime('%Y-%m-%d %H:%M:%S')
-topline = [f"List calculated for {todaySTR} using TNS database from {date}"]
-
-
-# PEPPER FAST #
-fastDB = priority_list(database,date,False)
-
-#save out fast database CSV
-filename = "/home/pha17gh/TNS/transient_list-F.csv"
-with open(filename, 'w') as file:
-    csvwriter = csv.writer(file,delimiter=",") # create a csvwriter object
-    csvwriter.writerow(topline)
-    csvwriter.writerow(newHeaders) #add headers first row
-    csvwriter.writerows(fastDB) # write the rest of the data
-
-if fastDB.size == 0:
-    #if no transients met the requirements replace table with notice
-    file = open("/home/pha17gh/TNS/mail/transient_list-F.html", "w")
-    file.write("<p><font color=#FF0000><em> No transients met the requirements for PEPPER Fast tonight. </em></font></p><br>")
-else:
-    #save out fast database as HTML table to attach to email
-    #render dataframe as html file
-    df = pd.DataFrame(fastDB, columns = newHeaders)
-    df['fink_url'] = '<a href=' + df['fink_url'] + '><div>' + df['fink_url'] +'</div></a>' #makes fink url clickable
-    df['name'] = '<a href=' + "https://www.wis-tns.org/object/" + df['name'] + '><div>' + df['name'] +'</div></a>' #click tns name to take to website
-    html = df.to_html(escape=False, justify = "left",index = False)
-    file = open("/home/pha17gh/TNS/mail/transient_list-F.html", "w")
-    file.write(html)
-
-
-# PEPPER SLOW #
-slowDB = priority_list(database,date)
-
-if slowDB.size == 0:
-    #if no transients met the requirements for slow then they didn't for fast either
-    # so can add message explaining none met slow requirements either
-    file.write("<p><font color=#FF0000><em> No transients met the requirements for PEPPER Slow tonight. </em></font></p><br>")
-
-file.close()
-
-#save out the slow database CSV
-filename = "/home/pha17gh/TNS/transient_list-S.csv"
-with open(filename, 'w') as file:
-    csvwriter = csv.writer(file,delimiter=",") # create a csvwriter object
-    csvwriter.writerow(topline)
-    csvwriter.writerow(newHeaders) #add headers first row
-    csvwriter.writerows(slowDB) # write the rest of the data
+def load_database():
+    """
+    Loads in the tns database along with the date it was released as a string and a list of the headers
+    (only the entries in the Fast and Slow windows from the SQLite database if it has been made, then from the
+    append-only log if it has been started, then from the columnar store if it has been made, otherwise as numpy
+    array from the CSV).
+    """
+    sqlname = "/home/pha17gh/TNS/tns_public_objects.sqlite"
+    logdir = "/home/pha17gh/TNS/tns_delta"
+    storename = "/home/pha17gh/TNS/tns_public_objects.cols"
+    if os.path.exists(sqlname):
+        return window_database(sqlname)
+    elif os.path.exists(logdir):
+        return load_delta(logdir)
+    elif os.path.exists(storename):
+        return loadColumns(storename)
+    else:
+        return loadDB("/home/pha17gh/TNS/tns_public_objects.csv")
+
+def make_lists(date,headers,database,workers=1,method="batch"):
+    """
+    Creates the PEPPER Fast and Slow priority lists from the TNS database and saves them out as CSV files, along with
+    the HTML table of the Fast list for the email and tonight's twilight times for the follow-up script.
+    Arguments:
+        - date: the date the TNS database was updated as a string in the format '%Y-%m-%d %H:%M:%S'
+        - headers: the column headers of the database as a list
+        - database: numpy object array of the TNS database (or TNSColumns object of the columnar store)
+        - workers: number of processes the visibility calculation can use (default is 1 - i.e., serial)
+        - method: how the visibility is calculated, "batch" (default), "fast", "grid" or "table" (see Visibility)
+    Outputs:
+        - lists: dictionary so the next stages don't need to load anything in again, containing
+            - "Fast", "Slow": numpy object arrays of the priority lists
+            - "headers": list of the headers of the priority lists
+            - "topline": the line that goes before the headers in the CSV files
+            - "table": the HTML table of the Fast list (or notices if the lists are empty)
+            - "night": tonight's twilight times and state of the moon from night_almanac
+    """
+
+    #create a new list of headers for the new database (as have removed columns and added new ones)
+    newHeaders = flatten([headers[0:5], [headers[12], headers[-1],headers[13], "observable_time", "lunar_sep", "priority_score", "fink_url"]])
+
+    #line to go before headers to give context in CSV
+    Tday = dt.datetime.combine(dt.datetime.now(), dt.datetime.min.time()) #today's data at turn of the day
+    todaySTR = Tday.strftime('%Y-%m-%d %H:%M:%S')
+    topline = [f"List calculated for {todaySTR} using TNS database from {date}"]
+
+
+    # find the targets in the PEPPER Fast and Slow time windows in one go
+    t_mod, t_disc = DBtimes(database,date,"/home/pha17gh/TNS/tns_public_objects.times.npz")
+    windows = TNSwindows(t_mod,t_disc,date)
+
+    # visibility calculated once for the targets in either window, then both lists made from it
+    counts = {}
+    plists = priority_lists(database,date,("Fast","Slow"),windows,workers,method=method,counts=counts,
+                            cachename="/home/pha17gh/TNS/night_cache.json",gridname="/home/pha17gh/TNS/night_grid.npz",
+                            tablename="/home/pha17gh/TNS/sky_table.npz")
+
+    #number of targets removed by each threshold for the log
+    for survey, count in counts.items():
+        print(f"{survey} thresholds: {count['kept']} of {count['total']} kept, failed obs_time {count['obs_time']},"
+              f" moon_sep {count['moon_sep']}, magnitude {count['magnitude']}")
+
+    # PEPPER FAST #
+    fastDB = plists["Fast"]
+
+    #save out fast database CSV
+    filename = "/home/pha17gh/TNS/transient_list-F.csv"
+    with open(filename, 'w') as file:
+        csvwriter = csv.writer(file,delimiter=",") # create a csvwriter object
+        csvwriter.writerow(topline)
+        csvwriter.writerow(newHeaders) #add headers first row
+        csvwriter.writerows(fastDB) # write the rest of the data
+
+    with stage("html",len(fastDB)) as record:
+        if fastDB.size == 0:
+            #if no transients met the requirements replace table with notice
+            table = "<p><font color=#FF0000><em> No transients met the requirements for PEPPER Fast tonight. </em></font></p><br>"
+        else:
+            #save out fast database as HTML table to attach to email
+            #render dataframe as html file
+            df = pd.DataFrame(fastDB, columns = newHeaders)
+            df['fink_url'] = '<a href=' + df['fink_url'] + '><div>' + df['fink_url'] +'</div></a>' #makes fink url clickable
+            df['name'] = '<a href=' + "https://www.wis-tns.org/object/" + df['name'] + '><div>' + df['name'] +'</div></a>' #click tns name to take to website
+            table = df.to_html(escape=False, justify = "left",index = False)
+        record["rows_out"] = len(fastDB)
+
+
+    # PEPPER SLOW #
+    slowDB = plists["Slow"]
+
+    if slowDB.size == 0:
+        #if no transients met the requirements for slow then they didn't for fast either
+        # so can add message explaining none met slow requirements either
+        table += "<p><font color=#FF0000><em> No transients met the requirements for PEPPER Slow tonight. </em></font></p><br>"
+
+    with open("/home/pha17gh/TNS/mail/transient_list-F.html", "w") as file:
+        file.write(table)
+
+    #save out the slow database CSV
+    filename = "/home/pha17gh/TNS/transient_list-S.csv"
+    with open(filename, 'w') as file:
+        csvwriter = csv.writer(file,delimiter=",") # create a csvwriter object
+        csvwriter.writerow(topline)
+        csvwriter.writerow(newHeaders) #add headers first row
+        csvwriter.writerows(slowDB) # write the rest of the data
+
+    #save out tonight's twilight times for the follow-up script (from the night cache filled by priority_list)
+    night = night_almanac(*SITES["LT"], Tday, cachename = "/home/pha17gh/TNS/night_cache.json")
+    write_solar_times(night, "/home/pha17gh/TNS/solar_times.json")
+
+    return {"Fast":fastDB, "Slow":slowDB, "headers":newHeaders, "topline":topline, "table":table, "night":night}
+
+def make_site_lists(date,headers,database,sites):
+    """
+    Creates the PEPPER Fast and Slow priority lists for several follow-up telescopes from one run and saves them out
+    as CSV files named transient_list-F-<site>.csv and transient_list-S-<site>.csv.
+    Arguments:
+        - date: the date the TNS database was updated as a string in the format '%Y-%m-%d %H:%M:%S'
+        - headers: the column headers of the database as a list
+        - database: numpy object array of the TNS database (or TNSColumns object of the columnar store)
+        - sites: list of the names of the sites in SITES
+    Outputs:
+        - lists: dictionary keyed by site name of dictionaries with the "Fast" and "Slow" priority lists
+    """
+
+    #same headers and line before them as the LT lists
+    newHeaders = flatten([headers[0:5], [headers[12], headers[-1],headers[13], "observable_time", "lunar_sep", "priority_score", "fink_url"]])
+    Tday = dt.datetime.combine(dt.datetime.now(), dt.datetime.min.time())
+    todaySTR = Tday.strftime('%Y-%m-%d %H:%M:%S')
+
+    t_mod, t_disc = DBtimes(database,date,"/home/pha17gh/TNS/tns_public_objects.times.npz")
+    windows = TNSwindows(t_mod,t_disc,date)
+    lists = site_priority_lists(database,date,sites,("Fast","Slow"),windows,cachename="/home/pha17gh/TNS/night_cache.json")
+
+    for site, slists in lists.items():
+        for survey, letter in (("Fast","F"),("Slow","S")):
+            filename = f"/home/pha17gh/TNS/transient_list-{letter}-{site}.csv"
+            with open(filename, 'w') as file:
+                csvwriter = csv.writer(file,delimiter=",") # create a csvwriter object
+                csvwriter.writerow([f"List calculated for {todaySTR} at {site} using TNS database from {date}"])
+                csvwriter.writerow(newHeaders) #add headers first row
+                csvwriter.writerows(slists[survey]) # write the rest of the data
+
+    return lists
+
+if __name__ == "__main__":
+
+    ### SYSTEM ARGUMENTS ###
+    parser = argparse.ArgumentParser(description = """
+    Creates the PEPPER Fast and Slow priority lists from the local TNS database.
+    """)
+    parser.add_argument('--workers' , type = int, default = 1, help = 'Number of processes for the visibility calculation (default is 1).')
+    parser.add_argument('--method' , type = str, default = 'batch', choices = ['batch','fast','grid','table'], help = 'How the visibility is calculated (default is batch).')
+    parser.add_argument('--sites' , type = str, nargs = '+', default = None, help = 'Also make lists for these sites (names in SITES).')
+    parser.add_argument('--sitefile' , type = str, default = None, help = 'JSON file of extra sites to add to SITES.')
+    args = parser.parse_args()
+
+    if args.sitefile is not None:
+        load_sites(args.sitefile)
+
+    date, headers, database = load_database()
+    make_lists(date,headers,database,args.workers,args.method)
+
+    if args.sites is not None:
+        make_site_lists(date,headers,database,args.sites)
@@ -7,11 +7,24 @@ Author: George Hume
 
 ### IMPORTS ###
 import csv
+import os
+import io
+import zipfile
 import numpy as np
 import datetime as dt
 from skyfield import almanac
 from skyfield.api import N, E, wgs84, load, utc, Star
 import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from columnar import TNSColumns, loadColumns, saveColumns, to_float
+from grid import night_grid, dark_summary, altitudes
+from fastmath import mean_of_date, gmst
+from metrics import stage
+from deltalog import append_update, load_delta, compact, segments, COMPACT_SEGMENTS
+from sqlstore import meta, upsert_sql, window_database, import_database, refresh_csv
+from skymap import sky_nodes, load_table, save_table, interpolate, needs_exact, _TABLES
+from intervals import normalise, intersect, intersect_all, duration, from_samples
+from nights import night_almanac, precompute_nights, write_solar_times, ephemeris, timescale, SITES, load_sites, midday_offset, site_key
 
 ################# FUNCTIONS FOR UPDATING TNS DATABASE ##########################
 
@@ -19,14 +32,29 @@ def loadDB(filename):
     """
     Function to load in the TNS database from its CSV file
     Arguments:
-        - filename: A string representing file name of the TNS database (usually 'tns_public_objects.csv')
+        - filename: A string representing file name of the TNS database (usually 'tns_public_objects.csv'). Can also be
+                    a zip archive from the TNS (e.g., an update file), in which case the CSV inside it is decompressed
+                    straight into the parser without being written to disk
     Outputs:
         - date: the date the TNS database was updated as a string in the format '%Y-%m-%d %H:%M:%S'
         - headers: the first row of the database containing the column headers as a list
         - database: numpy object array containg all the entries of the TNS database
     """
 
-    file=open(filename)
+    if filename.endswith(".zip"):
+        with zipfile.ZipFile(filename) as archive:
+            member = [name for name in archive.namelist() if name.endswith(".csv")][0] #the CSV in the archive
+            with archive.open(member) as stream:
+                return readDB(io.TextIOWrapper(stream,encoding="utf-8"))
+
+    with open(filename) as file:
+        return readDB(file)
+
+def readDB(file):
+    """
+    Reads the date, headers and entries of the TNS database from an open CSV file (or stream) - see loadDB.
+    """
+
     csvreader = csv.reader(file) #openfile as csv
     date = next(csvreader) #save the date
     headers = next(csvreader) #save headers
@@ -42,15 +70,62 @@ def loadDB(filename):
 
 ################################################################################
 
-def DandU(udate,date,database,headers):
+def upsert(database,updates):
     """
-    This function downloads an update csv file from the TNS server and then uses it to update the local copy of the TNS database.
+    Function that applies the rows of a TNS update file to the TNS database in a single pass. Rows with an objid
+    already in the database replace that entry in place and rows with a new objid are added to the top of the
+    database (in the same order they appear in the update file) with one concatenation.
+    Arguments:
+        - database: the values of the tns database (minus the date and headers) as numpy object array.
+        - updates: the values of the update file (minus the date and headers) as numpy object array.
+    Outputs:
+        - database: numpy object array of the updated tns database.
+    """
+
+    database = database.copy() #so the array passed in isn't changed
+
+    #map each objid to the first row it is found at (only searches the objid column)
+    index = {}
+    if database.size != 0:
+        for idx, ID in enumerate(database.T[0]):
+            index.setdefault(ID,idx)
+
+    #loop from bottom to top of the updates (same as adding the newest entries to the top one at a time)
+    new_rows = [] #rows of the new IDs (in the order they would have been added to the top)
+    new_index = {} #maps new IDs to their position in new_rows
+    for i in range(len(updates)):
+        row = updates[-(i+1)] #extarcts rows from bottom upwards (index -1 -> -len)
+        ID = row[0] #get the id of the update
+
+        if ID in index: #if it is in database then we need to update the entry
+            database[index[ID]] = row
+        elif ID in new_index: #if already added from this update file then overwrite it
+            new_rows[new_index[ID]] = row
+        else: #if id is not in database then this is a new ID
+            new_index[ID] = len(new_rows)
+            new_rows.append(row)
+
+    #inserts all the new IDs at the top of the database at once (last added goes to the very top)
+    if len(new_rows) != 0:
+        new_rows = np.array(new_rows[::-1],dtype="object")
+        if database.size == 0:
+            database = new_rows
+        else:
+            database = np.concatenate((new_rows,database),axis=0)
+
+    return database
+
+################################################################################
+
+def download_update(udate,outdir="/home/pha17gh/TNS/old_updates"):
+    """
+    Downloads the zip archive of an update csv file from the TNS server. The archive is kept as it is (loadDB reads
+    the CSV straight out of it), so the old updates are saved compressed.
     Arguments:
         - udate: a string representing the date of the update from the TNS. Format is %Y%m%d.
-        - date: todays date as a datetime object.
-        - database: the values of the tns database (minus the date and headers) as numpy array.
+        - outdir: directory to save the archive in (default is '/home/pha17gh/TNS/old_updates')
     Outputs:
-        - a newly updated tns_public_objects.csv file
+        - zipname: path of the update's zip archive (a RuntimeError is raised if the download failed or isn't a zip)
     """
 
     #name of update file
@@ -58,45 +133,268 @@ def DandU(udate,date,database,headers):
 
     #string that consitutues the curl commnad for downloading
     cmd1 = '''curl -X POST -H 'user-agent: tns_marker{"tns_id":142993,"type": "bot", "name":"BillyShears"}' -d 'api_key=SECRET' '''
-    cmd2 = f" https://www.wis-tns.org/system/files/tns_public_objects/{ufile}.zip > /home/pha17gh/TNS/{ufile}.zip"
+    cmd2 = f" https://www.wis-tns.org/system/files/tns_public_objects/{ufile}.zip > {outdir}/{ufile}.zip"
     cmd = cmd1+cmd2
 
     #do the curl command to download the update file
-    subprocess.call(cmd,shell=True)
+    with stage("download"):
+        code = subprocess.call(cmd,shell=True)
 
-    #unzip the csv and delete the zip file
-    uzip = f"unzip /home/pha17gh/TNS/{ufile}.zip -d /home/pha17gh/TNS/"
-    rem = f"rm /home/pha17gh/TNS/{ufile}.zip"
-    subprocess.call(uzip,shell=True)
-    subprocess.call(rem,shell=True)
+    #a failed download (or an error page from the server) is deleted so it isn't left in old_updates
+    zipname = f"{outdir}/{ufile}.zip"
+    if (code != 0) or (not zipfile.is_zipfile(zipname)):
+        if os.path.exists(zipname):
+            os.remove(zipname)
+        raise RuntimeError(f"Update file {ufile}.zip could not be downloaded from the TNS (curl exit code {code}).")
 
-    #load in update entries (skip date and headers tho)
-    UDname = f"/home/pha17gh/TNS/{ufile}"
-    dummy1,dummy2,updates = loadDB(UDname)
+    return zipname
 
-    #now need to loop through each entry in the updates  and find match/ or add if new to the database
-    #need to loop from bottom to top so to add newest entries to the top of the database
-    for i in range(len(updates)):
-        row = updates[-(i+1)] #extarcts rows from bottom upwards (index -1 -> -len)
-        ID = row[0] #get the id of the update
-        IDrow = np.where(database == ID)[0] # looks for row corresponding to ID in the database
+def DandU(udate,date,database,headers,keep=True,logdir=None,sqlname=None):
+    """
+    This function downloads an update csv file from the TNS server and then uses it to update the local copy of the TNS database.
+    Arguments:
+        - udate: a string representing the date of the update from the TNS. Format is %Y%m%d.
+        - date: todays date as a datetime object.
+        - database: the values of the tns database (minus the date and headers) as numpy array.
+        - headers: the column headers of the database as a list.
+        - keep: if True the update's zip file is kept in old_updates, otherwise it is deleted (default is True)
+        - logdir: path of the append-only log of the database to add the update to instead of rewriting the CSV
+                  (default is None - see apply_update)
+        - sqlname: path of the SQLite database to add the update to instead of rewriting the CSV (default is None -
+                   see apply_update)
+    Outputs:
+        - a newly updated tns_public_objects.csv file (and columnar store if one has been made)
+        - datestr: the date of the updated database as a string in the format '%Y-%m-%d %H:%M:%S'
+        - headers: the column headers of the database as a list
+        - database: the updated database as a numpy object array (so it doesn't need to be loaded in again)
+    """
+
+    #download the update file, apply it and save the database
+    zipname = download_update(udate)
+    datestr, headers, database = apply_update(zipname,date,database,headers,logdir=logdir,sqlname=sqlname)
+    if not keep:
+        os.remove(zipname)
+
+    return datestr, headers, database
 
-        if IDrow.size == 0: #if id is not in database then this is a new ID
-            database = np.vstack([row,database]) #inserts new ID at the top of the database
-        else: #if it is in database then we need to update the entry
-            database[IDrow[0]] = row
+def catch_up(udates,date,database,headers,keep=True,logdir=None,sqlname=None):
+    """
+    Downloads the update csv files of several missed days from the TNS server and applies them all to the local copy
+    of the TNS database in memory, so the database is only saved once (rather than once per day with DandU).
+    Arguments:
+        - udates: list of strings of the dates of the updates (format %Y%m%d), oldest first
+        - date: the date of the updated database (the day after the last update) as a datetime object
+        - database: the values of the tns database (minus the date and headers) as numpy array
+        - headers: the column headers of the database as a list
+        - keep: if True the updates' zip files are kept in old_updates, otherwise they are deleted (default is True)
+        - logdir: path of the append-only log of the database (default is None - see apply_update)
+        - sqlname: path of the SQLite database (default is None - see apply_update)
+    Outputs:
+        - datestr, headers, database: as for DandU
+    """
 
-    database = np.vstack([headers,database]) #add the headers back to the top
+    #download every missed update file first, then merge them in date order
+    zipnames = [download_update(udate) for udate in udates]
+    datestr, headers, database = apply_update(zipnames,date,database,headers,logdir=logdir,sqlname=sqlname)
+    if not keep:
+        for zipname in zipnames:
+            os.remove(zipname)
 
-    #save out the database
-    filename = "/home/pha17gh/TNS/tns_public_objects.csv"
-    with open(filename, 'w') as file:
-        csvwriter = csv.writer(file,delimiter=",") # create a csvwriter object
-        csvwriter.writerow([date.strftime('%Y-%m-%d %H:%M:%S')]) #add date to first row
-        csvwriter.writerows(database) # write the headers and rest of the data
+    return datestr, headers, database
+
+def apply_update(UDnames,date,database,headers,outdir="/home/pha17gh/TNS",logdir=None,sqlname=None):
+    """
+    Applies update files that have already been downloaded to the TNS database and saves the updated database (the
+    part of DandU after the download, so it can also be run on its own, e.g., by the benchmarks). When there are
+    several update files, the newer files' entries win for any objid that is in more than one, exactly as if they
+    were applied one day at a time.
+    Arguments:
+        - UDnames: path of the update CSV file or zip archive (or list of paths of several, oldest first)
+        - date: the date of the updated database as a datetime object
+        - database: the values of the tns database (minus the date and headers) as numpy array
+        - headers: the column headers of the database as a list
+        - outdir: directory the database, columnar store and cached times are saved in (default is '/home/pha17gh/TNS')
+        - logdir: path of the append-only log of the database (see deltalog.py). If given only the update's rows are
+                  saved, as a new segment of the log, rather than the whole database, and the CSV is only rewritten
+                  when the log is compacted (default is None)
+        - sqlname: path of the SQLite database (see sqlstore.py). If given the updates are applied to it in one
+                   transaction instead, so the database isn't needed in memory and can be None (in which case None
+                   is returned for it too) (default is None)
+    Outputs:
+        - datestr, headers, database: as for DandU
+    """
+
+    if isinstance(UDnames,str):
+        UDnames = [UDnames]
+
+    with stage("upsert",None if database is None else len(database)) as record:
+        #load in update entries (skip date and headers tho)
+        updates = [loadDB(UDname)[2] for UDname in UDnames]
+        updates = [rows for rows in updates if rows.size != 0] #days with no updates
+
+        #newest file on top, so upsert (which goes from the bottom up) applies the days in order and later days win
+        updates = np.concatenate(updates[::-1],axis=0) if len(updates) != 0 else np.zeros((0,len(headers)),dtype="object")
+        datestr = date.strftime('%Y-%m-%d %H:%M:%S') #date of the updated database
+
+        if sqlname is not None:
+            #one transaction of UPSERTs on the objid index, which is also the save
+            upsert_sql(sqlname,datestr,updates)
+            if database is not None:
+                database = upsert(database,updates)
+            record["rows_out"] = len(updates)
+            return datestr, headers, database
+
+        if len(updates) != 0:
+            database = upsert(database,updates)
+        record["rows_out"] = len(database)
+
+    if logdir is None:
+        save_database(datestr,headers,database,outdir)
+    else:
+        #only the update is written, with the whole database saved as the new base every so often
+        with stage("save",len(updates)) as record:
+            append_update(logdir,datestr,headers,updates)
+            if len(segments(logdir)) >= COMPACT_SEGMENTS:
+                #the CSV is brought up to date at the same time for the scripts that read it directly
+                compact(logdir,datestr,headers,database,csvname=f"{outdir}/tns_public_objects.csv")
+            record["rows_out"] = len(updates)
+
+    return datestr, headers, database
+
+def save_database(datestr,headers,database,outdir="/home/pha17gh/TNS",columns=None):
+    """
+    Saves the TNS database as its CSV file and, if it is used, the columnar store. The modification and discovery
+    times are cached the first time the lists are made from this version of the database (see DBtimes), so they
+    aren't parsed here as well.
+    Arguments:
+        - datestr: the date of the database as a string in the format '%Y-%m-%d %H:%M:%S'
+        - headers: the column headers of the database as a list
+        - database: the values of the tns database (minus the date and headers) as numpy array
+        - outdir: directory to save them in (default is '/home/pha17gh/TNS')
+        - columns: if True the columnar store is saved too (default is None - i.e., only if there is already a
+                   store in outdir, made with columnar.py)
+    """
+
+    with stage("save",len(database)) as record:
+        #save out the database
+        filename = f"{outdir}/tns_public_objects.csv"
+        with open(filename, 'w') as file:
+            csvwriter = csv.writer(file,delimiter=",") # create a csvwriter object
+            csvwriter.writerow([datestr]) #add date to first row
+            csvwriter.writerow(headers) #add the headers
+            csvwriter.writerows(database) # write the rest of the data
+
+        #save out the columnar copy of the database too (if it is used, as rebuilding it doubles the time to save)
+        storename = f"{outdir}/tns_public_objects.cols"
+        if columns is None:
+            columns = os.path.exists(storename)
+        if columns:
+            saveColumns(storename,datestr,headers,database)
+        record["rows_out"] = len(database)
 
 ################# FUNCTIONS FOR CALCULATING PRIORITY SCORES ##########################
 
+#thresholds targets have to meet for each survey (see thresholds)
+THRESHOLDS = {
+    "Fast": {
+        "obs_time": 0.25, #min exp time is ~15mins so cant observe anything with obs time less than this
+        "moon_sep": [(0.25, 10), (0.65, 20), (np.inf, 40)], #dark, grey and bright sky
+        "mag_min": 16, #lower threshold
+        "mag_max": 18.5, #upper threshold
+    },
+    "Slow": {
+        "obs_time": 0.25,
+        "moon_sep": [(0.25, 10), (0.65, 20), (np.inf, 40)],
+        "mag_min": 16,
+        "mag_max": 18.5,
+    },
+}
+
+#weightings of the (observable time, lunar separation, magnitude, discovery date) ranks for each survey (see pscore)
+WEIGHTS = {
+    "Fast": [2,3,8,10], #priortise discovery date and magnitude; least obs_time
+    "Slow": [10,7,8,3], #priortise observable time and magnitude
+}
+
+################################################################################
+
+
+def DBtimes(database,date=None,cachename=None):
+    """
+    Function that gives the modification and discovery times of every entry in the TNS database as datetime64[ms]
+    arrays. The times are parsed in one go and, if cachename is given, saved next to the database so they only have
+    to be parsed once per update of the database.
+    Arguments:
+        - database: numpy object array containing the TNS database (or a TNSColumns object of the columnar store,
+                    which already has the times saved)
+        - date: the date the TNS database was updated (string with format '%Y-%m-%d %H:%M:%S'), used to check the cache is current
+        - cachename: optional path of the .npz file to cache the times in (usually 'tns_public_objects.times.npz')
+    Outputs:
+        - t_mod: datetime64[ms] array of the times each entry was last modified
+        - t_disc: datetime64[ms] array of the times each entry was discovered
+    """
+
+    #the columnar store already has the times saved as epochs
+    if isinstance(database,TNSColumns):
+        return database.datetimes(-1), database.datetimes(12)
+
+    #use the cached times if they were saved for this version of the database
+    if (cachename is not None) and os.path.exists(cachename):
+        with np.load(cachename) as cache:
+            if (str(cache["date"]) == str(date)) and (cache["t_mod"].size == len(database)):
+                return cache["t_mod"], cache["t_disc"]
+
+    #parse all the times at once (blank entries become NaT)
+    t_mod = np.array(list(database.T[-1]),dtype="datetime64[ms]")
+    t_disc = np.array(list(database.T[12]),dtype="datetime64[ms]")
+
+    if cachename is not None:
+        np.savez(cachename,date=str(date),t_mod=t_mod,t_disc=t_disc)
+
+    return t_mod, t_disc
+
+################################################################################
+
+def window_limits(date):
+    """
+    Gives the time limits of the PEPPER Fast and Slow survey windows (see TNSwindows).
+    Arguments:
+        - date: the date extracted from the top of the TNS database CSV file (string with format '%Y-%m-%d %H:%M:%S')
+    Outputs:
+        - limits: dictionary with keys "Fast" and "Slow" of the (modified after, discovered after) datetime limits
+    """
+
+    fdate = dt.datetime.strptime(date, '%Y-%m-%d %H:%M:%S') #Fast sliced from date TNS updated
+    sdate = dt.datetime.combine(dt.datetime.now(), dt.datetime.min.time()) #Slow sliced from today at midnight
+
+    return {
+        "Fast": (fdate - dt.timedelta(days=2), fdate - dt.timedelta(weeks=8)),
+        "Slow": (sdate - dt.timedelta(weeks=2), sdate - dt.timedelta(weeks=12)),
+    }
+
+def TNSwindows(t_mod,t_disc,date):
+    """
+    Function that finds the entries of the TNS database that fall in the time windows of both the PEPPER Fast
+    and Slow surveys in one pass over the modification and discovery times.
+        - Fast: modified in the last 2 days and discovered in the last 8 weeks, from the date the TNS was updated
+        - Slow: modified in the last 2 weeks and discovered in the last 12 weeks, from today at midnight
+    Arguments:
+        - t_mod: datetime64 array of the times each entry was last modified (from DBtimes)
+        - t_disc: datetime64 array of the times each entry was discovered (from DBtimes)
+        - date: the date extracted from the top of the TNS database CSV file (string with format '%Y-%m-%d %H:%M:%S')
+    Outputs:
+        - windows: dictionary with keys "Fast" and "Slow" containing the row indices of the entries in each window
+    """
+
+    windows = {}
+    for survey, (moddiff, discdiff) in window_limits(date).items():
+        mask = (t_mod > np.datetime64(moddiff,"ms")) & (t_disc > np.datetime64(discdiff,"ms"))
+        windows[survey] = np.nonzero(mask)[0]
+
+    return windows
+
+################################################################################
+
 def TNSlice(database,date):
     """
     Function that slices the TNS database so only the transients discovered in the last 3 months
@@ -109,8 +407,8 @@ def TNSlice(database,date):
     """
 
     #extract the time modified and the time discovered
-    t_mod = database.T[-1]
-    t_disc = database.T[12]
+    t_mod, t_disc = DBtimes(database)
+    t_disc = t_disc.astype("datetime64[s]") #remove fractions of secs
 
     #convert the date csv was released as datetime object
     rdate = dt.datetime.strptime(date, '%Y-%m-%d %H:%M:%S')
@@ -118,27 +416,222 @@ def TNSlice(database,date):
     fortnight = rdate - dt.timedelta(weeks=2) #2 weeks ago
     threemonths = rdate - dt.timedelta(weeks=12) #3 months ago (or 12 weeks)
 
-    good_tars = [] #empty list to save rows which pass the slicing to
+    #discovered less than 3 months ago and modified less than a fortnight ago
+    mask = (t_disc > np.datetime64(threemonths,"s")) & (t_mod > np.datetime64(fortnight,"ms"))
+    sliceDB = database[mask]
 
-    for i in range(t_mod.size):
-        #convert times to datetime objects
-        tMOD = dt.datetime.strptime(t_mod[i], '%Y-%m-%d %H:%M:%S')
-        tDISC = dt.datetime.strptime(t_disc[i][:-4], '%Y-%m-%d %H:%M:%S')
-        #slice [:-4] is to remove fractions of secs
+    return sliceDB
 
-        #if the discovery date is less than 3 months ago then can include
-        if tDISC > threemonths:
-            #if the time modified is less than a fortnight ago then can add it to new array
-            if tMOD > fortnight:
-                good_tars.append(database[i])
+################################################################################
 
-    sliceDB = np.array(good_tars,dtype=object)
+def lunar_separation(ra, dec, earth, moon, times):
+    """
+    Function that calculates the angular separation between the moon and every target at a set of times. The moon's
+    position is only found once per time (it doesn't depend on the target) and the separations are then found as one
+    (targets x times) matrix. Angular separation doesn't depend on the location on earth so is geocentric.
+    Arguments:
+        - ra: array of right ascensions of the targets (in decimal degrees)
+        - dec: array of declinations of the targets (in decimal degrees)
+        - earth, moon: skyfield ephemeris objects of the earth and moon
+        - times: skyfield time object holding the times to sample (or a list of skyfield time objects). If it is a 2D
+                 array (e.g., nights x samples) the separations are combined along the last axis
+    Outputs:
+        - lunar: dictionary of numpy arrays with one entry per target (per row of times if it is 2D)
+            - "mean", "min": the mean and minimum separation over the times (decimal degrees)
+            - "closest": the time of the closest approach out of the times sampled (TT Julian date)
+            - "seps": the separation at every time (targets x times, decimal degrees)
+    """
 
-    return sliceDB
+    ra = np.asarray(ra,dtype=float)
+    dec = np.asarray(dec,dtype=float)
+
+    #TT Julian dates of the times as an array (the last axis is the samples that are combined)
+    if isinstance(times,list):
+        tt = np.array([DT.tt for DT in times])
+        ts = times[0].ts
+    else:
+        tt = np.atleast_1d(times.tt)
+        ts = times.ts
+
+    #unit vectors of the moon at each time (one skyfield call) and the targets (ICRS)
+    mpos = earth.at(ts.tt_jd(tt.ravel())).observe(moon).position.au #shape (3, ntimes)
+    mpos = mpos/np.linalg.norm(mpos,axis=0)
+    raR, decR = np.radians(ra), np.radians(dec)
+    tpos = np.array([np.cos(decR)*np.cos(raR), np.cos(decR)*np.sin(raR), np.sin(decR)])
+
+    seps = np.degrees(np.arccos(np.clip(tpos.T @ mpos,-1,1))) #shape (ntargets, ntimes)
+    seps = seps.reshape((ra.size,)+tt.shape)
+    closest = np.argmin(seps,axis=-1)[...,None]
+    closest = np.take_along_axis(np.broadcast_to(tt,seps.shape),closest,axis=-1)[...,0]
+
+    return {"mean":seps.mean(axis=-1), "min":seps.min(axis=-1,initial=180), "closest":closest, "seps":seps}
+
+################################################################################
+
+def dark_overlap(app_ra, app_dec, lat, long, t0, gast, darkstart, darkend, alt_lim = 35):
+    """
+    Function that finds the transit time and altitude of targets from their apparent positions and the local sidereal
+    time (rather than root finding), the times they rise above and set below an altitude limit from the hour angle at
+    that altitude, and how long they are above the limit in dark time. All the arguments can be numpy arrays that
+    broadcast together, e.g., (targets x nights) or (targets x sites).
+    Arguments:
+        - app_ra: apparent right ascensions of date of the targets (in decimal hours)
+        - app_dec: apparent declinations of date of the targets (in decimal degrees)
+        - lat: the latitude of the location (in decimal degrees)
+        - long: the eastwards longitude of the location (in decimal degrees)
+        - t0: TT Julian date the transits are found after (transits are found in the 24hrs after this)
+        - gast: Greenwich apparent sidereal time at t0 (in decimal hours)
+        - darkstart, darkend: TT Julian dates of the start and end of dark time
+        - alt_lim: the lower altitude limit in decimal degrees (default is 35)
+    Outputs:
+        - trans_time, rise, sett: transit time and the times rising above/setting below alt_lim (TT Julian dates)
+        - trans_alt: altitude of the targets at transit (decimal degrees)
+        - t_obs: time the targets are above alt_lim in dark time (decimal hours)
+    """
+
+    sidereal = 1.00273790935 #sidereal hours per solar hour
+
+    #transit is when the local sidereal time equals the RA, so first transit after t0 is
+    lst0 = (gast + long/15) % 24 #local apparent sidereal time at t0 in hours
+    trans_time = t0 + ((app_ra - lst0) % 24)/sidereal/24 #TT Julian date of transit
+    trans_alt = 90 - np.abs(lat - app_dec) #altitude at transit
+
+    #hour angle when the targets are at alt_lim (same as alt2HA but for arrays)
+    altR, latR, decR = np.radians(alt_lim), np.radians(lat), np.radians(app_dec)
+    cosHA = (np.sin(altR) - np.sin(latR)*np.sin(decR))/(np.cos(latR)*np.cos(decR))
+    up = cosHA <= 1 #targets that reach alt_lim
+    HA = np.degrees(np.arccos(np.clip(cosHA,-1,1)))/15 #hour angle in sidereal hours (12 if never sets below alt_lim)
+    HA = HA/sidereal/24 #in days
+
+    rise = np.where(up,trans_time - HA,trans_time)
+    sett = np.where(up,trans_time + HA,trans_time)
+
+    #observable time is the overlap of the times above alt_lim (around the transits the day before, of and after
+    #t0, so a night with more than one window is counted fully) with dark time
+    above = altitude_intervals(trans_time, HA, up & (trans_alt >= alt_lim))
+    t_obs = observable_hours(above, darkstart, darkend, np.shape(trans_time))
+
+    return trans_time, trans_alt, rise, sett, t_obs
+
+def altitude_intervals(trans_time, HA, up):
+    """
+    The intervals targets are above an altitude limit around their transits the sidereal day before, of and after
+    trans_time (see intervals.py).
+    Arguments:
+        - trans_time: array of the TT Julian dates of the transits
+        - HA: array of the hour angles at the altitude limit (in days, half a sidereal day if always above it)
+        - up: boolean array of the targets that get above the limit
+    Outputs:
+        - starts, ends: (targets x 3) arrays of the TT Julian dates of the intervals (flattening any other dimensions
+                        of trans_time into the targets)
+    """
+    day = 1/1.00273790935 #sidereal day in days
+    trans = np.reshape(trans_time,(-1,1)) + np.array([-day,0,day])
+    HA = np.reshape(HA,(-1,1))
+    starts = np.where(np.reshape(up,(-1,1)),trans - HA,np.nan)
+    return normalise(starts,trans + HA)
+
+def observable_hours(above, darkstart, darkend, shape):
+    """
+    Total hours in the intersection of the intervals targets are above the altitude limit with dark time.
+    Arguments:
+        - above: (starts, ends) from altitude_intervals
+        - darkstart, darkend: TT Julian dates of the start and end of dark time (arrays that broadcast to shape, e.g.,
+                              one per night or site)
+        - shape: the shape of the targets' arrays to give the hours back in
+    Outputs:
+        - t_obs: array of the hours observable in dark time
+    """
+    dark = (np.broadcast_to(darkstart,shape).reshape(-1,1), np.broadcast_to(darkend,shape).reshape(-1,1))
+    return (duration(*intersect(above,dark))*24).reshape(shape)
 
 ################################################################################
 
-def Visibility(ra, dec, lat, long, elv, ephm = 'de421.bsp'):
+def batch_visibility(ra, dec, lat, long, Epos, earth, moon, t0, darkstart, darkend, darktimes, alt_lim = 35, fast = False,
+                     lunar = None):
+    """
+    Function that calculates the transit time and altitude, the rise and set times at an altitude limit, the time
+    observable in dark time, and the lunar separation of all the targets at once using array operations.
+    The apparent RA and Dec of date of every target is found with one skyfield call and the transit then follows
+    from the local sidereal time (rather than root finding for each target), with the rise/set times coming from
+    the hour angle at the altitude limit.
+    Arguments:
+        - ra: array of right ascensions of the targets (in decimal degrees)
+        - dec: array of declinations of the targets (in decimal degrees)
+        - lat: the latitude of the location (in decimal degrees)
+        - long: the eastwards longitude of the location (in decimal degrees)
+        - Epos: skyfield position of the observatory (earth + location)
+        - earth, moon: skyfield ephemeris objects of the earth and moon
+        - t0: skyfield time object of midday at the start of the night (transits are found in the 24hrs after this)
+        - darkstart, darkend: skyfield time objects of the start and end of dark time
+        - darktimes: skyfield time object (or list of them) of the times in dark time to sample the lunar separation at
+        - alt_lim: the lower altitude limit in decimal degrees (default is 35)
+        - fast: if True the positions of date are the J2000 positions precessed analytically and the sidereal time is
+                the mean sidereal time, rather than skyfield's apparent positions (see fastmath.py, default is False)
+        - lunar: the dictionary from lunar_separation for these targets and darktimes if it has already been
+                 calculated (default is None - i.e., calculated here)
+    Outputs:
+        - vis: dictionary of numpy arrays with one entry per target
+            - "trans_time", "rise", "set": transit time and the times rising above/setting below alt_lim (TT Julian dates)
+            - "trans_alt": altitude of the target at transit (decimal degrees)
+            - "t_obs": time the target is above alt_lim in dark time (decimal hours)
+            - "l_sep": mean lunar separation over darktimes, zero if t_obs is zero (decimal degrees)
+            - "l_min": minimum lunar separation over darktimes, zero if t_obs is zero (decimal degrees)
+            - "l_close": time of closest approach to the moon out of darktimes, NaN if t_obs is zero (TT Julian date)
+    """
+
+    ra = np.asarray(ra,dtype=float)
+    dec = np.asarray(dec,dtype=float)
+
+    if ra.size == 0:
+        empty = np.zeros(0)
+        return {"trans_time":empty,"trans_alt":empty,"rise":empty,"set":empty,"t_obs":empty,"l_sep":empty,
+                "l_min":empty,"l_close":empty}
+
+    midnight = t0 + dt.timedelta(hours=12)
+    if fast:
+        #mean RA and Dec of date at midnight from one precession matrix, with the mean sidereal time to match
+        app_ra, app_dec = mean_of_date(ra, dec, midnight.tt)
+        gast = gmst(t0.ut1)
+    else:
+        #apparent RA and Dec of date of all targets at midnight (one skyfield call)
+        targets = Star(ra_hours=ra/15,dec_degrees=dec)
+        app_ra, app_dec, dist = Epos.at(midnight).observe(targets).apparent().radec(epoch="date")
+        app_ra, app_dec = app_ra.hours, app_dec.degrees
+        gast = t0.gast
+
+    #transit, rise and set times and the overlap with dark time
+    trans_time, trans_alt, rise, sett, t_obs = dark_overlap(app_ra, app_dec, lat, long, t0.tt, gast,
+                                                            darkstart.tt, darkend.tt, alt_lim)
+
+    #lunar separation - moon only observed once per sample of dark time
+    if lunar is None:
+        lunar = lunar_separation(ra, dec, earth, moon, darktimes)
+    l_sep = np.where(t_obs > 0,lunar["mean"],0.0)
+    l_min = np.where(t_obs > 0,lunar["min"],0.0)
+    l_close = np.where(t_obs > 0,lunar["closest"],np.nan)
+
+    return {"trans_time":trans_time,"trans_alt":trans_alt,"rise":rise,"set":sett,"t_obs":t_obs,"l_sep":l_sep,
+            "l_min":l_min,"l_close":l_close}
+
+################################################################################
+
+#fewest targets given to each worker when Visibility is run in parallel (smaller inputs are run serially)
+PARALLEL_MIN = 200
+
+def _init_worker(ephm):
+    "Loads the ephemerides and timescale once in each worker process of the Visibility pool"
+    ephemeris(ephm)
+    timescale()
+
+def _visibility_chunk(args):
+    "Runs Visibility serially on one chunk of the targets (in a worker process)"
+    ra, dec, lat, long, elv, ephm, method, cachename, night, nsamples, details, gridname, tablename = args
+    return Visibility(ra, dec, lat, long, elv, ephm, method, cachename, night = night, nsamples = nsamples, details = details,
+                      gridname = gridname, tablename = tablename)
+
+def Visibility(ra, dec, lat, long, elv, ephm = 'de421.bsp', method = "batch", cachename = None, workers = 1, night = None,
+               nsamples = 3, details = False, gridname = None, tablename = None):
     """
     Function that calaculates the observable time, lunar separation and transit altitude
     of a list of targets given their right ascension and declination, the latitude
@@ -150,14 +643,41 @@ def Visibility(ra, dec, lat, long, elv, ephm = 'de421.bsp'):
         - long: the eastwards longitude of the location (in decimal degrees)
         - elv: the elevation of the location (in metres)
         - ephm: the path to the ephemerides file for skyfield (default is 'de421.bsp')
+        - method: "batch" to calculate all targets at once with batch_visibility (default), "fast" to do the same
+                  with the analytic positions of fastmath.py instead of skyfield's apparent positions, "grid" to use
+                  the altitudes on a grid of times through the night from night_grid (shared with the plots), "table" to interpolate
+                  from the night's sky_table (with targets near the thresholds calculated exactly), or "target" to use the
+                  original loop over each target (root finding for each transit), kept as a reference for accuracy
+        - cachename: path of the JSON night cache file the twilight times are saved in (default is None - i.e., only kept in memory)
+        - workers: number of processes to split the targets between (default is 1 - i.e., serial). The targets are only
+                   split if each process gets at least PARALLEL_MIN of them, and the results are the same as in serial
+        - night: the date the night starts on (default is None - i.e., tonight)
+        - nsamples: number of evenly spaced times in dark time the lunar separation is sampled at with the batch
+                    method (default is 3 - i.e., the start, middle and end of dark time)
+        - details: if True the dictionary from batch_visibility (which also has the minimum lunar separation and
+                   the time of closest approach, plus the airmass for the grid method) is returned as well
+                   (default is False, only for the batch, fast and grid methods)
+        - gridname: path of the .npz file the grid is saved in for the grid method (default is None - i.e., only kept in memory)
+        - tablename: path of the .npz file the sky table is saved in for the table method (default is None - i.e., only kept in memory)
     Outputs:
         - tObs: the time in hours that the target is above 35 altitude in dark time
-        - tAlt: the altitude of the target when it transits the meridian (in decimal degrees)
         - lSep: the average separation between the moon and the target during the night (in decimal degrees)
+        - mill: the fraction of the moon illuminated at midnight
+        - vis: the dictionary from batch_visibility (only if details is True)
     """
 
+    if method not in ["batch","fast","grid","table","target"]:
+        print("Visibility not calculated - variable method was not set to 'batch', 'fast', 'grid', 'table' or 'target'.")
+        exit()
+    if details and (method in ["table","target"]):
+        print("Visibility not calculated - details can only be returned by the batch, fast and grid methods.")
+        exit()
+
+    if night is None:
+        night = dt.datetime.now()
+
     #convert date to datetime object at midday
-    today = dt.datetime.combine(dt.datetime.now(), dt.datetime.min.time()) + dt.timedelta(days=0.5)
+    today = dt.datetime.combine(night, dt.datetime.min.time()) + dt.timedelta(days=0.5)
     today =today.replace(tzinfo=utc)
     tomorrow = today + dt.timedelta(days=1) #next day at midday
     tomorrow = tomorrow.replace(tzinfo=utc)
@@ -165,38 +685,96 @@ def Visibility(ra, dec, lat, long, elv, ephm = 'de421.bsp'):
 
     ### Set-up sky-field observing ##
     location = wgs84.latlon(lat * N, long * E, elevation_m = elv) #location of observatory
-    ts = load.timescale() #loads in timescale
-    eph = load(ephm)  #loads in ephemerides
+    ts = timescale() #loads in timescale (once per process)
+    eph = ephemeris(ephm)  #loads in ephemerides (once per process)
     #sets up sun, earth (needed for calculating dark time and our location respectivly) and moon (for illumination, etc.)
     earth, sun, moon = eph['earth'], eph['sun'], eph['moon']
     Epos = earth + location #sets up observing position (i.e., the postion of the follow-up telescope)
 
-    #makes time objects from today and tomorrow
-    t0 = ts.from_datetime(today)
-    t1 = ts.from_datetime(tomorrow)
+    #makes time objects from today and tomorrow (shifted into the day at the site, see midday_offset)
+    t0 = ts.from_datetime(today + midday_offset(long))
+    t1 = ts.from_datetime(tomorrow + midday_offset(long))
 
 
-    ### Find the dark time start and end ###
-    f = almanac.dark_twilight_day(eph, location)
-    times, events = almanac.find_discrete(t0, t1, f)
+    ### Find the dark time start and end (from the night cache if already calculated) ###
+    night = night_almanac(lat, long, elv, today, ephm, cachename, eph, ts)
 
-    sunset = times[0]
-    darkstart = times[3]
-    darkend = times[4]
-    sunrise = times[7] #using the indcies to extract the different times of night
+    sunset = ts.from_datetime(night["sunset"])
+    darkstart = ts.from_datetime(night["darkstart"])
+    darkend = ts.from_datetime(night["darkend"])
+    sunrise = ts.from_datetime(night["sunrise"])
 
-    #find the UTC time at the middle of the night
-    middark = ts.from_datetime(darkstart.utc_datetime()+((darkend.utc_datetime() - darkstart.utc_datetime())/2))
+    #the UTC time at the middle of the night
+    middark = ts.from_datetime(night["middark"])
     darktimes = [darkstart,middark,darkend] #list of the time at the start, middle, and end of dark time
 
-    ## calculate moon's alt, phase, and illumination ##
-    midnight = t0 + dt.timedelta(hours=12)
-    mastro = Epos.at(midnight).observe(moon)
-    mapp = mastro.apparent()
-    malt, maz, mdst = mapp.altaz()
-    mphase = almanac.moon_phase(eph, t0)
-    mill = almanac.fraction_illuminated(eph,"moon",midnight)
-    malt, mphase = malt.degrees, mphase.degrees
+    ## moon's illumination at midnight ##
+    mill = night["moon_illumination"]
+
+    ## split the targets between a pool of processes (night is already cached so workers don't recalculate it) ##
+    ra, dec = np.asarray(ra), np.asarray(dec)
+    nchunks = min(workers, ra.size // PARALLEL_MIN)
+    if nchunks > 1:
+        chunks = np.array_split(np.arange(ra.size), nchunks)
+        if method == "table":
+            #the table is calculated (and saved) once here so the workers can load it
+            sky_table(lat, long, elv, today, ephm = ephm, cachename = cachename, tablename = tablename, nsamples = nsamples)
+        if method == "grid":
+            #the grid of every target is calculated (and saved) once here, so the workers only load it and never save it
+            night_grid(ra, dec, lat, long, elv, today, ephm = ephm, cachename = cachename, gridname = gridname)
+        args = [(ra[c], dec[c], lat, long, elv, ephm, method, cachename, today, nsamples, details, gridname, tablename)
+                for c in chunks]
+        with ProcessPoolExecutor(nchunks, initializer = _init_worker, initargs = (ephm,)) as pool:
+            results = list(pool.map(_visibility_chunk, args)) #map keeps the chunks in order
+
+        tObs = np.concatenate([res[0] for res in results])
+        lSep = np.concatenate([res[1] for res in results])
+        if details:
+            vis = {key: np.concatenate([res[3][key] for res in results]) for key in results[0][3]}
+            return tObs, lSep, mill, vis
+        return tObs, lSep, mill
+
+    if method in ["batch","fast"]:
+        #calculate all the targets at once, with the lunar separation sampled evenly over dark time
+        samples = ts.tt_jd(np.linspace(darkstart.tt, darkend.tt, nsamples))
+        vis = batch_visibility(ra, dec, lat, long, Epos, earth, moon, t0, darkstart, darkend, samples,
+                               fast = (method == "fast"))
+        if details:
+            return vis["t_obs"], vis["l_sep"], mill, vis
+        return vis["t_obs"], vis["l_sep"], mill
+
+    if method == "table":
+        #interpolate from the table of the whole sky for the night
+        table = sky_table(lat, long, elv, today, ephm = ephm, cachename = cachename, tablename = tablename, nsamples = nsamples)
+        values = interpolate(table, ra, dec)
+        t_obs, l_sep = values["t_obs"], np.where(values["t_obs"] > 0,values["l_sep"],0.0)
+
+        #targets near any of the thresholds (or the edge of the observable sky) are calculated exactly
+        obs_limits = [THRESHOLDS[survey]["obs_time"] for survey in THRESHOLDS]
+        sep_limits = [sep for survey in THRESHOLDS for illum, sep in THRESHOLDS[survey]["moon_sep"]]
+        exact = needs_exact(values, obs_limits, sep_limits)
+        if np.any(exact):
+            samples = ts.tt_jd(np.linspace(darkstart.tt, darkend.tt, nsamples))
+            ra, dec = np.asarray(ra,dtype=float), np.asarray(dec,dtype=float)
+            vis = batch_visibility(ra[exact], dec[exact], lat, long, Epos, earth, moon, t0, darkstart, darkend, samples)
+            t_obs[exact], l_sep[exact] = vis["t_obs"], vis["l_sep"]
+        return t_obs, l_sep, mill
+
+    if method == "grid":
+        #time above 35 degrees in dark time and airmass from the altitude grid
+        grid = night_grid(ra, dec, lat, long, elv, today, ephm = ephm, cachename = cachename, gridname = gridname)
+        summary = dark_summary(grid, darkstart.tt, darkend.tt)
+        t_obs = summary["t_obs"]
+
+        #lunar separation as for the batch method
+        samples = ts.tt_jd(np.linspace(darkstart.tt, darkend.tt, nsamples))
+        lunar = lunar_separation(ra, dec, earth, moon, samples)
+        vis = {"t_obs":t_obs, "l_sep":np.where(t_obs > 0,lunar["mean"],0.0), "l_min":np.where(t_obs > 0,lunar["min"],0.0),
+               "l_close":np.where(t_obs > 0,lunar["closest"],np.nan), "airmass":summary["airmass"],
+               "airmass_int":summary["airmass_int"]}
+        if details:
+            return vis["t_obs"], vis["l_sep"], mill, vis
+        return vis["t_obs"], vis["l_sep"], mill
 
     ## FUNCTIONS FOR CALCULATING OBSERVABLE TIME OF TARGET ##
     def transit_time(tar,t_start,t_end):
@@ -262,8 +840,8 @@ def Visibility(ra, dec, lat, long, elv, ephm = 'de421.bsp'):
     def obs_time(dt_start,dt_end,rise_t,set_t):
         """
         Function that calculates how long a target is visible given the times dark time starts and ends, and
-        the times the target rises above and sets below a certain altitude. Note all times need to be in
-        the same timezone, idealy UTC.
+        the times the target rises above and sets below a certain altitude, as the intersection of the two
+        intervals (see intervals.py).
         Arguments:
             - dt_start: the time dark time starts as a skyfield time object.
             - dt_end: the time dark time ends as a skyfield time object.
@@ -272,49 +850,8 @@ def Visibility(ra, dec, lat, long, elv, ephm = 'de421.bsp'):
         Output:
             t_obs: the time the target is obserable in dark time, as a decimal hour (float).
         """
-
-        #convert the times into datetime objects
-        dt_start, dt_end = dt_start.utc_datetime(), dt_end.utc_datetime()
-        rise_t, set_t = rise_t.utc_datetime(), set_t.utc_datetime()
-
-        ## Now need to carry out the flow chart described above ##
-        #first check is rise_t greater than dt_start
-        if rise_t > dt_start:
-            #if true then target rises after dark time starts
-            #next check: is rise_t greater than dt_end
-            if rise_t > dt_end:
-                #if true target rises and sets after dark time, so cant observe
-                t_obs = 0
-            else:
-                #if false the target rises in dark time
-                #next check: is set_t greater than dt_end
-                if set_t > dt_end:
-                    #if true then target rises in dark time and then sets after
-                    #so observable time is end of dark time minus rise time
-                    t_obs = (dt_end - rise_t).seconds/3600 #have to divide by 3600 to get in hours
-                else:
-                    #if false then target rises and sets in dark time
-                    #so observable time is just the time it is above the certain altitude
-                    t_obs = (set_t - rise_t).seconds/3600
-        else:
-            #if false target rises before dark time
-            #next check: is set_t greater than dt_start
-            if set_t > dt_start:
-                #if true then the target sets in dark time
-                #next check: is set_t greater than dt_end
-                if set_t > dt_end:
-                    #if true then target rises before dark time and sets after it
-                    #so observable time is the length of dark time
-                    t_obs = (dt_end - dt_start).seconds/3600
-                else:
-                    #if false then target rises before dark time and sets in dark time
-                    #so observable time is the set time minus the start of dark time
-                    t_obs = (set_t - dt_start).seconds/3600
-            else:
-                #if false then target rises and sets before dark time starts, so cant observe
-                t_obs = 0
-
-        return t_obs
+        overlap = intersect(([[rise_t.tt]],[[set_t.tt]]),([[dt_start.tt]],[[dt_end.tt]]))
+        return float(duration(*overlap)[0])*24
 
     ## CALCULATING OUTPUTS ##
     #empty lists to fill
@@ -361,7 +898,7 @@ def Visibility(ra, dec, lat, long, elv, ephm = 'de421.bsp'):
                 ## Find the time target rises above 35 and then sets below 35 using the HA and transit time ##
                 rise35 = trans_time - dt.timedelta(hours=HA)
                 set35 = trans_time + dt.timedelta(hours=HA)
-                above35 = ((set35.utc_datetime()-rise35.utc_datetime()).seconds)/3600 #time above 35 degs
+                above35 = (set35.utc_datetime()-rise35.utc_datetime()).total_seconds()/3600 #time above 35 degs
 
                 #find the observable time f the target
                 t_obs = obs_time(darkstart,darkend,rise35,set35)
@@ -390,59 +927,400 @@ def Visibility(ra, dec, lat, long, elv, ephm = 'de421.bsp'):
 
 ################################################################################
 
-def thresholds(DB,mill):
+def multi_night_visibility(ra, dec, lat, long, elv, start, nnights, ephm = 'de421.bsp', cachename = None, nsamples = 3,
+                           alt_lim = 35):
+    """
+    Function that calculates the observable time and lunar separation of a list of targets for each of a run of
+    consecutive nights in one go. The twilight times of all the nights are found together (see precompute_nights),
+    the apparent positions of the targets are found with one skyfield call per night, and the rest is calculated as
+    (targets x nights) arrays in the same way as batch_visibility (so each night matches Visibility for that night).
+    Arguments:
+        - ra: list of right ascensions of the targets (in decimal degrees)
+        - dec: list of declinations of the targets (in decimal degrees)
+        - lat: the latitude of the location (in decimal degrees)
+        - long: the eastwards longitude of the location (in decimal degrees)
+        - elv: the elevation of the location (in metres)
+        - start: the date the first night starts on (datetime.date or datetime.datetime)
+        - nnights: the number of nights
+        - ephm: the path to the ephemerides file for skyfield (default is 'de421.bsp')
+        - cachename: path of the JSON night cache file the twilight times are saved in (default is None - i.e., only kept in memory)
+        - nsamples: number of evenly spaced times in dark time the lunar separation is sampled at (default is 3)
+        - alt_lim: the lower altitude limit in decimal degrees (default is 35)
+    Outputs:
+        - dates: list of the dates the nights start on ('%Y-%m-%d')
+        - tObs: (targets x nights) array of the time in hours each target is above alt_lim in dark time
+        - lSep: (targets x nights) array of the mean lunar separation during dark time (zero if tObs is zero)
+        - mill: array of the fraction of the moon illuminated at midnight of each night
+    """
+
+    if isinstance(start,dt.datetime):
+        start = start.date()
+
+    ra = np.asarray(ra,dtype=float)
+    dec = np.asarray(dec,dtype=float)
+
+    ### Set-up sky-field observing ##
+    location = wgs84.latlon(lat * N, long * E, elevation_m = elv) #location of observatory
+    ts = timescale() #loads in timescale (once per process)
+    eph = ephemeris(ephm)  #loads in ephemerides (once per process)
+    earth, moon = eph['earth'], eph['moon']
+    Epos = earth + location #sets up observing position
+
+    ### twilight times of all the nights (any not already cached are found in one search) ###
+    precompute_nights(lat, long, elv, start, nnights, ephm, cachename, eph, ts)
+    nights = [start + dt.timedelta(days=i) for i in range(nnights)]
+    almanacs = [night_almanac(lat, long, elv, night, ephm, cachename, eph, ts) for night in nights]
+    dates = [night.strftime("%Y-%m-%d") for night in nights]
+
+    #midday at the start of each night, and the start and end of dark time
+    t0 = ts.from_datetimes([dt.datetime.combine(night, dt.time(12), tzinfo=utc) + midday_offset(long) for night in nights])
+    darkstart = ts.from_datetimes([night["darkstart"] for night in almanacs]).tt
+    darkend = ts.from_datetimes([night["darkend"] for night in almanacs]).tt
+    mill = np.array([night["moon_illumination"] for night in almanacs])
+
+    if ra.size == 0:
+        empty = np.zeros((0,nnights))
+        return dates, empty, empty, mill
+
+    #apparent RA and Dec of date of all targets at midnight of each night
+    targets = Star(ra_hours=ra/15,dec_degrees=dec)
+    app_ra, app_dec = np.zeros((ra.size,nnights)), np.zeros((ra.size,nnights))
+    for i in range(nnights):
+        app = Epos.at(t0[i] + dt.timedelta(hours=12)).observe(targets).apparent().radec(epoch="date")
+        app_ra[:,i], app_dec[:,i] = app[0].hours, app[1].degrees
+
+    #transit after midday of each night and the overlap with dark time
+    tObs = dark_overlap(app_ra, app_dec, lat, long, t0.tt, t0.gast, darkstart, darkend, alt_lim)[-1]
+
+    #lunar separation sampled evenly over the dark time of every night (nights x samples)
+    samples = ts.tt_jd(np.linspace(darkstart, darkend, nsamples, axis=-1))
+    lunar = lunar_separation(ra, dec, earth, moon, samples)
+    lSep = np.where(tObs > 0,lunar["mean"],0.0)
+
+    return dates, tObs, lSep, mill
+
+################################################################################
+
+def multi_site_visibility(ra, dec, sites, ephm = 'de421.bsp', cachename = None, night = None, nsamples = 3,
+                          alt_lim = 35):
+    """
+    Function that calculates the observable time and lunar separation of a list of targets at several follow-up
+    telescopes in one go. The targets' vectors and the moon's positions (one skyfield call for the dark time samples
+    of every site) are shared between the sites, with only the apparent positions of the targets found per site.
+    The rest is calculated as (targets x sites) arrays, so each site matches Visibility for that site.
+    Arguments:
+        - ra: list of right ascensions of the targets (in decimal degrees)
+        - dec: list of declinations of the targets (in decimal degrees)
+        - sites: list of the names of sites in SITES (or a dictionary of {name: (latitude, longitude, elevation)})
+        - ephm: the path to the ephemerides file for skyfield (default is 'de421.bsp')
+        - cachename: path of the JSON night cache file the twilight times are saved in (default is None - i.e., only kept in memory)
+        - night: the date the night starts on (default is None - i.e., tonight)
+        - nsamples: number of evenly spaced times in dark time the lunar separation is sampled at (default is 3)
+        - alt_lim: the lower altitude limit in decimal degrees (default is 35)
+    Outputs:
+        - vis: dictionary keyed by site name of (tObs, lSep, mill) for that site, the same outputs as Visibility
+    """
+
+    if night is None:
+        night = dt.datetime.now()
+    if not isinstance(sites,dict):
+        sites = {name: SITES[name] for name in sites}
+
+    names = list(sites)
+    lat = np.array([sites[name][0] for name in names])
+    long = np.array([sites[name][1] for name in names])
+    ra = np.asarray(ra,dtype=float)
+    dec = np.asarray(dec,dtype=float)
+
+    #midday at the start of the night
+    today = dt.datetime.combine(night, dt.datetime.min.time()) + dt.timedelta(days=0.5)
+    today = today.replace(tzinfo=utc)
+
+    ### Set-up sky-field observing ##
+    ts = timescale() #loads in timescale (once per process)
+    eph = ephemeris(ephm)  #loads in ephemerides (once per process)
+    earth, moon = eph['earth'], eph['moon']
+
+    ### twilight times of the night at each site (from the night cache if already calculated) ###
+    almanacs = [night_almanac(*sites[name], today, ephm, cachename, eph, ts) for name in names]
+    t0 = ts.from_datetimes([today + midday_offset(lo) for lo in long])
+    darkstart = ts.from_datetimes([site["darkstart"] for site in almanacs]).tt
+    darkend = ts.from_datetimes([site["darkend"] for site in almanacs]).tt
+    mill = [site["moon_illumination"] for site in almanacs]
+
+    if ra.size == 0:
+        return {name: (np.zeros(0), np.zeros(0), mill[k]) for k, name in enumerate(names)}
+
+    #apparent RA and Dec of date of all targets at midnight at each site
+    targets = Star(ra_hours=ra/15,dec_degrees=dec)
+    app_ra, app_dec = np.zeros((ra.size,len(names))), np.zeros((ra.size,len(names)))
+    for k, name in enumerate(names):
+        location = wgs84.latlon(sites[name][0] * N, sites[name][1] * E, elevation_m = sites[name][2])
+        app = (earth + location).at(t0[k] + dt.timedelta(hours=12)).observe(targets).apparent().radec(epoch="date")
+        app_ra[:,k], app_dec[:,k] = app[0].hours, app[1].degrees
+
+    #transit, rise and set times and the overlap with dark time at every site
+    tObs = dark_overlap(app_ra, app_dec, lat, long, t0.tt, t0.gast, darkstart, darkend, alt_lim)[-1]
+
+    #lunar separation sampled evenly over the dark time at every site (sites x samples)
+    samples = ts.tt_jd(np.linspace(darkstart, darkend, nsamples, axis=-1))
+    lunar = lunar_separation(ra, dec, earth, moon, samples)
+    lSep = np.where(tObs > 0,lunar["mean"],0.0)
+
+    return {name: (tObs[:,k], lSep[:,k], mill[k]) for k, name in enumerate(names)}
+
+################################################################################
+
+def sky_table(lat, long, elv, night = None, step = 1.0, ephm = 'de421.bsp', cachename = None, tablename = None,
+              nsamples = 3):
+    """
+    Function that calculates the observable time and mean lunar separation over the whole sky for a night, on a
+    regular grid of RA and Dec (see skymap.py), so the visibility of targets can be interpolated from it. Only
+    calculated once per site, night and step (kept in memory and optionally saved to tablename).
+    Arguments:
+        - lat, long, elv: latitude, eastwards longitude (decimal degrees) and elevation (metres) of the location
+        - night: the date the night starts on (default is None - i.e., tonight)
+        - step: spacing of the grid in decimal degrees (default is 1.0)
+        - ephm: the path to the ephemerides file for skyfield (default is 'de421.bsp')
+        - cachename: path of the JSON night cache file the twilight times are saved in (default is None - i.e., only kept in memory)
+        - tablename: path of a .npz file to save the table to and load it from (default is None - i.e., only kept in memory)
+        - nsamples: number of evenly spaced times in dark time the lunar separation is sampled at (default is 3)
+    Outputs:
+        - table: dictionary with the grid "step", (RA x Dec) arrays of the observable time "t_obs" (hours) and mean
+                 lunar separation "l_sep" (degrees, not set to zero where t_obs is zero), and the moon's
+                 illumination "mill"
+    """
+
+    if night is None:
+        night = dt.datetime.now()
+
+    #midday at the start of the night
+    today = dt.datetime.combine(night, dt.datetime.min.time()) + dt.timedelta(days=0.5)
+    today = today.replace(tzinfo=utc)
+
+    key = (site_key(lat,long,elv), today.strftime("%Y-%m-%d"), float(step))
+    if key in _TABLES:
+        return _TABLES[key]
+    table = load_table(tablename,key)
+    if table is not None:
+        _TABLES[key] = table
+        return table
+
+    ### Set-up sky-field observing ##
+    location = wgs84.latlon(lat * N, long * E, elevation_m = elv) #location of observatory
+    ts = timescale() #loads in timescale (once per process)
+    eph = ephemeris(ephm)  #loads in ephemerides (once per process)
+    earth, moon = eph['earth'], eph['moon']
+    Epos = earth + location
+    t0 = ts.from_datetime(today + midday_offset(long))
+
+    nightinfo = night_almanac(lat, long, elv, today, ephm, cachename, eph, ts)
+    darkstart = ts.from_datetime(nightinfo["darkstart"])
+    darkend = ts.from_datetime(nightinfo["darkend"])
+    samples = ts.tt_jd(np.linspace(darkstart.tt, darkend.tt, nsamples))
+
+    #every node of the grid as a target
+    ra_nodes, dec_nodes = sky_nodes(step)
+    ra, dec = np.meshgrid(ra_nodes, dec_nodes, indexing="ij")
+    ra, dec = ra.ravel() % 360, dec.ravel()
+
+    #the separation is kept where t_obs is zero too, so it is calculated here once and given to batch_visibility
+    lunar = lunar_separation(ra, dec, earth, moon, samples)
+    vis = batch_visibility(ra, dec, lat, long, Epos, earth, moon, t0, darkstart, darkend, samples, lunar = lunar)
+    l_sep = lunar["mean"]
+
+    shape = (ra_nodes.size, dec_nodes.size)
+    table = {"step":float(step), "t_obs":vis["t_obs"].reshape(shape), "l_sep":l_sep.reshape(shape),
+             "mill":float(nightinfo["moon_illumination"])}
+    _TABLES[key] = table
+    save_table(tablename,key,table)
+
+    return table
+
+################################################################################
+
+def observable_windows(ra, dec, lat, long, elv, night = None, alt_lim = 35, moon_sep = None, horizon = None, step = 0.05,
+                       ephm = 'de421.bsp', cachename = None):
+    """
+    Function that finds every window in which targets are observable on a night, as the intersection of the
+    intervals each constraint is met (see intervals.py): above the altitude limit, in dark time, and optionally far
+    enough from the moon and above a horizon mask. A target can have more than one window in a night.
+    Arguments:
+        - ra: list of right ascensions of the targets (in decimal degrees)
+        - dec: list of declinations of the targets (in decimal degrees)
+        - lat, long, elv: latitude, eastwards longitude (decimal degrees) and elevation (metres) of the location
+        - night: the date the night starts on (default is None - i.e., tonight)
+        - alt_lim: the lower altitude limit in decimal degrees (default is 35)
+        - moon_sep: optional minimum lunar separation in decimal degrees (default is None - i.e., no moon constraint)
+        - horizon: optional horizon mask as a pair of arrays (azimuths east of north, minimum altitudes) in decimal
+                   degrees, interpolated between the points (default is None - i.e., no mask)
+        - step: time between the samples the moon and horizon constraints are found on in hours (default is 0.05)
+        - ephm: the path to the ephemerides file for skyfield (default is 'de421.bsp')
+        - cachename: path of the JSON night cache file the twilight times are saved in (default is None - i.e., only kept in memory)
+    Outputs:
+        - windows: dictionary with
+            - "starts", "ends": (targets x windows) arrays of the TT Julian dates of the windows (NaN for unused slots)
+            - "t_obs": array of the total time each target is observable (decimal hours)
+    """
+
+    if night is None:
+        night = dt.datetime.now()
+
+    ra = np.asarray(ra,dtype=float)
+    dec = np.asarray(dec,dtype=float)
+
+    #midday at the start of the night
+    today = dt.datetime.combine(night, dt.datetime.min.time()) + dt.timedelta(days=0.5)
+    today = today.replace(tzinfo=utc)
+
+    ### Set-up sky-field observing ##
+    location = wgs84.latlon(lat * N, long * E, elevation_m = elv) #location of observatory
+    ts = timescale() #loads in timescale (once per process)
+    eph = ephemeris(ephm)  #loads in ephemerides (once per process)
+    earth, moon = eph['earth'], eph['moon']
+    t0 = ts.from_datetime(today + midday_offset(long))
+
+    nightinfo = night_almanac(lat, long, elv, today, ephm, cachename, eph, ts)
+    darkstart = ts.from_datetime(nightinfo["darkstart"]).tt
+    darkend = ts.from_datetime(nightinfo["darkend"]).tt
+
+    if ra.size == 0:
+        return {"starts":np.zeros((0,1)), "ends":np.zeros((0,1)), "t_obs":np.zeros(0)}
+
+    #apparent RA and Dec of date of all targets at midnight (one skyfield call)
+    app_ra, app_dec, dist = (earth + location).at(t0 + dt.timedelta(hours=12)).observe(Star(ra_hours=ra/15,dec_degrees=dec)).apparent().radec(epoch="date")
+
+    #above the altitude limit and in dark time
+    trans_time, trans_alt, rise, sett, t_obs = dark_overlap(app_ra.hours, app_dec.degrees, lat, long, t0.tt, t0.gast,
+                                                            darkstart, darkend, alt_lim)
+    constraints = [altitude_intervals(trans_time, sett - trans_time, sett > rise), ([[darkstart]],[[darkend]])]
+
+    #constraints sampled through dark time
+    times = np.append(np.arange(darkstart, darkend, step/24), darkend)
+    if moon_sep is not None:
+        seps = lunar_separation(ra, dec, earth, moon, ts.tt_jd(times))["seps"]
+        constraints.append(from_samples(times, seps, moon_sep))
+    if horizon is not None:
+        alt, az = altitudes(ra, dec, lat, long, elv, times, eph, ts, azimuth = True)
+        constraints.append(from_samples(times, alt - np.interp(az, horizon[0], horizon[1], period=360), 0))
+
+    starts, ends = intersect_all(*constraints)
+
+    return {"starts":starts, "ends":ends, "t_obs":duration(starts, ends)*24}
+
+################################################################################
+
+def thresholds(DB,mill,limits=None,counts=None):
     """
     Removes targets from a database if they don't meet the thresholds of 3 different variables - observable time, lunar separation, and discovery magnitude.
+    All the cuts are done at once as boolean masks over the typed columns.
 	Arguments:
     	- DB: numpy object array of the list of targets with discovery magnitude, observable time, and lunar separation in column indices -4, -3, and -2 respectively.
     	- mill: the illumination percentage of the moon as a float
+        - limits: dictionary of the thresholds to use (default is None - i.e., THRESHOLDS["Slow"]), with keys
+            - "obs_time": minimum observable time in hours
+            - "moon_sep": list of (illumination, separation) pairs, the minimum lunar separation in degrees is taken from
+                          the first pair whose illumination the moon is below (or the last pair if there isn't one)
+            - "mag_min", "mag_max": the discovery magnitude has to be between these
+        - counts: optional dictionary that is filled with the number of targets failing each cut ("obs_time", "moon_sep" and
+                  "magnitude" - a target can fail more than one), the number going in ("total") and the number kept ("kept")
 	Output:
     	- t_array: same database as ingested but with transients removed that don't meet the thresholds set.
     """
-    #set observable time threshold (min exp time is ~15mins so cant observe
-    #anything with obs time less than this)
-    to_th = 0.25
+
+    if limits is None:
+        limits = THRESHOLDS["Slow"]
 
     #set lunar separation the threshold (depends on lunar illumination)
-    if mill < 0.25 : #dark sky
-        m_th = 10
-    elif (0.25 <= mill < 0.65): #grey sky
-        m_th = 20
-    else: #bright sky
-        m_th = 40
-
-    #set magnitude thresholds
-    ml_th = 16 #lower threshold
-    mu_th = 18.5 #upper threshold
-
-    #remove all entries which dont meet the thresholds
-    bad_idx = []
-    for idx, entry in enumerate(DB):
-        if entry[-3] <= to_th: #check the observable time of the target
-            bad_idx.append(idx)
-        elif entry[-2] < m_th: #check the lunar separation
-            bad_idx.append(idx)
-        elif (float(entry[-4]) <= ml_th) or (float(entry[-4]) >= mu_th): #check magnitudes
-            bad_idx.append(idx)
-    t_array = np.delete(DB,bad_idx,0) #deletes rows with no observable time
+    for illum, sep in limits["moon_sep"]:
+        if mill < illum:
+            m_th = sep
+            break
+    else: #the illumination is NaN or above every pair, so the last (strictest) separation is used
+        m_th = limits["moon_sep"][-1][1]
+
+    #typed columns to cut on (blank magnitudes become NaN, which fail the magnitude cut)
+    mag = to_float(DB.T[-4]) if DB.size != 0 else np.zeros(0)
+    tobs = np.array(DB.T[-3],dtype="float") if DB.size != 0 else np.zeros(0)
+    lsep = np.array(DB.T[-2],dtype="float") if DB.size != 0 else np.zeros(0)
+
+    #masks of the targets that pass each cut
+    cuts = {
+        "obs_time": tobs > limits["obs_time"], #check the observable time of the target
+        "moon_sep": lsep >= m_th, #check the lunar separation
+        "magnitude": (mag > limits["mag_min"]) & (mag < limits["mag_max"]), #check magnitudes
+    }
+    keep = cuts["obs_time"] & cuts["moon_sep"] & cuts["magnitude"]
+
+    if counts is not None:
+        counts["total"] = int(keep.size)
+        for cut, mask in cuts.items():
+            counts[cut] = int(np.sum(~mask))
+        counts["kept"] = int(np.sum(keep))
+
+    t_array = DB[keep] #only keep rows that pass all the cuts
 
     return t_array
 
 ################################################################################
 
-def pscore(database,weights,moon_per):
+def rank(values,ties="ordinal"):
+    """
+    Ranks an array of values in ascending order (0 for the lowest value) using one sort.
+    Arguments:
+        - values: numpy array of the values to rank (any type numpy can sort, e.g., floats or datetime64)
+        - ties: how equal values are ranked
+            - "ordinal": each value gets a different rank, with equal values ranked in the order they appear (default)
+            - "min": equal values all get the lowest rank of the group (e.g., 0, 1, 1, 3)
+            - "average": equal values all get the mean rank of the group (e.g., 0, 1.5, 1.5, 3)
+    Outputs:
+        - ranks: numpy float array of the rank of each value
+    """
+
+    if ties not in ["ordinal","min","average"]:
+        print("Ranks not calculated - variable ties was not set to 'ordinal', 'min' or 'average'.")
+        exit()
+
+    n = values.size
+    order = np.argsort(values,kind="stable") #stable so equal values stay in the order they appear
+    ranks = np.empty(n,dtype="float")
+
+    if (ties == "ordinal") or (n == 0):
+        ranks[order] = np.arange(n)
+        return ranks
+
+    #find the groups of equal values in the sorted array
+    svals = values[order]
+    first = np.concatenate(([True],svals[1:] != svals[:-1])) #True where a new group starts
+    group = np.cumsum(first) - 1 #group number of each sorted value
+    starts = np.nonzero(first)[0] #rank of the first value in each group
+    ends = np.concatenate((starts[1:],[n])) - 1 #rank of the last value in each group
+
+    if ties == "min":
+        ranks[order] = starts[group]
+    else: #average
+        ranks[order] = ((starts + ends)/2)[group]
+
+    return ranks
+
+################################################################################
+
+def pscore(database,weights,moon_per,ties="ordinal",limits=None,counts=None):
     """
 	Filters a database of targets by removing all those with zero observable time and then calculates the rest's priority score, which depends on the target's ranking in observable time, transit altitude, lunar separation, brightness and time since discovery. The filtered database is then saved  as a numpy array with the priority scores as the final column.
 	Arguments:
     	- database: numpy object array of the list of targets (ID first column and the observable time, and lunar separation in last 3 columns)
     	- weights: list of numbers to weight the contributions towards the priority score for the  observable time, transit altitude, and lunar separation
         - moon_per: percentage illumination of the moon used to set threshold for the lunar separation
+        - ties: how targets with equal values are ranked, "ordinal", "min" or "average" (default is "ordinal", see rank)
+        - limits: dictionary of the thresholds to use (default is None - i.e., THRESHOLDS["Slow"], see thresholds)
+        - counts: optional dictionary that is filled with the number of targets failing each threshold (see thresholds)
 	Outputs:
     	- t_targets: new numpy object array with the remaining targets and their priority scores in the final column
     """
 
     #remove all entries that don't fit within the thresholds
-    t_array = thresholds(database,moon_per)
+    t_array = thresholds(database,moon_per,limits,counts)
 
     #check the lenth of the thresholded array
     if t_array.size == 0:
@@ -450,46 +1328,23 @@ def pscore(database,weights,moon_per):
         print("none")
         return t_array
 
-    #save remaining IDs
-    IDs = t_array.T[0]
-
-    #convert strings into useable quantities
-    disc = np.array([dt.datetime.strptime(date, "%Y-%m-%d %H:%M:%S.%f") for date in t_array.T[5]])
-    #discovery dates as datetime objects
-
+    #convert strings into useable quantities (typed arrays)
+    disc = np.array(list(t_array.T[5]),dtype="datetime64[ms]") #discovery dates
     mag = np.array(t_array.T[-4],dtype="float") #magnitudes as floats
     tobs = np.array(t_array.T[-3],dtype="float") #observable time as decimal hour
     lsep = np.array(t_array.T[-2],dtype="float") #lunar separation as decimal angle
 
-    varbs = [tobs,lsep,mag,disc] #list containing the variables needed to calculate the pscores
-
-    #makes a ordered list of each variable with their ID
-    ivarbs = []
-    for varb in varbs:
-    	I = np.concatenate((np.resize(IDs,(IDs.size,1)),np.resize(varb,(varb.size,1))),axis=1)
-    	#sort the array by ascending priority score (column index = -1)
-    	I = I[I[:, -1].argsort()]
-    	ivarbs.append(I)
-
-    #calculate the pscores
-    pscores = []
-    sz = IDs.size
-    for ID in IDs:
-    	#looks for where the ID is in each of the sorted lists
-    	#then calculates its score by doing (size of the array - index)
-    	#this is so that high index IDs (i.e., higher values) get lower pscore which = higher priority
-    	scores = []
-    	scores.append(sz-np.where(ivarbs[0]==ID)[0][0])
-    	scores.append(sz-np.where(ivarbs[1]==ID)[0][0])
-    	scores.append(np.where(ivarbs[2]==ID)[0][0]) #no subtraction as we want the brightest objects (low mag)
-    	scores.append(sz-np.where(ivarbs[3]==ID)[0][0])
-
-    	#combine scores for different variables into one and apply weightings
-    	score = sum(np.array(scores)*np.array(weights))
-    	#weights applied by multiplication so some variables will contribute more to the final score
-
-    	pscores.append(score)
-    pscores = np.array(pscores,dtype=int)
+    #rank of each target (0 for the lowest value) in each variable
+    sz = tobs.size
+    ranks = np.array([rank(tobs,ties), rank(lsep,ties), rank(mag,ties), rank(disc,ties)]).T
+
+    #scores are (size of the array - rank) so that higher values get lower pscore which = higher priority
+    #except the magnitude, as we want the brightest objects (low mag)
+    scores = np.array([sz,sz,0,sz]) + np.array([-1,-1,1,-1])*ranks
+
+    #combine scores for different variables into one and apply weightings
+    #weights applied by multiplication so some variables will contribute more to the final score
+    pscores = scores @ np.array(weights,dtype="float")
 
     #normalise so scores are between 0 (high) and 5 (low)
     pscores=((pscores-np.min(pscores))/np.max(pscores-np.min(pscores)) * 5)
@@ -510,128 +1365,292 @@ def flatten(l):
 
 ################################################################################
 
-def priority_list(database,date,Slow=True):
+def fink_urls(int_names):
     """
-    Slices the TNS database to extract only the targets discovered or modififed in a certain time frame in the past. It then calculates the observable time and lunar separation of these targets which along with their discovery magnitude and date are used to calculate their priority scores.
+    Makes the fink portal urls of targets from their ZTF internal names (if they have one).
     Arguments:
-        - database: numpy array of the data from TNS database which holds one entry per line
+        - int_names: array of the internal names of the targets (comma separated if more than one)
+    Outputs:
+        - urls: numpy array of the urls (empty string if the target has no ZTF name)
+    """
+
+    #make the url by finding the ZTF name (if it exsists)
+    urls = []
+    for entry in int_names:
+
+        #check the target has ZTF internal name at all
+        if "ZTF" in entry:
+            if "," not in entry: #i.e., only internal name is ZTF name
+                url = "https://fink-portal.org/"+entry
+
+            else: #if it has multiple internal names
+                stidx = entry.index("ZTF")+3 #find index where ZTF names starts (after ZTF bit)
+
+                letter = entry[stidx] #first character of ZTF name
+                name = "ZTF"
+
+                #loop through name until get to comma which indicates it has ended
+                while (letter != ",") and (stidx < len(entry)-1):
+                    name += letter
+                    stidx +=1
+                    letter = entry[stidx]
+
+                    url = "https://fink-portal.org/"+name
+
+
+        else:
+            url = ""
+
+        urls.append(url)
+
+    return np.array(urls)
+
+################################################################################
+
+def candidates(database,date,surveys=("Fast","Slow"),windows=None):
+    """
+    Slices the targets in any of the surveys' time windows out of the TNS database, keeping only the columns needed
+    for the priority lists.
+    Arguments:
+        - database: numpy array of the TNS database (or a TNSColumns object of the columnar store, in which case only
+                    the columns needed are read)
         - date: the date extracted from the top of the TNS database CSV file (string with format YY-MM-DD HH:MM:SS)
-        - Slow: string dictating if calculating priority scores for PEPPER Fast or PEPPER Slow surveys (default is True - i.e., PEPPER Slow. Set to False for PEPPER Fast)
+        - surveys: the names of the surveys (default is ("Fast","Slow"))
+        - windows: optional dictionary of the row indices in each survey's time window from TNSwindows
+                   (default is None - i.e., found here)
     Outputs:
-        - targets: numpy array consisiting of the revelant targets and their priority scores
-            - Rows are: ['objid','name_prefix','name','ra','declination','discoverydate','lastmodified',
- 'discoverymag','observable_time','lunar_sep','priority_score']
+        - good: sorted array of the row indices of the targets in any of the windows
+        - windows: the dictionary of the row indices in each survey's time window
+        - DB: numpy object array of the targets with columns (ID, prefix, name, ra, dec, discovery date,
+              modification date, discovery magnitude, internal names)
+        - ra, dec: the right ascensions and declinations of the targets
     """
 
-    if type(Slow) != bool:
-        print("Priority score list not created - variable Slow was not set to a is boolean value.")
-        exit()
+    #find the entries in the time windows of the surveys (unless already found for this database)
+    if windows is None:
+        t_mod, t_disc = DBtimes(database)
+        windows = TNSwindows(t_mod,t_disc,date)
+    good = np.unique(np.concatenate([windows[survey] for survey in surveys])) #every target in any of the windows
+
+    #columns needed from the database (ID, prefix, name, ra, dec, discovery date, modification date,
+    #discovery magnitude, internal names)
+    cols = [0,1,2,3,4,12,-1,13,-3]
+
+    if isinstance(database,TNSColumns):
+        #columnar store - only the needed columns are decoded for the targets that passed
+        DB = database.take(good,cols)
+        ra = database.floats(3)[good] #RA and dec as floats for Visibility
+        dec = database.floats(4)[good]
     else:
-        # slice the database accordingly #
-
-        #extarct modification date and discovery date
-        t_mod = database.T[-1]
-        t_disc = database.T[12]
-
-        #set different times since modification/discovery for PEPPER Fast and Slow
-        if Slow == False:
-            rdate = dt.datetime.strptime(date, '%Y-%m-%d %H:%M:%S') #slice from date TNS updated
-            moddiff = rdate - dt.timedelta(days=2) #2 days ago
-            discdiff = rdate - dt.timedelta(weeks=8) #2 months ago (aka 8 weeks)
-        else: #i.e., slow
-            rdate = dt.datetime.combine(dt.datetime.now(), dt.datetime.min.time()) #slice from today at midnight
-            moddiff = rdate - dt.timedelta(weeks=2) #2 weeks ago
-            discdiff = rdate - dt.timedelta(weeks=12) #3 months ago (aka 12 weeks)
-
-        #slice
-        good_tars = [] #empty list to save rows which pass the slicing to
-        for i in range(len(t_mod)):
-            #convert times to datetime objects
-            tMOD = dt.datetime.strptime(t_mod[i], '%Y-%m-%d %H:%M:%S')
-            tDISC = dt.datetime.strptime(t_disc[i], '%Y-%m-%d %H:%M:%S.%f')
-            #if the modification date is less than 2days ago then can include
-            if tMOD > moddiff:
-                if tDISC > discdiff:
-                    good_tars.append(database[i])
-        DB = np.array(good_tars,dtype=object)
-
-
-        # calculate priority scores from weightings #
-
-        #variables of relevant info from sliced database
-        IDs = DB.T[0] #TNS IDs
-        prefix, name = DB.T[1], DB.T[2] #TNS name and prefix
+        DB = database[good].T[cols].T
         ra, dec = DB.T[3], DB.T[4] #RA and dec of targets
-        t_disc, t_mod = DB.T[12],DB.T[-1] #time of discovery and modification of targets
-        mags = DB.T[13] #disoovery magnitudes of targets
-        it_names = DB.T[-3] #internal names of the targets
 
-        #location of Liverpool Telescope
-        lat = 28.6468866 #latitude in degs
-        long = -17.7742491 #longitude in degs
-        elv = 2326.0 #elevation in metres
+    return good, windows, DB, ra, dec
 
+################################################################################
 
-        #calculate observable time and lunar separation of targets
-        t_obs, l_sep, l_per = Visibility(ra, dec, lat, long, elv)
+def survey_lists(DB,t_obs,l_sep,mill,good,windows,surveys,counts=None):
+    """
+    Makes the priority list of each survey from the targets sliced by candidates and their visibility.
+    Arguments:
+        - DB: numpy object array of the targets from candidates
+        - t_obs, l_sep: arrays of the observable time and lunar separation of the targets
+        - mill: the fraction of the moon illuminated at midnight
+        - good: sorted array of the row indices of the targets in the database (from candidates)
+        - windows: dictionary of the row indices in each survey's time window
+        - surveys: the names of the surveys to make lists for
+        - counts: optional dictionary that is filled with a dictionary for each survey of the number of targets
+                  failing each threshold (see thresholds)
+    Outputs:
+        - lists: dictionary keyed by survey name of numpy arrays of the targets and their priority scores
+                 (see priority_lists)
+    """
 
-        #new databse with all relevant information
-        newDB = np.array([IDs,prefix,name,ra,dec,t_disc,t_mod,mags,t_obs,l_sep,it_names]).T
+    #new databse with all relevant information
+    allDB = np.array([DB.T[0],DB.T[1],DB.T[2],DB.T[3],DB.T[4],DB.T[5],DB.T[6],DB.T[7],t_obs,l_sep,DB.T[8]]).T
 
-        #different weightings for PEPPER Fast and Slow
-        if Slow == False:
-            wghts = [2,3,8,10] #priortise discovery date and magnitude; least obs_time
-        else: #i.e., slow
-            wghts = [10,7,8,3] #priortise observable time and magnitude
+    lists = {}
+    for survey in surveys:
+        #rows of the shared arrays in this survey's window (both sorted so order is kept)
+        newDB = allDB[np.searchsorted(good,windows[survey])]
 
         #create database with pscores
-        pDB = pscore(newDB,wghts,l_per)
+        pDB = pscore(newDB,WEIGHTS[survey],mill,limits=THRESHOLDS[survey],
+                     counts=None if counts is None else counts.setdefault(survey,{}))
 
         #check pDB to see if none value
         if pDB.size == 0:
-            return pDB
-
+            lists[survey] = pDB
+            continue
 
         # urls to last column #
-        int_names = pDB.T[-2] # locally saved internal names of targets
+        urls = fink_urls(pDB.T[-2]) #from the locally saved internal names of targets
+
+        # combine together and array #
+        targets = np.delete(pDB.T,-2,0).T #remove internal name column
+        targets = np.concatenate((targets,np.resize(urls,(urls.size,1))),axis=1) #add urls to databse
+        lists[survey] = targets
 
+    return lists
 
-        #make the url by finding the ZTF name (if it exsists)
-        urls = []
-        for entry in int_names:
+################################################################################
 
-            #check the target has ZTF internal name at all
-            if "ZTF" in entry:
-                if "," not in entry: #i.e., only internal name is ZTF name
-                    url = "https://fink-portal.org/"+entry
+def priority_lists(database,date,surveys=("Fast","Slow"),windows=None,workers=1,site="LT",method="batch",counts=None,
+                   cachename=None,gridname=None,tablename=None):
+    """
+    Makes the priority lists of several surveys at once. The targets in any of the surveys' time windows are
+    sliced from the TNS database and their observable time and lunar separation calculated in one go, then each
+    survey's window, weights (WEIGHTS) and thresholds (THRESHOLDS) are applied to these shared arrays.
+    Arguments:
+        - database: numpy array of the data from TNS database which holds one entry per line (or a TNSColumns
+                    object of the columnar store, in which case only the columns needed are read)
+        - date: the date extracted from the top of the TNS database CSV file (string with format YY-MM-DD HH:MM:SS)
+        - surveys: the names of the surveys to make lists for (default is ("Fast","Slow"))
+        - windows: optional dictionary of the row indices in each survey's time window from TNSwindows
+                   (default is None - i.e., slice here)
+        - workers: number of processes Visibility can split the targets between (default is 1 - i.e., serial)
+        - site: name of the follow-up telescope in SITES (default is "LT" - the Liverpool Telescope)
+        - method: method Visibility uses, "batch" (default), "fast" for the analytic positions, "grid" to use the
+                  night's altitude grid, which is saved so the plots can use it too, or "table" to interpolate from the
+                  night's sky table
+        - counts: optional dictionary that is filled with a dictionary for each survey of the number of targets
+                  failing each threshold (see thresholds), which is also added to the metrics log
+        - cachename: path of the JSON night cache file the twilight times are saved in (default is None - i.e., only kept in memory)
+        - gridname: path of the .npz file the grid is saved in for the grid method (default is None - i.e., only kept in memory)
+        - tablename: path of the .npz file the sky table is saved in for the table method (default is None - i.e., only kept in memory)
+    Outputs:
+        - lists: dictionary keyed by survey name of numpy arrays consisiting of the revelant targets and their
+                 priority scores
+            - Rows are: ['objid','name_prefix','name','ra','declination','discoverydate','lastmodified',
+ 'discoverymag','observable_time','lunar_sep','priority_score','fink_url']
+    """
 
-                else: #if it has multiple internal names
-                    stidx = entry.index("ZTF")+3 #find index where ZTF names starts (after ZTF bit)
+    # slice the database accordingly #
+    with stage("slice",len(database)) as record:
+        good, windows, DB, ra, dec = candidates(database,date,surveys,windows)
+        record["rows_out"] = len(good)
 
-                    letter = entry[stidx] #first character of ZTF name
-                    name = "ZTF"
+    #location of the follow-up telescope
+    lat, long, elv = SITES[site]
 
-                    #loop through name until get to comma which indicates it has ended
-                    while (letter != ",") and (stidx < len(entry)-1):
-                        name += letter
-                        stidx +=1
-                        letter = entry[stidx]
+    #calculate observable time and lunar separation of all the targets once
+    with stage("visibility",len(good)) as record:
+        t_obs, l_sep, l_per = Visibility(ra, dec, lat, long, elv, method = method, cachename = cachename,
+                                         workers = workers, gridname = gridname, tablename = tablename)
+        record["rows_out"] = int(np.sum(t_obs > 0))
 
-                        url = "https://fink-portal.org/"+name
+    with stage("pscore",len(good)) as record:
+        if counts is None:
+            counts = {}
+        lists = survey_lists(DB,t_obs,l_sep,l_per,good,windows,surveys,counts)
+        record["rows_out"] = sum(len(lists[survey]) for survey in lists)
+        record["thresholds"] = counts
 
+    return lists
 
-            else:
-                url = ""
+################################################################################
 
-            urls.append(url)
+def priority_list(database,date,Slow=True,windows=None,workers=1,cachename=None,gridname=None,tablename=None):
+    """
+    Slices the TNS database to extract only the targets discovered or modififed in a certain time frame in the past. It then calculates the observable time and lunar separation of these targets which along with their discovery magnitude and date are used to calculate their priority scores.
+    Arguments:
+        - database: numpy array of the data from TNS database which holds one entry per line (or a TNSColumns
+                    object of the columnar store, in which case only the columns needed are read)
+        - date: the date extracted from the top of the TNS database CSV file (string with format YY-MM-DD HH:MM:SS)
+        - Slow: string dictating if calculating priority scores for PEPPER Fast or PEPPER Slow surveys (default is True - i.e., PEPPER Slow. Set to False for PEPPER Fast)
+        - windows: optional dictionary of the row indices in the Fast and Slow time windows from TNSwindows, so the
+                   database only has to be sliced once for both lists (default is None - i.e., slice here)
+        - workers: number of processes Visibility can split the targets between (default is 1 - i.e., serial)
+        - cachename, gridname, tablename: optional paths of the night cache, grid and sky table files (see priority_lists)
+    Outputs:
+        - targets: numpy array consisiting of the revelant targets and their priority scores
+            - Rows are: ['objid','name_prefix','name','ra','declination','discoverydate','lastmodified',
+ 'discoverymag','observable_time','lunar_sep','priority_score','fink_url']
+    """
 
-        urls = np.array(urls)
+    if type(Slow) != bool:
+        print("Priority score list not created - variable Slow was not set to a is boolean value.")
+        exit()
+    else:
+        survey = "Fast" if Slow == False else "Slow"
+        return priority_lists(database,date,(survey,),windows,workers,cachename=cachename,gridname=gridname,
+                              tablename=tablename)[survey]
 
+################################################################################
 
-        # combine together and array #
-        targets = np.delete(pDB.T,-2,0).T #remove internal name column
-        targets = np.concatenate((targets,np.resize(urls,(urls.size,1))),axis=1) #add urls to databse
+def site_priority_lists(database,date,sites,surveys=("Fast","Slow"),windows=None,cachename=None):
+    """
+    Makes the priority lists of several surveys for several follow-up telescopes from one run. The database is
+    sliced once and the visibility at every site is calculated together with multi_site_visibility.
+    Arguments:
+        - database: numpy array of the TNS database (or a TNSColumns object of the columnar store)
+        - date: the date extracted from the top of the TNS database CSV file (string with format YY-MM-DD HH:MM:SS)
+        - sites: list of the names of the sites in SITES
+        - surveys: the names of the surveys to make lists for (default is ("Fast","Slow"))
+        - windows: optional dictionary of the row indices in each survey's time window from TNSwindows
+                   (default is None - i.e., found here)
+        - cachename: path of the JSON night cache file the twilight times are saved in (default is None - i.e., only kept in memory)
+    Outputs:
+        - lists: dictionary keyed by site name of dictionaries keyed by survey name of the priority lists
+                 (see priority_lists)
+    """
+
+    good, windows, DB, ra, dec = candidates(database,date,surveys,windows)
+
+    #observable time and lunar separation of all the targets at every site
+    vis = multi_site_visibility(ra, dec, sites, cachename = cachename)
+
+    lists = {}
+    for site, (t_obs, l_sep, l_per) in vis.items():
+        lists[site] = survey_lists(DB,t_obs,l_sep,l_per,good,windows,surveys)
+
+    return lists
+
+################################################################################
+
+def plan_nights(database,date,start,nnights,surveys=("Fast","Slow"),windows=None,top=10,site="LT",cachename=None):
+    """
+    Ranks the targets of each survey for each of a run of consecutive nights (e.g., for planning a week of observing).
+    The targets in any of the surveys' windows are sliced once and their visibility on every night calculated in one
+    go with multi_night_visibility, then each night's priority scores are found with the survey's weights and thresholds.
+    Arguments:
+        - database: numpy array of the TNS database (or a TNSColumns object of the columnar store)
+        - date: the date extracted from the top of the TNS database CSV file (string with format YY-MM-DD HH:MM:SS)
+        - start: the date the first night starts on (datetime.date or datetime.datetime)
+        - nnights: the number of nights
+        - surveys: the names of the surveys to rank (default is ("Fast","Slow"))
+        - windows: optional dictionary of the row indices in each survey's time window from TNSwindows
+                   (default is None - i.e., found here)
+        - top: number of targets to keep for each survey on each night (default is 10)
+        - site: name of the follow-up telescope in SITES (default is "LT" - the Liverpool Telescope)
+        - cachename: path of the JSON night cache file the twilight times are saved in (default is None - i.e., only kept in memory)
+    Outputs:
+        - plan: numpy object array with one row per ranked target, with columns
+            ['night','survey','rank','objid','name_prefix','name','observable_time','lunar_sep','priority_score']
+    """
+
+    good, windows, DB, ra, dec = candidates(database,date,surveys,windows)
+
+    #location of the follow-up telescope
+    lat, long, elv = SITES[site]
+
+    #observable time and lunar separation of all the targets on every night (targets x nights)
+    dates, t_obs, l_sep, l_per = multi_night_visibility(ra, dec, lat, long, elv, start, nnights,
+                                                        cachename = cachename)
+
+    plan = []
+    for i, night in enumerate(dates):
+        #same columns as priority_lists, with this night's visibility
+        nightDB = np.array([DB.T[0],DB.T[1],DB.T[2],DB.T[3],DB.T[4],DB.T[5],DB.T[6],DB.T[7],
+                            t_obs[:,i],l_sep[:,i],DB.T[8]]).T
+
+        for survey in surveys:
+            newDB = nightDB[np.searchsorted(good,windows[survey])]
+            pDB = pscore(newDB,WEIGHTS[survey],l_per[i],limits=THRESHOLDS[survey])
+
+            for k, row in enumerate(pDB[:top]):
+                plan.append([night, survey, k+1, row[0], row[1], row[2], row[8], row[9], row[-1]])
 
-        return targets
+    return np.array(plan,dtype="object").reshape(len(plan),9)
 
 ################################################################################
@@ -0,0 +1,200 @@
+"""
+Functions for a grid of the altitude and airmass of targets over a night on a fixed grid of times, so the scoring
+and the plotting of the same night use one calculation rather than observing each target at each time.
+
+The apparent RA and Dec of date of all the targets are found with one skyfield call (in the middle of the night)
+and the altitudes on the whole (targets x times) grid then follow from the local sidereal time at each time.
+
+Grids are kept in memory per site, night and time step, with targets identified by their RA and Dec, so only new
+targets are added when the grid is asked for again (e.g., by visplots.py after fastslow.py). They can also be saved
+to a .npz file (usually 'night_grid.npz') so a separate process can use the same grid.
+
+Author: George Hume
+2023
+"""
+
+### IMPORTS ###
+import os
+import numpy as np
+import datetime as dt
+from skyfield.api import N, E, wgs84, Star
+from nights import night_almanac, ephemeris, timescale, site_key
+from fastmath import mean_of_date, gmst
+
+#grids already calculated in this process {(site, night, step): grid}
+_GRIDS = {}
+
+################################################################################
+
+def airmass(alt):
+    """
+    Plane-parallel airmass (secant of the zenith angle) of altitudes in degrees, infinite at or below the horizon.
+    """
+    alt = np.asarray(alt,dtype=float)
+    X = np.full(alt.shape,np.inf)
+    up = alt > 0
+    X[up] = 1/np.sin(np.radians(alt[up]))
+    return X
+
+################################################################################
+
+def altitudes(ra, dec, lat, long, elv, times, eph, ts, azimuth = False, fast = False):
+    """
+    Function that calculates the altitude of every target at every time of a grid in one go.
+    Arguments:
+        - ra: array of right ascensions of the targets (in decimal degrees)
+        - dec: array of declinations of the targets (in decimal degrees)
+        - lat, long, elv: latitude, eastwards longitude (decimal degrees) and elevation (metres) of the location
+        - times: array of the TT Julian dates of the grid
+        - eph, ts: skyfield ephemerides and timescale
+        - azimuth: if True the azimuths are returned too (default is False)
+        - fast: if True the positions of date and sidereal times are the analytic ones from fastmath.py rather than
+                skyfield's apparent positions (default is False)
+    Outputs:
+        - alt: (targets x times) array of the altitudes (decimal degrees)
+        - az: (targets x times) array of the azimuths, east of north (decimal degrees, only if azimuth is True)
+    """
+
+    ra = np.asarray(ra,dtype=float)
+    dec = np.asarray(dec,dtype=float)
+    if ra.size == 0:
+        return (np.zeros((0,times.size)), np.zeros((0,times.size))) if azimuth else np.zeros((0,times.size))
+
+    if fast:
+        #mean RA and Dec of date in the middle of the grid and the mean sidereal time
+        app_ra, app_dec = mean_of_date(ra, dec, (times[0] + times[-1])/2)
+        sidereal = gmst(ts.tt_jd(times).ut1)
+    else:
+        #apparent RA and Dec of date of all targets in the middle of the grid (one skyfield call)
+        location = wgs84.latlon(lat * N, long * E, elevation_m = elv)
+        tmid = ts.tt_jd((times[0] + times[-1])/2)
+        targets = Star(ra_hours=ra/15,dec_degrees=dec)
+        app_ra, app_dec, dist = (eph['earth'] + location).at(tmid).observe(targets).apparent().radec(epoch="date")
+        app_ra, app_dec = app_ra.hours, app_dec.degrees
+        sidereal = ts.tt_jd(times).gast
+
+    #hour angle of every target at every time from the local sidereal time
+    lst = (sidereal + long/15) % 24
+    HA = np.radians((lst[None,:] - app_ra[:,None])*15)
+
+    latR, decR = np.radians(lat), np.radians(app_dec)[:,None]
+    sinalt = np.sin(latR)*np.sin(decR) + np.cos(latR)*np.cos(decR)*np.cos(HA)
+    alt = np.degrees(np.arcsin(np.clip(sinalt,-1,1)))
+    if not azimuth:
+        return alt
+
+    az = np.degrees(np.arctan2(-np.cos(decR)*np.sin(HA), np.cos(latR)*np.sin(decR) - np.sin(latR)*np.cos(decR)*np.cos(HA)))
+    return alt, az % 360
+
+################################################################################
+
+def _load_grid(gridname,key):
+    "Loads a grid saved by _save_grid if it is for the same site, night and step"
+    if (gridname is None) or (not os.path.exists(gridname)):
+        return None
+    with np.load(gridname) as saved:
+        if (str(saved["site"]), str(saved["night"]), float(saved["step"])) != key:
+            return None
+        return {"times":saved["times"], "ra":saved["ra"], "dec":saved["dec"], "alt":saved["alt"]}
+
+def _save_grid(gridname,key,grid):
+    "Saves a grid to a .npz file (written to a temporary file of this process first then moved into place)"
+    if gridname is None:
+        return
+    tmpname = f"{gridname}.{os.getpid()}.tmp.npz"
+    np.savez(tmpname, site=key[0], night=key[1], step=key[2], **grid)
+    os.replace(tmpname,gridname)
+
+################################################################################
+
+def night_grid(ra, dec, lat, long, elv, night = None, step = 0.1, ephm = 'de421.bsp', cachename = None, gridname = None):
+    """
+    Gives the altitude and airmass of targets on a grid of times from sunset to sunrise of a night, only calculating
+    the targets that aren't already in the grid for that site, night and step.
+    Arguments:
+        - ra: array of right ascensions of the targets (in decimal degrees)
+        - dec: array of declinations of the targets (in decimal degrees)
+        - lat, long, elv: latitude, eastwards longitude (decimal degrees) and elevation (metres) of the location
+        - night: the date the night starts on (default is None - i.e., tonight)
+        - step: the time between the points of the grid in hours (default is 0.1)
+        - ephm: the path to the ephemerides file for skyfield (default is 'de421.bsp')
+        - cachename: path of the JSON night cache file the twilight times are saved in (default is None)
+        - gridname: path of a .npz file to save the grid to and load it from (default is None - i.e., only kept in memory)
+    Outputs:
+        - grid: dictionary with
+            - "times": array of the TT Julian dates of the grid
+            - "utc": list of the UTC times of the grid as datetime objects
+            - "alt": (targets x times) array of the altitudes of the targets (decimal degrees)
+            - "airmass": (targets x times) array of the airmasses of the targets (infinite below the horizon)
+            - "night": the night from night_almanac
+    """
+
+    if night is None:
+        night = dt.datetime.now()
+    if isinstance(night,dt.datetime):
+        night = night.date()
+
+    ra = np.asarray(ra,dtype=float)
+    dec = np.asarray(dec,dtype=float)
+    ts = timescale() #loads in timescale (once per process)
+    eph = ephemeris(ephm)  #loads in ephemerides (once per process)
+    nightinfo = night_almanac(lat, long, elv, night, ephm, cachename, eph, ts)
+
+    key = (site_key(lat,long,elv), night.strftime("%Y-%m-%d"), float(step))
+    if key not in _GRIDS:
+        saved = _load_grid(gridname,key)
+        if saved is None:
+            #times from sunset until sunrise
+            sunset, sunrise = ts.from_datetime(nightinfo["sunset"]).tt, ts.from_datetime(nightinfo["sunrise"]).tt
+            times = sunset + np.arange(int(np.ceil((sunrise - sunset)*24/step)))*step/24
+            saved = {"times":times, "ra":np.zeros(0), "dec":np.zeros(0), "alt":np.zeros((0,times.size))}
+        _GRIDS[key] = saved
+    grid = _GRIDS[key]
+
+    #add any targets not already in the grid
+    index = {coord: k for k, coord in enumerate(zip(grid["ra"].tolist(),grid["dec"].tolist()))}
+    new = {}
+    for k, coord in enumerate(zip(ra.tolist(),dec.tolist())):
+        if (coord not in index) and (coord not in new):
+            new[coord] = k #first row of each new coordinate
+    if len(new) != 0:
+        new = np.array(list(new.values()),dtype=int)
+        grid["alt"] = np.concatenate((grid["alt"],altitudes(ra[new],dec[new],lat,long,elv,grid["times"],eph,ts)))
+        grid["ra"] = np.concatenate((grid["ra"],ra[new]))
+        grid["dec"] = np.concatenate((grid["dec"],dec[new]))
+        _save_grid(gridname,key,grid)
+        index = {coord: k for k, coord in enumerate(zip(grid["ra"].tolist(),grid["dec"].tolist()))}
+
+    rows = np.array([index[coord] for coord in zip(ra.tolist(),dec.tolist())],dtype=int)
+    alt = grid["alt"][rows]
+    utctimes = ts.tt_jd(grid["times"]).utc_datetime() if grid["times"].size != 0 else []
+
+    return {"times":grid["times"], "utc":list(utctimes), "alt":alt, "airmass":airmass(alt), "night":nightinfo}
+
+################################################################################
+
+def dark_summary(grid, darkstart, darkend, step = 0.1, alt_lim = 35):
+    """
+    Uses a grid from night_grid to find how long each target is above an altitude limit in dark time and its airmass
+    over that time (each point of the grid counts for step hours).
+    Arguments:
+        - grid: dictionary from night_grid
+        - darkstart, darkend: TT Julian dates of the start and end of dark time
+        - step: the time between the points of the grid in hours (default is 0.1)
+        - alt_lim: the lower altitude limit in decimal degrees (default is 35)
+    Outputs:
+        - summary: dictionary of arrays with one entry per target
+            - "t_obs": time above alt_lim in dark time (decimal hours)
+            - "airmass_int": airmass integrated over that time (airmass x hours)
+            - "airmass": mean airmass over that time (NaN if the target isn't observable)
+    """
+
+    dark = (grid["times"] >= darkstart) & (grid["times"] <= darkend)
+    good = (grid["alt"] >= alt_lim) & dark[None,:]
+
+    t_obs = np.sum(good,axis=1)*step
+    X_int = np.sum(np.where(good,grid["airmass"],0),axis=1)*step
+    with np.errstate(invalid="ignore",divide="ignore"):
+        X_mean = np.where(t_obs > 0,X_int/t_obs,np.nan)
+
+    return {"t_obs":t_obs, "airmass_int":X_int, "airmass":X_mean}
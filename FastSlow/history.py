@@ -0,0 +1,266 @@
+"""
+Functions for reconstructing the TNS database as it was on any past date from a snapshot and the archive of daily
+update files kept in old_updates (e.g., to re-run the priority lists for a past night), and for finding when any
+object was changed.
+
+The history is a directory (usually 'tns_history') containing:
+    - checkpoints/<YYYYMMDD>.csv: snapshots of the database in the same layout as tns_public_objects.csv, named by
+      their date. The first is the snapshot the history starts from and a new one is saved every CHECKPOINT_EVERY
+      updates, so the database on any date is the checkpoint before it plus fewer than CHECKPOINT_EVERY updates
+    - index.npz: the objid and date of every entry of every update file (sorted by objid), so the dates an object
+      was changed are found with a binary search rather than by reading the update files
+
+The update file for the date D (tns_public_objects_D.csv, or the zip of it) holds the changes made during D, so the
+database dated D+1 is the one dated D with it applied.
+
+Can be run as a script to start the history from a snapshot, bring it up to date with the update archive, export
+the database on a date, or print the dates an object was changed.
+
+Author: George Hume
+2023
+"""
+
+### IMPORTS ###
+import os
+import csv
+import argparse
+import numpy as np
+import datetime as dt
+
+#a checkpoint is saved after this many updates
+CHECKPOINT_EVERY = 7
+
+################################################################################
+
+def archive(updir):
+    """
+    Finds the update files in the archive.
+    Arguments:
+        - updir: directory of the old update files (zips or CSVs)
+    Outputs:
+        - updates: list of (date of the update as a datetime object, path) in date order (the zip is used if there
+                   are both)
+    """
+    updates = {}
+    for name in sorted(os.listdir(updir)):
+        if not name.startswith("tns_public_objects_"):
+            continue
+        stem = name[len("tns_public_objects_"):]
+        if stem.endswith(".csv.zip") or (stem.endswith(".csv") and stem[:8] not in updates):
+            try:
+                udate = dt.datetime.strptime(stem[:8],'%Y%m%d')
+            except ValueError:
+                continue
+            updates[stem[:8]] = (udate, os.path.join(updir,name))
+    return [updates[key] for key in sorted(updates)]
+
+def checkpoints(histdir):
+    """
+    Finds the checkpoints of the history.
+    Arguments:
+        - histdir: path of the history directory
+    Outputs:
+        - names: list of (date of the checkpoint as a datetime object, path) in date order
+    """
+    ckdir = os.path.join(histdir,"checkpoints")
+    if not os.path.exists(ckdir):
+        return []
+    return [(dt.datetime.strptime(name[:8],'%Y%m%d'), os.path.join(ckdir,name))
+            for name in sorted(os.listdir(ckdir)) if name.endswith(".csv")]
+
+def _save_checkpoint(histdir, date, headers, database):
+    "Saves a checkpoint (to a temporary file first that is then moved into place)"
+    ckdir = os.path.join(histdir,"checkpoints")
+    os.makedirs(ckdir,exist_ok=True)
+    filename = os.path.join(ckdir,f"{date.strftime('%Y%m%d')}.csv")
+    with open(filename+".tmp", 'w') as file:
+        csvwriter = csv.writer(file,delimiter=",") # create a csvwriter object
+        csvwriter.writerow([date.strftime('%Y-%m-%d %H:%M:%S')]) #add date to first row
+        csvwriter.writerow(headers) #add the headers
+        csvwriter.writerows(database) # write the rest of the data
+    os.replace(filename+".tmp",filename)
+
+################################################################################
+
+def _apply(database, names):
+    "Applies update files (oldest first) to a database in one upsert, the later files winning"
+    from functions import loadDB, upsert
+    updates = [loadDB(name)[2] for name in names]
+    updates = [rows for rows in updates if rows.size != 0]
+    if len(updates) == 0:
+        return database
+    return upsert(database,np.concatenate(updates[::-1],axis=0))
+
+def init_history(histdir, snapshot):
+    """
+    Starts the history from a snapshot of the database (the earliest date that can be reconstructed).
+    Arguments:
+        - histdir: path of the history directory to make
+        - snapshot: path of the TNS database CSV (or zip) to start from
+    """
+    from functions import loadDB
+    datestr, headers, database = loadDB(snapshot)
+    date = dt.datetime.strptime(datestr,'%Y-%m-%d %H:%M:%S')
+    _save_checkpoint(histdir, dt.datetime.combine(date, dt.datetime.min.time()), headers, database)
+
+def update_history(histdir, updir = "/home/pha17gh/TNS/old_updates", every = CHECKPOINT_EVERY):
+    """
+    Brings the history up to date with the update archive, saving a checkpoint every few updates and adding the
+    objids of every new update file to the index. Only the updates since the last checkpoint are read.
+    Arguments:
+        - histdir: path of the history directory (started with init_history)
+        - updir: directory of the old update files (default is '/home/pha17gh/TNS/old_updates')
+        - every: number of updates between checkpoints (default is CHECKPOINT_EVERY)
+    """
+    from functions import loadDB
+
+    if len(checkpoints(histdir)) == 0:
+        print(f"History not updated - no checkpoints in {histdir} (start it with init first).")
+        return
+
+    ### index of which objids are in which update files ###
+    indexname = os.path.join(histdir,"index.npz")
+    if os.path.exists(indexname):
+        with np.load(indexname) as saved:
+            objids, dates, indexed = saved["objids"], saved["dates"], set(saved["indexed"].tolist())
+    else:
+        objids, dates, indexed = np.zeros(0,dtype=np.int64), np.zeros(0,dtype=np.int32), set()
+
+    updates = archive(updir)
+    new_ids, new_dates = [objids], [dates]
+    for udate, name in updates:
+        key = int(udate.strftime('%Y%m%d'))
+        if key in indexed:
+            continue
+        rows = loadDB(name)[2]
+        ids = np.array(list(rows.T[0]),dtype=np.int64) if rows.size != 0 else np.zeros(0,dtype=np.int64)
+        new_ids.append(ids)
+        new_dates.append(np.full(ids.size,key,dtype=np.int32))
+        indexed.add(key)
+
+    objids, dates = np.concatenate(new_ids), np.concatenate(new_dates)
+    order = np.lexsort((dates,objids)) #by objid then date
+    np.savez(indexname+".tmp.npz", objids=objids[order], dates=dates[order], indexed=np.array(sorted(indexed),dtype=np.int32))
+    os.replace(indexname+".tmp.npz",indexname)
+
+    ### checkpoints ###
+    ckdate, ckname = checkpoints(histdir)[-1]
+    pending = [(udate, name) for udate, name in updates if udate >= ckdate] #updates after the last checkpoint
+    if len(pending) < every:
+        return
+
+    datestr, headers, database = loadDB(ckname)
+    for k in range(0, len(pending) - every + 1, every):
+        chunk = pending[k:k+every]
+        database = _apply(database, [name for udate, name in chunk])
+        _save_checkpoint(histdir, chunk[-1][0] + dt.timedelta(days=1), headers, database)
+
+################################################################################
+
+def database_on(date, histdir, updir = "/home/pha17gh/TNS/old_updates"):
+    """
+    Reconstructs the TNS database as it was on a date, from the latest checkpoint on or before it and the updates
+    made between the checkpoint and the date.
+    Arguments:
+        - date: the date as a datetime object (the database is the one dated at the start of that day)
+        - histdir: path of the history directory
+        - updir: directory of the old update files (default is '/home/pha17gh/TNS/old_updates')
+    Outputs:
+        - datestr: the date of the database as a string in the format '%Y-%m-%d %H:%M:%S'
+        - headers: the column headers of the database as a list
+        - database: numpy object array of the TNS database on that date
+    """
+    from functions import loadDB
+
+    date = dt.datetime.combine(date, dt.datetime.min.time())
+    earlier = [(ckdate, name) for ckdate, name in checkpoints(histdir) if ckdate <= date]
+    if len(earlier) == 0:
+        print(f"Database not reconstructed - the history starts after {date.strftime('%Y-%m-%d')}.")
+        exit()
+    ckdate, ckname = earlier[-1]
+
+    #the updates made from the checkpoint's date until the day before the date
+    names = [name for udate, name in archive(updir) if ckdate <= udate < date]
+    missing = (date - ckdate).days - len(names)
+    if missing != 0:
+        print(f"Warning: {missing} update files between {ckdate.strftime('%Y-%m-%d')} and {date.strftime('%Y-%m-%d')} are missing from the archive.")
+
+    datestr, headers, database = loadDB(ckname)
+    database = _apply(database, names)
+    return date.strftime('%Y-%m-%d %H:%M:%S'), headers, database
+
+def object_history(objid, histdir):
+    """
+    The dates an object was changed on (from the index, so no update files are read).
+    Arguments:
+        - objid: the TNS objid of the object
+        - histdir: path of the history directory
+    Outputs:
+        - dates: list of the dates of the update files the object is in, as datetime objects
+    """
+    with np.load(os.path.join(histdir,"index.npz")) as saved:
+        objids, dates = saved["objids"], saved["dates"]
+    lo, hi = np.searchsorted(objids,int(objid),"left"), np.searchsorted(objids,int(objid),"right")
+    return [dt.datetime.strptime(str(d),'%Y%m%d') for d in dates[lo:hi]]
+
+def object_versions(objid, histdir, updir = "/home/pha17gh/TNS/old_updates"):
+    """
+    Every version of an object's entry from the update files, only reading the files it is in.
+    Arguments:
+        - objid: the TNS objid of the object
+        - histdir: path of the history directory
+        - updir: directory of the old update files (default is '/home/pha17gh/TNS/old_updates')
+    Outputs:
+        - versions: list of (date of the update as a datetime object, row as a numpy object array)
+    """
+    from functions import loadDB
+    names = dict(archive(updir))
+    versions = []
+    for udate in object_history(objid, histdir):
+        rows = loadDB(names[udate])[2]
+        for row in rows[rows.T[0] == str(objid)]: #upsert goes from the bottom up, so the first of any repeats is applied last
+            versions.append((udate, row))
+            break
+    return versions
+
+################################################################################
+
+if __name__ == "__main__":
+
+    ### SYSTEM ARGUMENTS ###
+    parser = argparse.ArgumentParser(description = """
+    Reconstructs the TNS database on past dates from a snapshot and the archive of daily updates.
+    """)
+
+    #adding arguments to praser object
+    parser.add_argument('mode' , type = str, choices = ["init","update","on","object"], help = 'init the history from a snapshot, update it with the archive, export the database on a date, or list the dates an object changed.')
+    parser.add_argument('value' , type = str, nargs = '?', default = None, help = 'The snapshot for init, the date (YYYY-MM-DD) for on, or the objid for object.')
+    parser.add_argument('--history' , type = str, default = '/home/pha17gh/TNS/tns_history', help = 'Path to the history directory.')
+    parser.add_argument('--updates' , type = str, default = '/home/pha17gh/TNS/old_updates', help = 'Directory of the old update files.')
+    parser.add_argument('--out' , type = str, default = None, help = 'Path of the CSV to export the database to for on (default is tns_public_objects_on_YYYYMMDD.csv).')
+    args = parser.parse_args()
+
+    if (args.mode != "update") and (args.value is None):
+        print(f"History not used - {args.mode} needs a value.")
+        exit()
+
+    if args.mode == "init":
+        init_history(args.history, args.value)
+        update_history(args.history, args.updates)
+
+    elif args.mode == "update":
+        update_history(args.history, args.updates)
+
+    elif args.mode == "on":
+        date = dt.datetime.strptime(args.value,"%Y-%m-%d")
+        datestr, headers, database = database_on(date, args.history, args.updates)
+        out = args.out if args.out is not None else f"tns_public_objects_on_{date.strftime('%Y%m%d')}.csv"
+        with open(out, 'w') as file:
+            csvwriter = csv.writer(file,delimiter=",") # create a csvwriter object
+            csvwriter.writerow([datestr]) #add date to first row
+            csvwriter.writerow(headers) #add the headers
+            csvwriter.writerows(database) # write the rest of the data
+
+    else:
+        for udate in object_history(args.value, args.history):
+            print(udate.strftime('%Y-%m-%d'))
@@ -0,0 +1,146 @@
+"""
+Functions for interval algebra over many targets at once, used to find when targets are observable by intersecting
+the times each constraint is met (e.g., above the altitude limit, in dark time, far enough from the moon, above the
+horizon mask).
+
+A set of intervals for N targets is a pair of (N x K) arrays of start and end times, where each row holds the
+intervals of one target sorted by start time and unused slots are NaN. Arrays with one row apply to every target
+(e.g., dark time). Times can be in any units, but TT Julian dates are used in functions.py.
+
+Author: George Hume
+2023
+"""
+
+### IMPORTS ###
+import numpy as np
+
+################################################################################
+
+def normalise(starts, ends):
+    """
+    Sorts the intervals of each target, merges any that overlap or touch and removes empty ones, so each row holds
+    disjoint intervals in time order with the NaN slots at the end.
+    Arguments:
+        - starts, ends: (N x K) arrays of the start and end times of the intervals (NaN for unused slots)
+    Outputs:
+        - starts, ends: (N x M) arrays of the merged intervals, where M is the most intervals any target has
+    """
+
+    starts = np.atleast_2d(np.asarray(starts,dtype=float))
+    ends = np.atleast_2d(np.asarray(ends,dtype=float))
+    starts, ends = np.broadcast_arrays(starts, ends)
+    nrows, ncols = starts.shape
+    if ncols == 0:
+        return np.full((nrows,1),np.nan), np.full((nrows,1),np.nan)
+
+    #empty intervals are removed, then sort by start time (NaNs sort last)
+    empty = ~(ends > starts)
+    starts, ends = np.where(empty,np.nan,starts), np.where(empty,np.nan,ends)
+    order = np.argsort(starts,axis=1)
+    starts, ends = np.take_along_axis(starts,order,axis=1), np.take_along_axis(ends,order,axis=1)
+
+    #merge along each row one column at a time (all the rows at once)
+    out_s, out_e = np.full((nrows,ncols),np.nan), np.full((nrows,ncols),np.nan)
+    pos = np.zeros(nrows,dtype=int) #next free slot of each row
+    cur_s, cur_e = starts[:,0].copy(), ends[:,0].copy() #interval being built for each row
+    rows = np.arange(nrows)
+    for j in range(1,ncols):
+        s, e = starts[:,j], ends[:,j]
+        valid = ~np.isnan(s)
+        overlap = valid & (s <= cur_e)
+        cur_e = np.where(overlap,np.fmax(cur_e,e),cur_e)
+
+        #a new interval starts, so the current one is finished
+        new = valid & ~overlap
+        out_s[rows[new],pos[new]], out_e[rows[new],pos[new]] = cur_s[new], cur_e[new]
+        pos[new] += 1
+        cur_s, cur_e = np.where(new,s,cur_s), np.where(new,e,cur_e)
+
+    #finish the last interval of each row
+    last = ~np.isnan(cur_s)
+    out_s[rows[last],pos[last]], out_e[rows[last],pos[last]] = cur_s[last], cur_e[last]
+    pos[last] += 1
+
+    width = max(int(pos.max()),1) if nrows != 0 else 1
+    return out_s[:,:width], out_e[:,:width]
+
+################################################################################
+
+def intersect(a, b):
+    """
+    Intersects two sets of intervals target by target (e.g., the time above the altitude limit with dark time).
+    Arguments:
+        - a, b: (starts, ends) pairs of (N x K) arrays (either can have one row, which then applies to every target)
+    Outputs:
+        - starts, ends: (N x M) arrays of the intervals in both a and b
+    """
+
+    a_s, a_e = np.atleast_2d(a[0]), np.atleast_2d(a[1])
+    b_s, b_e = np.atleast_2d(b[0]), np.atleast_2d(b[1])
+
+    #every pair of intervals, (N x Ka x Kb)
+    starts = np.fmax(a_s[:,:,None],b_s[:,None,:])
+    ends = np.fmin(a_e[:,:,None],b_e[:,None,:])
+    starts = np.where(np.isnan(a_s[:,:,None]) | np.isnan(b_s[:,None,:]),np.nan,starts)
+
+    nrows = starts.shape[0]
+    return normalise(starts.reshape(nrows,-1),ends.reshape(nrows,-1))
+
+def intersect_all(*sets):
+    """
+    Intersects any number of sets of intervals (see intersect).
+    """
+    result = sets[0]
+    for other in sets[1:]:
+        result = intersect(result,other)
+    return result
+
+################################################################################
+
+def duration(starts, ends):
+    """
+    Total length of the intervals of each target (in the units of the times, zero if there are none).
+    """
+    return np.nansum(np.asarray(ends) - np.asarray(starts),axis=1)
+
+################################################################################
+
+def from_samples(times, values, threshold):
+    """
+    Converts a quantity sampled on a grid of times (e.g., the lunar separation) into the intervals where it is at or
+    above a threshold, with the crossings found by linear interpolation between the samples.
+    Arguments:
+        - times: array of the T sample times (increasing)
+        - values: (N x T) array of the quantity for each target at each time
+        - threshold: the value the quantity has to be at or above (a number, or an array of one per target)
+    Outputs:
+        - starts, ends: (N x M) arrays of the intervals, limited to the first and last sample times
+    """
+
+    times = np.asarray(times,dtype=float)
+    values = np.atleast_2d(np.asarray(values,dtype=float))
+    threshold = np.reshape(np.asarray(threshold,dtype=float),(-1,1))
+    nrows, ntimes = values.shape
+    above = values >= threshold
+
+    #time each sample step crosses the threshold (linear interpolation)
+    v0, v1 = values[:,:-1], values[:,1:]
+    with np.errstate(invalid="ignore",divide="ignore"):
+        frac = np.clip((threshold - v0)/(v1 - v0),0,1)
+    crossing = times[:-1] + frac*np.diff(times)
+
+    #intervals start where the quantity goes above the threshold and end where it goes back below
+    rising = np.concatenate((above[:,:1],above[:,1:] & ~above[:,:-1]),axis=1)
+    falling = np.concatenate((above[:,:-1] & ~above[:,1:],above[:,-1:]),axis=1)
+    start_t = np.concatenate((np.broadcast_to(times[:1],(nrows,1)),crossing),axis=1)
+    end_t = np.concatenate((crossing,np.broadcast_to(times[-1:],(nrows,1))),axis=1)
+
+    #put the k-th start and end of each row into column k
+    width = max(int(rising.sum(axis=1).max()),1) if nrows != 0 else 1
+    starts, ends = np.full((nrows,width),np.nan), np.full((nrows,width),np.nan)
+    r, c = np.nonzero(rising)
+    starts[r,np.cumsum(rising,axis=1)[r,c]-1] = start_t[r,c]
+    r, c = np.nonzero(falling)
+    ends[r,np.cumsum(falling,axis=1)[r,c]-1] = end_t[r,c]
+
+    return normalise(starts,ends)
@@ -0,0 +1,186 @@
+"""
+Functions for recording how long each stage of the daily pipeline takes (wall and CPU time), its peak memory and the
+number of rows going in and out, so a slow cron job can be traced to the stage responsible.
+
+Stages are wrapped with the stage context manager. Nothing is recorded until start_run is called (e.g., by
+pipeline.py), after which each stage appends one line of JSON to the metrics log (usually 'metrics.jsonl'):
+    {"run": start of the run, "stage": name, "start": start of the stage, "wall_s", "cpu_s", "peak_rss_mb",
+     "rows_in", "rows_out"}
+The log is only ever appended to, so it holds the history of every run.
+
+Can be run as a script to summarise the log, showing each stage's time, memory and rows over the last few runs.
+
+Author: George Hume
+2023
+"""
+
+### IMPORTS ###
+import os
+import json
+import time
+import argparse
+import resource
+import numpy as np
+import datetime as dt
+from contextlib import contextmanager
+
+#the run being recorded (see start_run)
+_RUN = {"logname":None, "run":None}
+
+#order the stages are shown in by the summary
+STAGES = ["download", "unzip", "load", "upsert", "save", "slice", "visibility", "pscore", "html", "plot", "email"]
+
+################################################################################
+
+def start_run(logname = "/home/pha17gh/TNS/metrics.jsonl"):
+    """
+    Starts recording the stages of a run to the metrics log.
+    Arguments:
+        - logname: path of the JSON-lines metrics log (default is '/home/pha17gh/TNS/metrics.jsonl')
+    """
+    _RUN["logname"] = logname
+    _RUN["run"] = dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+def _cpu():
+    "CPU time used by this process and its finished child processes (e.g., curl) in seconds"
+    own, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+def _reset_peak():
+    "Resets the peak resident set size of this process so the peak of each stage is found (linux only)"
+    try:
+        with open("/proc/self/clear_refs","w") as file:
+            file.write("5")
+    except OSError:
+        pass
+
+def _peak_rss():
+    "Peak resident set size of this process in megabytes (since the last _reset_peak on linux)"
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM"):
+                    return int(line.split()[1])/1e3
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1e3 #peak over the whole process
+
+@contextmanager
+def stage(name, rows_in = None):
+    """
+    Records the wall time, CPU time and peak memory of a stage of the pipeline, e.g.,
+        with stage("upsert", rows_in = len(database)) as record:
+            database = upsert(database,updates)
+            record["rows_out"] = len(database)
+    Arguments:
+        - name: name of the stage (see STAGES)
+        - rows_in: number of rows going into the stage (default is None)
+    Outputs:
+        - record: dictionary of the stage's metrics that the rows going out ("rows_out") can be added to, appended
+                  to the metrics log at the end of the stage if a run has been started
+    """
+
+    record = {"run":_RUN["run"], "stage":name, "start":dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+              "rows_in":rows_in, "rows_out":None}
+    if _RUN["logname"] is None:
+        yield record
+        return
+
+    _reset_peak()
+    wall, cpu = time.perf_counter(), _cpu()
+    try:
+        yield record
+    finally:
+        record["wall_s"] = time.perf_counter() - wall
+        record["cpu_s"] = _cpu() - cpu
+        record["peak_rss_mb"] = _peak_rss()
+        with open(_RUN["logname"],"a") as file:
+            file.write(json.dumps(record)+"\n")
+
+################################################################################
+
+def load_log(logname):
+    """
+    Loads the metrics log and combines the records of each stage in each run (a stage can be recorded more than once
+    in a run, e.g., the download for each day of updates).
+    Arguments:
+        - logname: path of the JSON-lines metrics log
+    Outputs:
+        - runs: dictionary keyed by the start of each run (in time order) of dictionaries keyed by stage of the
+                total "wall_s" and "cpu_s", the largest "peak_rss_mb", the "rows_in" of the first record and the
+                "rows_out" of the last record
+    """
+
+    runs = {}
+    with open(logname) as file:
+        for line in file:
+            if line.strip() == "":
+                continue
+            record = json.loads(line)
+            run = runs.setdefault(record["run"],{})
+            if record["stage"] not in run:
+                run[record["stage"]] = {"wall_s":0.0, "cpu_s":0.0, "peak_rss_mb":0.0, "rows_in":record["rows_in"],
+                                        "rows_out":None}
+            total = run[record["stage"]]
+            total["wall_s"] += record["wall_s"]
+            total["cpu_s"] += record["cpu_s"]
+            total["peak_rss_mb"] = max(total["peak_rss_mb"],record["peak_rss_mb"])
+            total["rows_out"] = record["rows_out"]
+
+    return dict(sorted(runs.items()))
+
+def summary(runs, nruns = 7):
+    """
+    Prints a table of each stage's wall time, CPU time, peak memory and rows over the last few runs, with the change
+    in wall time of the latest run from the median of the runs before it.
+    Arguments:
+        - runs: dictionary from load_log
+        - nruns: number of the latest runs to show (default is 7)
+    """
+
+    names = list(runs)[-nruns:]
+    stages = [s for s in STAGES if any(s in runs[run] for run in names)]
+    stages += sorted({s for run in names for s in runs[run]} - set(stages)) #any other stages at the end
+
+    print(f"Last {len(names)} runs: " + ", ".join(names))
+    for name in stages:
+        print(f"\n{name}")
+        print(f"  {'run':<20} {'wall (s)':>10} {'cpu (s)':>10} {'peak (MB)':>10} {'rows in':>10} {'rows out':>10}")
+        walls = []
+        for run in names:
+            if name not in runs[run]:
+                continue
+            res = runs[run][name]
+            walls.append(res["wall_s"])
+            rows_in = "" if res["rows_in"] is None else res["rows_in"]
+            rows_out = "" if res["rows_out"] is None else res["rows_out"]
+            print(f"  {run:<20} {res['wall_s']:10.2f} {res['cpu_s']:10.2f} {res['peak_rss_mb']:10.1f} {rows_in:>10} {rows_out:>10}")
+
+        #trend of the latest run against the ones before
+        if len(walls) > 1:
+            median = np.median(walls[:-1])
+            if median > 0:
+                print(f"  latest wall time is {100*(walls[-1]/median - 1):+.0f}% from the median of the {len(walls)-1} runs before")
+
+    totals = [sum(res["wall_s"] for res in runs[run].values()) for run in names]
+    print("\ntotal wall time of the stages (s): " + ", ".join(f"{t:.1f}" for t in totals))
+
+################################################################################
+
+if __name__ == "__main__":
+
+    ### SYSTEM ARGUMENTS ###
+    parser = argparse.ArgumentParser(description = """
+    Summarises the metrics log of the daily pipeline over the last few runs.
+    """)
+
+    #adding arguments to praser object
+    parser.add_argument('--log' , type = str, default = '/home/pha17gh/TNS/metrics.jsonl', help = 'Path of the metrics log.')
+    parser.add_argument('--runs' , type = int, default = 7, help = 'Number of the latest runs to show (default is 7).')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.log):
+        print(f"No metrics log at {args.log} - run pipeline.py first.")
+        exit()
+
+    summary(load_log(args.log), args.runs)
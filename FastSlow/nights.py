@@ -0,0 +1,286 @@
+"""
+Functions for a persistent cache of the times of sunset, dark time and sunrise and the state of the moon for each
+night at a site, so that each stage doesn't have to reload the ephemerides and root-find the twilight times again.
+
+The cache is a JSON file (usually 'night_cache.json') with one dictionary per site, keyed by the site's
+"latitude,longitude,elevation", which contains one dictionary per night keyed by the date the night starts on
+(format '%Y-%m-%d'). Nights are also kept in memory once loaded so repeat lookups in the same process are free.
+
+Can be run as a script to precompute the nights for a site in bulk (e.g., for a whole year).
+
+Author: George Hume
+2023
+"""
+
+### IMPORTS ###
+import os
+import json
+import argparse
+import numpy as np
+import datetime as dt
+from skyfield import almanac
+from skyfield.api import N, E, wgs84, load, utc
+
+#format the times are saved in
+TFMT = "%Y-%m-%d %H:%M:%S.%f"
+
+#keys of the times saved for each night
+TIME_KEYS = ["sunset", "darkstart", "middark", "darkend", "sunrise"]
+
+#nights already loaded/calculated in this process {cachename: {site: {night: dict}}}
+_NIGHTS = {}
+
+#follow-up telescopes the lists can be made for {name: (latitude in degs, eastwards longitude in degs, elevation in metres)}
+#more can be added with a JSON file of the same form (see load_sites)
+SITES = {
+    "LT": (28.6468866, -17.7742491, 2326.0), #Liverpool Telescope, La Palma
+}
+
+#ephemerides and timescale already loaded in this process
+_EPHS = {}
+_TS = []
+
+################################################################################
+
+def ephemeris(ephm='de421.bsp'):
+    "Loads the skyfield ephemerides from the file ephm, only once per process"
+    if ephm not in _EPHS:
+        _EPHS[ephm] = load(ephm)
+    return _EPHS[ephm]
+
+def timescale():
+    "Loads the skyfield timescale, only once per process"
+    if len(_TS) == 0:
+        _TS.append(load.timescale())
+    return _TS[0]
+
+################################################################################
+
+def site_key(lat,long,elv):
+    "String used as the key for a site in the cache"
+    return f"{lat:.7f},{long:.7f},{elv:.1f}"
+
+def load_sites(filename):
+    """
+    Adds the sites saved in a JSON file to SITES.
+    Arguments:
+        - filename: path of the JSON file, a dictionary of {name: [latitude, eastwards longitude, elevation]}
+    Outputs:
+        - SITES: the updated dictionary of sites
+    """
+    with open(filename) as fp:
+        for name, (lat, long, elv) in json.load(fp).items():
+            SITES[name] = (float(lat), float(long), float(elv))
+    return SITES
+
+def midday_offset(long):
+    """
+    The whole number of half days to shift UTC midday by so that it falls in the day at a site. Nights are found
+    between these middays, so sites more than 90 degrees from Greenwich (e.g., Australia or Hawaii) still have the
+    whole night in one window. Zero for sites like La Palma.
+    Arguments:
+        - long: the eastwards longitude of the location (in decimal degrees)
+    Outputs:
+        - offset: datetime.timedelta to add to UTC midday
+    """
+    return dt.timedelta(hours = -12*round(long/180))
+
+################################################################################
+
+def _load_cache(cachename):
+    "Loads (once) the cache file into memory, returns the dictionary of sites"
+    if cachename not in _NIGHTS:
+        if (cachename is not None) and os.path.exists(cachename):
+            with open(cachename) as fp:
+                _NIGHTS[cachename] = json.load(fp)
+        else:
+            _NIGHTS[cachename] = {}
+    return _NIGHTS[cachename]
+
+def _save_cache(cachename):
+    "Saves the nights in memory to the cache file (written to a temporary file first then moved into place)"
+    if cachename is None:
+        return
+    tmpname = cachename+".tmp"
+    with open(tmpname,"w") as fp:
+        json.dump(_NIGHTS[cachename],fp,indent=4)
+    os.replace(tmpname,cachename)
+
+################################################################################
+
+def compute_nights(lat,long,elv,start,ndays,eph,ts):
+    """
+    Function that calculates the twilight times and the state of the moon for a run of consecutive nights using one
+    search for the twilight times over all the nights.
+    Arguments:
+        - lat: the latitude of the location (in decimal degrees)
+        - long: the eastwards longitude of the location (in decimal degrees)
+        - elv: the elevation of the location (in metres)
+        - start: the date of the first night (datetime.date)
+        - ndays: the number of nights to calculate
+        - eph: skyfield ephemerides (e.g., load('de421.bsp'))
+        - ts: skyfield timescale
+    Outputs:
+        - nights: dictionary keyed by the date each night starts on ('%Y-%m-%d'), each containing a dictionary with
+                  the UTC times (strings in format TFMT) of "sunset", "darkstart", "middark", "darkend" and "sunrise",
+                  "nightend_date" (the date dark time ends), "moon_phase" (degrees at midday before the night),
+                  "moon_illumination" (fraction at midnight) and "moon_alt" (degrees at midnight)
+    """
+
+    location = wgs84.latlon(lat * N, long * E, elevation_m = elv) #location of observatory
+    earth, moon = eph['earth'], eph['moon']
+    Epos = earth + location #sets up observing position
+
+    #midday at the start of each night, and the end of the last one (shifted into the day at the site)
+    middays = [dt.datetime.combine(start + dt.timedelta(days=i), dt.time(12), tzinfo=utc) + midday_offset(long)
+               for i in range(ndays+1)]
+    t_mid = ts.from_datetimes(middays)
+
+    ### Find the twilight times for all the nights at once ###
+    f = almanac.dark_twilight_day(eph, location)
+    times, events = almanac.find_discrete(t_mid[0], t_mid[-1], f)
+    tjd = times.tt
+
+    ## state of the moon at midday (phase) and midnight (illumination and altitude) of each night ##
+    t0 = ts.tt_jd(t_mid.tt[:-1])
+    midnight = ts.tt_jd(t_mid.tt[:-1] + 0.5)
+    mphase = almanac.moon_phase(eph, t0).degrees
+    mill = almanac.fraction_illuminated(eph, "moon", midnight)
+    malt = Epos.at(midnight).observe(moon).apparent().altaz()[0].degrees
+
+    nights = {}
+    for i in range(ndays):
+        #twilight changes between this midday and the next
+        inwin = np.nonzero((tjd >= t_mid.tt[i]) & (tjd < t_mid.tt[i+1]))[0]
+        ev, tw = events[inwin], times[inwin]
+
+        #events give the new state: 4 day, 3 civil, 2 nautical, 1 astronomical twilight, 0 dark
+        sunset = tw[np.nonzero(ev < 4)[0][0]] #first time leaving day
+        darkstart = tw[np.nonzero(ev == 0)[0][0]] #first time it is dark
+        darkend = tw[np.nonzero((ev == 1) & (tw.tt > darkstart.tt))[0][0]] #first twilight after the dark
+        sunrise = tw[np.nonzero((ev == 4) & (tw.tt > darkend.tt))[0][0]] #day again
+
+        #find the UTC time at the middle of the night
+        ds, de = darkstart.utc_datetime(), darkend.utc_datetime()
+        middark = ds + (de - ds)/2
+
+        nights[(start + dt.timedelta(days=i)).strftime("%Y-%m-%d")] = {
+            "sunset": sunset.utc_datetime().strftime(TFMT),
+            "darkstart": ds.strftime(TFMT),
+            "middark": middark.strftime(TFMT),
+            "darkend": de.strftime(TFMT),
+            "sunrise": sunrise.utc_datetime().strftime(TFMT),
+            "nightend_date": de.strftime("%Y-%m-%d"),
+            "moon_phase": float(mphase[i]),
+            "moon_illumination": float(mill[i]),
+            "moon_alt": float(malt[i]),
+        }
+
+    return nights
+
+################################################################################
+
+def precompute_nights(lat,long,elv,start,ndays,ephm='de421.bsp',cachename=None,eph=None,ts=None):
+    """
+    Calculates and caches any nights in a run of consecutive nights that aren't already in the cache.
+    Arguments:
+        - lat, long, elv: latitude, eastwards longitude (decimal degrees) and elevation (metres) of the location
+        - start: the date of the first night (datetime.date)
+        - ndays: the number of nights
+        - ephm: the path to the ephemerides file for skyfield (default is 'de421.bsp')
+        - cachename: path of the JSON cache file (default is None - i.e., only kept in memory)
+        - eph, ts: optional already loaded skyfield ephemerides and timescale
+    Outputs:
+        - nights: dictionary of the nights (see compute_nights), keyed by the date each night starts on
+    """
+
+    site = _load_cache(cachename).setdefault(site_key(lat,long,elv),{})
+    dates = [start + dt.timedelta(days=i) for i in range(ndays)]
+    missing = [d for d in dates if d.strftime("%Y-%m-%d") not in site]
+
+    if len(missing) != 0:
+        if eph is None:
+            eph = ephemeris(ephm) #loads in ephemerides
+        if ts is None:
+            ts = timescale() #loads in timescale
+        #calculate from the first to last missing night in one go
+        nmissing = (missing[-1] - missing[0]).days + 1
+        site.update(compute_nights(lat,long,elv,missing[0],nmissing,eph,ts))
+        _save_cache(cachename)
+
+    return {d.strftime("%Y-%m-%d"): site[d.strftime("%Y-%m-%d")] for d in dates}
+
+################################################################################
+
+def night_almanac(lat,long,elv,night,ephm='de421.bsp',cachename=None,eph=None,ts=None):
+    """
+    Function that gives the twilight times and the state of the moon for one night at a site, from the cache if
+    it has already been calculated.
+    Arguments:
+        - lat, long, elv: latitude, eastwards longitude (decimal degrees) and elevation (metres) of the location
+        - night: the date the night starts on (datetime.date or datetime.datetime)
+        - ephm: the path to the ephemerides file for skyfield (default is 'de421.bsp')
+        - cachename: path of the JSON cache file (default is None - i.e., only kept in memory)
+        - eph, ts: optional already loaded skyfield ephemerides and timescale (only used if not cached)
+    Outputs:
+        - nightinfo: dictionary of the night with the times in TIME_KEYS as timezone aware UTC datetime objects
+                     plus "nightend_date", "moon_phase", "moon_illumination" and "moon_alt" (see compute_nights)
+    """
+
+    if isinstance(night,dt.datetime):
+        night = night.date()
+
+    site = _load_cache(cachename).get(site_key(lat,long,elv),{})
+    saved = site.get(night.strftime("%Y-%m-%d"))
+    if saved is None:
+        saved = precompute_nights(lat,long,elv,night,1,ephm,cachename,eph,ts)[night.strftime("%Y-%m-%d")]
+
+    nightinfo = dict(saved)
+    for key in TIME_KEYS:
+        nightinfo[key] = dt.datetime.strptime(saved[key],TFMT).replace(tzinfo=utc)
+
+    return nightinfo
+
+################################################################################
+
+def write_solar_times(nightinfo,filename):
+    """
+    Saves the times of a night from night_almanac as the JSON file the follow-up script (fup.py) reads.
+    Arguments:
+        - nightinfo: dictionary of the night from night_almanac
+        - filename: path to save the JSON file to (usually 'solar_times.json')
+    Outputs:
+        - the JSON file with the UTC times ("%H:%M:%S") of each time in TIME_KEYS, plus "night_date", "nightend_date"
+          and the moon's phase and illumination
+    """
+
+    sdict = {key: nightinfo[key].strftime("%H:%M:%S") for key in TIME_KEYS}
+    sdict["night_date"] = nightinfo["sunset"].strftime("%Y-%m-%d")
+    sdict["nightend_date"] = nightinfo["nightend_date"]
+    sdict["moon_phase"] = nightinfo["moon_phase"]
+    sdict["moon_illumination"] = nightinfo["moon_illumination"]
+
+    with open(filename,"w") as fp:
+        json.dump(sdict,fp,indent=4)
+
+################################################################################
+
+if __name__ == "__main__":
+
+    ### SYSTEM ARGUMENTS ###
+    parser = argparse.ArgumentParser(description = """
+    Precomputes the twilight times and the state of the moon for a run of nights at a site and saves them to the night cache.
+    """)
+
+    #adding arguments to praser object
+    parser.add_argument('lat' , type = float, help = 'Lattitude of the follow-up telescope.')
+    parser.add_argument('long' , type = float, help = 'Longitude of the follow-up telescope.')
+    parser.add_argument('elv' , type = float, help = 'Elevation above sea-level of the follow-up telescope.')
+    parser.add_argument('start' , type = str, help = 'Date of the first night (format YYYY-MM-DD).')
+    parser.add_argument('--ndays' , type = int, default = 365, help = 'Number of nights to calculate (default is 365).')
+    parser.add_argument('--cache' , type = str, default = 'night_cache.json', help = 'Path to the night cache JSON file.')
+    parser.add_argument('--ephm' , type = str, default = 'de421.bsp', help = 'Path to the ephemerides file.')
+    args = parser.parse_args()
+
+    start = dt.datetime.strptime(args.start,"%Y-%m-%d").date()
+    precompute_nights(args.lat,args.long,args.elv,start,args.ndays,args.ephm,args.cache)
@@ -0,0 +1,65 @@
+"""
+Script that runs the whole daily pipeline in one process: updates the local TNS database, creates the PEPPER Fast
+and Slow priority lists, plots the visibility of the top targets and sends the daily email. The database, the
+lists and tonight's twilight times are passed between the stages in memory, so the packages, ephemerides and CSV
+files are only loaded once.
+
+Each stage can still be run on its own with tns_update.py, fastslow.py, visplots.py and email_alert.py.
+
+The wall time, CPU time, peak memory and rows in and out of each stage are added to the metrics log (see metrics.py).
+
+Author: George Hume
+2023
+"""
+
+### IMPORTS ###
+import os
+import sys
+import argparse
+import traceback
+
+#email_alert.py lives in the mail directory on the server
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),"mail"))
+
+from tns_update import update_database
+from fastslow import make_lists, load_database
+from visplots import plot_lists
+from email_alert import send_email
+from metrics import start_run, stage
+
+### SYSTEM ARGUMENTS ###
+parser = argparse.ArgumentParser(description = """
+Runs the daily PEPPER Fast and Slow pipeline.
+""")
+parser.add_argument('--workers' , type = int, default = 1, help = 'Number of processes for the visibility calculation (default is 1).')
+parser.add_argument('--method' , type = str, default = 'batch', choices = ['batch','fast','grid','table'], help = 'How the visibility is calculated (default is batch).')
+parser.add_argument('--metrics' , type = str, default = '/home/pha17gh/TNS/metrics.jsonl', help = 'Path of the metrics log the time and memory of each stage is added to.')
+args = parser.parse_args()
+
+# record the time and memory of each stage (summarise with metrics.py) #
+start_run(args.metrics)
+
+# update the local TNS database and keep it in memory #
+#(if the download or update fails the lists are made from the database as it was, and the email says it is out of date)
+try:
+    date, headers, database = update_database()
+except Exception:
+    print("TNS database not updated - carrying on with the database as it was:")
+    traceback.print_exc()
+    date, headers, database = load_database()
+
+# create the PEPPER Fast and Slow lists (also saves the CSVs, HTML table and tonight's twilight times) #
+lists = make_lists(date, headers, database, args.workers, args.method)
+
+# make the visibility plots from the lists in memory #
+with stage("plot",len(lists["Fast"])+len(lists["Slow"])):
+    plot_lists([("transient_list-F.csv", lists["Fast"]), ("transient_list-S.csv", lists["Slow"])],
+               lists["night"], "/home/pha17gh/TNS/VisPlots", cachename = "/home/pha17gh/TNS/night_cache.json",
+               gridname = "/home/pha17gh/TNS/night_grid.npz")
+
+# send automated email with priority scores attached #
+with stage("email"):
+    send_email(lists["topline"][0], lists["table"],
+               correspondents_file = "/home/pha17gh/TNS/mail/correspondents.csv",
+               body_file = "/home/pha17gh/TNS/mail/email.html",
+               plot_dir = "/home/pha17gh/TNS/VisPlots")
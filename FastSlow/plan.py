@@ -0,0 +1,57 @@
+"""
+Script to plan observing over the next few nights. Ranks the targets from the TNS database for the PEPPER Fast
+and Slow surveys on each of a run of nights (e.g., the next week) with the Liverpool Telescope, with the
+visibility of every night calculated in one go rather than running the nightly lists once per night.
+
+Saves the top targets of each survey for each night as a CSV file (one row per target) and prints a summary.
+
+Depends on functions.py script to operate.
+
+Author: George Hume
+2023
+"""
+
+### IMPORTS ###
+import csv
+import argparse
+import datetime as dt
+from functions import *
+from fastslow import load_database
+
+### SYSTEM ARGUMENTS ###
+parser = argparse.ArgumentParser(description = """
+Ranks the PEPPER Fast and Slow targets for each of the next few nights.
+""")
+
+#adding arguments to praser object
+parser.add_argument('--start' , type = str, default = None, help = 'Date of the first night (format YYYY-MM-DD, default is tonight).')
+parser.add_argument('--nights' , type = int, default = 7, help = 'Number of nights to plan (default is 7).')
+parser.add_argument('--top' , type = int, default = 10, help = 'Number of targets to keep for each survey each night (default is 10).')
+parser.add_argument('--out' , type = str, default = '/home/pha17gh/TNS/night_plan.csv', help = 'Path of the CSV file to save the plan to.')
+args = parser.parse_args()
+
+if args.start is None:
+    start = dt.datetime.now().date()
+else:
+    start = dt.datetime.strptime(args.start,"%Y-%m-%d").date()
+
+if args.nights < 1:
+    print("Plan not made - the number of nights must be at least 1.")
+    exit()
+
+# load in the database and rank the targets for every night #
+date, headers, database = load_database()
+plan = plan_nights(database,date,start,args.nights,top=args.top,cachename="/home/pha17gh/TNS/night_cache.json")
+
+#save out the plan
+with open(args.out, 'w') as file:
+    csvwriter = csv.writer(file,delimiter=",") # create a csvwriter object
+    csvwriter.writerow([f"Plan for {args.nights} nights from {start.strftime('%Y-%m-%d')} using TNS database from {date}"])
+    csvwriter.writerow(['night','survey','rank','objid','name_prefix','name','observable_time','lunar_sep','priority_score'])
+    csvwriter.writerows(plan) # write the rest of the data
+
+#print a compact summary of each night
+for row in plan:
+    if row[2] == 1:
+        print(f"\n{row[0]} {row[1]}:")
+    print(f"  {row[2]:>3} {row[4]} {row[5]:<12} t_obs {float(row[6]):5.2f} h  l_sep {float(row[7]):6.1f} deg  pscore {float(row[8]):.2f}")
@@ -0,0 +1,110 @@
+"""
+Functions for a lookup table of the observable time and lunar separation over the whole sky for a night at a site,
+on a regular grid of RA and Dec, so the visibility of any number of targets is an interpolation from the table.
+
+The table itself is calculated by sky_table in functions.py (with batch_visibility) and is kept in memory per site,
+night and grid step. It can also be saved to a .npz file (usually 'sky_table.npz') so later runs on the same night
+don't recalculate it.
+
+Author: George Hume
+2023
+"""
+
+### IMPORTS ###
+import os
+import numpy as np
+
+#tables already calculated in this process {(site, night, step): table}
+_TABLES = {}
+
+################################################################################
+
+def sky_nodes(step):
+    """
+    The RA and Dec of the nodes of the grid.
+    Arguments:
+        - step: spacing of the grid in decimal degrees (should divide 180)
+    Outputs:
+        - ra_nodes: array of the RAs of the nodes from 0 to 360 inclusive, so the interpolation wraps around
+        - dec_nodes: array of the Decs of the nodes from -90 to 90 inclusive
+    """
+    nra, ndec = int(round(360/step)), int(round(180/step))
+    return np.linspace(0,360,nra+1), np.linspace(-90,90,ndec+1)
+
+################################################################################
+
+def load_table(tablename,key):
+    "Loads a table saved by save_table if it is for the same site, night and step"
+    if (tablename is None) or (not os.path.exists(tablename)):
+        return None
+    with np.load(tablename) as saved:
+        if (str(saved["site"]), str(saved["night"]), float(saved["step"])) != key:
+            return None
+        return {"step":float(saved["step"]), "t_obs":saved["t_obs"], "l_sep":saved["l_sep"], "mill":float(saved["mill"])}
+
+def save_table(tablename,key,table):
+    "Saves a table to a .npz file (written to a temporary file first then moved into place)"
+    if tablename is None:
+        return
+    tmpname = tablename+".tmp.npz"
+    np.savez(tmpname, site=key[0], night=key[1], **table)
+    os.replace(tmpname,tablename)
+
+################################################################################
+
+def interpolate(table, ra, dec):
+    """
+    Bilinear interpolation of a table at the positions of targets.
+    Arguments:
+        - table: dictionary from sky_table with (RA x Dec) arrays "t_obs" and "l_sep" and the grid "step"
+        - ra: array of right ascensions of the targets (in decimal degrees)
+        - dec: array of declinations of the targets (in decimal degrees)
+    Outputs:
+        - values: dictionary of arrays with one entry per target
+            - "t_obs", "l_sep": the interpolated observable time (hours) and mean lunar separation (degrees)
+            - "edge": True where any of the four surrounding nodes has no observable time, where the interpolation
+                      can't be trusted
+    """
+
+    ra = np.asarray(ra,dtype=float) % 360
+    dec = np.clip(np.asarray(dec,dtype=float),-90,90)
+    step = table["step"]
+    nra, ndec = table["t_obs"].shape
+
+    #the node below each target and how far it is towards the next one
+    x, y = ra/step, (dec + 90)/step
+    i, j = np.clip(np.floor(x).astype(int),0,nra-2), np.clip(np.floor(y).astype(int),0,ndec-2)
+    fx, fy = x - i, y - j
+
+    values = {}
+    for key in ["t_obs","l_sep"]:
+        grid = table[key]
+        values[key] = ((1-fx)*(1-fy)*grid[i,j] + fx*(1-fy)*grid[i+1,j]
+                       + (1-fx)*fy*grid[i,j+1] + fx*fy*grid[i+1,j+1])
+
+    corners = np.array([table["t_obs"][i,j],table["t_obs"][i+1,j],table["t_obs"][i,j+1],table["t_obs"][i+1,j+1]])
+    values["edge"] = np.any(corners <= 0,axis=0)
+
+    return values
+
+################################################################################
+
+def needs_exact(values, obs_limits, sep_limits, obs_margin = 0.1, sep_margin = 1.0):
+    """
+    Finds the targets whose interpolated values are too close to a threshold (or the edge of the observable part of
+    the sky) to trust, so they can be calculated exactly instead.
+    Arguments:
+        - values: dictionary from interpolate
+        - obs_limits: list of the observable time thresholds in hours
+        - sep_limits: list of the lunar separation thresholds in decimal degrees
+        - obs_margin: how close to an observable time threshold counts as near, in hours (default is 0.1)
+        - sep_margin: how close to a lunar separation threshold counts as near, in degrees (default is 1.0)
+    Outputs:
+        - exact: boolean array of the targets to calculate exactly
+    """
+    exact = values["edge"].copy()
+    for limit in obs_limits:
+        exact |= np.abs(values["t_obs"] - limit) < obs_margin
+    for limit in sep_limits:
+        exact |= np.abs(values["l_sep"] - limit) < sep_margin
+    return exact
@@ -0,0 +1,265 @@
+"""
+Functions for keeping the TNS database in SQLite (usually 'tns_public_objects.sqlite') instead of the CSV, so the
+pipeline's queries use indexes rather than scanning every entry:
+    - updates are batched UPSERTs on objid in one transaction (see upsert_sql)
+    - the Fast and Slow windows are range queries on the modification and discovery times (see window_database)
+    - a handful of objects for follow-up are looked up by objid (see lookup)
+
+The database is one table, objects, with:
+    - every column of the CSV as text under its header, so the CSV can be exported exactly as it was read in
+    - typed copies of ra, declination and discoverymag (REAL, NULL where blank) and of discoverydate and lastmodified
+      (INTEGER milliseconds since the Unix epoch, NULL where blank), named <column>_f and <column>_ms
+    - pos, the position of the entry in the CSV (new objects get a smaller pos than any before, so they go at the top)
+with indexes on objid (unique), lastmodified_ms, discoverydate_ms and pos. The date and headers of the database are
+kept in the meta table.
+
+While SQLite is used tns_public_objects.csv is only exported again once it is EXPORT_DAYS days behind (see
+refresh_csv, called by tns_update.py), so scripts that read the CSV directly (e.g., Follow-up/fup_funcs.py and the
+Filtering scripts) use a database up to EXPORT_DAYS days old. Use loadSQL or lookup for the current database.
+
+Can be run as a script to import the CSV into SQLite, export the CSV from it, or print the entries of some objids.
+
+Author: George Hume
+2023
+"""
+
+### IMPORTS ###
+import os
+import csv
+import json
+import sqlite3
+import argparse
+import numpy as np
+import datetime as dt
+from columnar import FLOAT_COLS, EPOCH_COLS, NAT, to_float, to_epoch
+
+#the CSV is exported again once it is this many days older than the SQLite database (see refresh_csv)
+EXPORT_DAYS = 7
+
+################################################################################
+
+def _typed():
+    "Names of the typed columns added to the text columns of the CSV"
+    return [f"{name}_f" for name in FLOAT_COLS] + [f"{name}_ms" for name in EPOCH_COLS]
+
+def _columns(headers):
+    "Quoted names of the columns a row is inserted into (position, the CSV's columns, then the typed copies)"
+    return ['"pos"'] + [f'"{name}"' for name in headers] + [f'"{name}"' for name in _typed()]
+
+def _rows(headers, rows, pos):
+    """
+    Gives the values to insert for some rows of the database, with the typed copies of the float and date columns.
+    Arguments:
+        - headers: the column headers of the database as a list
+        - rows: numpy object array of the rows
+        - pos: array of the position of each row
+    Outputs:
+        - values: list of tuples of (position, text columns, typed columns) for executemany
+    """
+    floats = [to_float(rows.T[headers.index(name)]) for name in FLOAT_COLS]
+    epochs = [to_epoch(rows.T[headers.index(name)]) for name in EPOCH_COLS]
+    floats = [[None if np.isnan(v) else float(v) for v in column] for column in floats] #blanks are NULL
+    epochs = [[None if v == NAT else int(v) for v in column] for column in epochs]
+    return [(int(pos[i]), *rows[i], *[column[i] for column in floats], *[column[i] for column in epochs])
+            for i in range(len(rows))]
+
+def meta(sqlname):
+    """
+    Gives the date and headers of the database.
+    Arguments:
+        - sqlname: path of the SQLite database
+    Outputs:
+        - date: the date the TNS database was updated as a string in the format '%Y-%m-%d %H:%M:%S'
+        - headers: the column headers of the database as a list
+    """
+    with sqlite3.connect(sqlname) as con:
+        values = dict(con.execute("SELECT key, value FROM meta"))
+    con.close()
+    return values["date"], json.loads(values["headers"])
+
+################################################################################
+
+def import_database(sqlname, date, headers, database):
+    """
+    Saves the whole TNS database to SQLite, replacing anything already in it.
+    Arguments:
+        - sqlname: path of the SQLite database
+        - date: the date of the database as a string in the format '%Y-%m-%d %H:%M:%S'
+        - headers: the column headers of the database as a list
+        - database: numpy object array of the TNS database (if an objid is in it more than once only the first
+                    entry is kept, the one upsert would update)
+    """
+    columns = _columns(headers)
+    definitions = ['"pos" INTEGER'] + [f'"{name}" TEXT' for name in headers]
+    definitions += [f'"{name}" REAL' for name in _typed()[:len(FLOAT_COLS)]]
+    definitions += [f'"{name}" INTEGER' for name in _typed()[len(FLOAT_COLS):]]
+
+    con = sqlite3.connect(sqlname)
+    with con:
+        con.execute("DROP TABLE IF EXISTS objects")
+        con.execute("DROP TABLE IF EXISTS meta")
+        con.execute(f"CREATE TABLE objects ({', '.join(definitions)})")
+        con.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        con.executemany(f"INSERT OR IGNORE INTO objects ({', '.join(columns)}) VALUES ({', '.join('?'*len(columns))})",
+                        _rows(headers,database,np.arange(len(database))))
+        #indexes made after the rows are in as it is quicker
+        con.execute(f'CREATE UNIQUE INDEX objects_objid ON objects ("{headers[0]}")')
+        con.execute(f'CREATE INDEX objects_mod ON objects ("{EPOCH_COLS[1]}_ms")')
+        con.execute(f'CREATE INDEX objects_disc ON objects ("{EPOCH_COLS[0]}_ms")')
+        con.execute('CREATE INDEX objects_pos ON objects ("pos")')
+        con.executemany("INSERT INTO meta VALUES (?,?)", [("date",date), ("headers",json.dumps(headers))])
+    con.close()
+
+def upsert_sql(sqlname, date, updates):
+    """
+    Applies the rows of TNS update files to the database in one transaction, the same as upsert does to the numpy
+    array: rows with an objid already in the database replace that entry and rows with a new objid are added to
+    the top (in the order they appear in the updates).
+    Arguments:
+        - sqlname: path of the SQLite database
+        - date: the date of the updated database as a string in the format '%Y-%m-%d %H:%M:%S'
+        - updates: numpy object array of the update's rows, newest at the top (several days of updates can be
+                   stacked newest first, as they are applied from the bottom up)
+    """
+    dummy, headers = meta(sqlname)
+    columns = _columns(headers)
+    assign = ", ".join(f"{name}=excluded.{name}" for name in columns[1:]) #everything but the position
+
+    con = sqlite3.connect(sqlname)
+    with con:
+        if len(updates) != 0:
+            top = con.execute('SELECT MIN("pos") FROM objects').fetchone()[0]
+            top = 0 if top is None else top
+            #from the bottom of the updates up, each new objid going above the last (existing ones keep their place)
+            rows = updates[::-1]
+            con.executemany(f"INSERT INTO objects ({', '.join(columns)}) VALUES ({', '.join('?'*len(columns))}) "
+                            f'ON CONFLICT("{headers[0]}") DO UPDATE SET {assign}',
+                            _rows(headers,rows,top-1-np.arange(len(rows))))
+        con.execute("UPDATE meta SET value = ? WHERE key = 'date'", (date,))
+    con.close()
+
+################################################################################
+
+def _select(sqlname, where = "", params = ()):
+    "Gives the text columns of the rows matching a WHERE clause, in the order of the CSV, as a numpy object array"
+    dummy, headers = meta(sqlname)
+    con = sqlite3.connect(sqlname)
+    rows = con.execute(f"SELECT {', '.join(_columns(headers)[1:len(headers)+1])} FROM objects {where} ORDER BY \"pos\"",
+                       params).fetchall()
+    con.close()
+    database = np.empty((len(rows),len(headers)),dtype="object")
+    for i, row in enumerate(rows):
+        database[i] = row
+    return database
+
+def loadSQL(sqlname):
+    """
+    Loads the whole TNS database from SQLite, the same as loadDB does from the CSV.
+    Arguments:
+        - sqlname: path of the SQLite database (usually 'tns_public_objects.sqlite')
+    Outputs:
+        - date: the date the TNS database was updated as a string in the format '%Y-%m-%d %H:%M:%S'
+        - headers: the column headers of the database as a list
+        - database: numpy object array containg all the entries of the TNS database
+    """
+    date, headers = meta(sqlname)
+    return date, headers, _select(sqlname)
+
+def window_database(sqlname, date = None):
+    """
+    Loads only the entries of the TNS database in the PEPPER Fast or Slow time windows (see TNSwindows), with range
+    queries on the indexed modification and discovery times. The windows found from these entries with TNSwindows
+    are the same as from the whole database.
+    Arguments:
+        - sqlname: path of the SQLite database
+        - date: the date the TNS database was updated (string with format '%Y-%m-%d %H:%M:%S', default is None -
+                i.e., the date saved with the database)
+    Outputs:
+        - date: the date the TNS database was updated as a string in the format '%Y-%m-%d %H:%M:%S'
+        - headers: the column headers of the database as a list
+        - database: numpy object array of the entries in either window (in the order of the CSV)
+    """
+    from functions import window_limits
+
+    saved, headers = meta(sqlname)
+    date = saved if date is None else date
+
+    where, params = [], []
+    for moddiff, discdiff in window_limits(date).values():
+        where.append(f'("{EPOCH_COLS[1]}_ms" > ? AND "{EPOCH_COLS[0]}_ms" > ?)')
+        params += [int(np.datetime64(moddiff,"ms").astype(np.int64)), int(np.datetime64(discdiff,"ms").astype(np.int64))]
+
+    return date, headers, _select(sqlname, "WHERE " + " OR ".join(where), params)
+
+def lookup(sqlname, objids):
+    """
+    Gives the entries of some objects from their objids.
+    Arguments:
+        - sqlname: path of the SQLite database
+        - objids: list of the objids
+    Outputs:
+        - database: numpy object array of the entries of the objids that are in the database (in the order of the CSV)
+    """
+    dummy, headers = meta(sqlname)
+    objids = [str(ID) for ID in objids]
+    return _select(sqlname, f'WHERE "{headers[0]}" IN ({", ".join("?"*len(objids))})', objids)
+
+def export_csv(sqlname, filename):
+    """
+    Writes the database out as the TNS CSV (date, headers, entries).
+    Arguments:
+        - sqlname: path of the SQLite database
+        - filename: path of the CSV to write
+    """
+    date, headers, database = loadSQL(sqlname)
+    with open(filename, 'w') as file:
+        csvwriter = csv.writer(file,delimiter=",") # create a csvwriter object
+        csvwriter.writerow([date]) #add date to first row
+        csvwriter.writerow(headers) #add the headers
+        csvwriter.writerows(database) # write the rest of the data
+
+def refresh_csv(sqlname, filename, days = EXPORT_DAYS):
+    """
+    Exports the database as the TNS CSV if the CSV is missing or at least some days older than the database, so the
+    scripts that read the CSV directly are never too far behind without exporting it on every update.
+    Arguments:
+        - sqlname: path of the SQLite database
+        - filename: path of the CSV
+        - days: how many days older than the database the CSV can be (default is EXPORT_DAYS)
+    Outputs:
+        - exported: True if the CSV was exported
+    """
+    date, headers = meta(sqlname)
+    if os.path.exists(filename):
+        with open(filename) as file:
+            csvdate = next(csv.reader(file))[0] #only the date on the first row
+        age = dt.datetime.strptime(date,'%Y-%m-%d %H:%M:%S') - dt.datetime.strptime(csvdate,'%Y-%m-%d %H:%M:%S')
+        if age < dt.timedelta(days=days):
+            return False
+    export_csv(sqlname, filename)
+    return True
+
+################################################################################
+
+if __name__ == "__main__":
+    from functions import loadDB
+
+    ### SYSTEM ARGUMENTS ###
+    parser = argparse.ArgumentParser(description = """
+    Imports the TNS CSV database into SQLite, exports it back out, or looks up objects in it.
+    """)
+
+    #adding arguments to praser object
+    parser.add_argument('mode' , type = str, choices = ["import","export","lookup"], help = 'import the CSV into SQLite, export the CSV from it, or print the entries of some objids.')
+    parser.add_argument('objids' , type = str, nargs = '*', help = 'The objids to look up.')
+    parser.add_argument('--sql' , type = str, default = '/home/pha17gh/TNS/tns_public_objects.sqlite', help = 'Path to the SQLite database.')
+    parser.add_argument('--csv' , type = str, default = '/home/pha17gh/TNS/tns_public_objects.csv', help = 'Path to the TNS CSV database.')
+    args = parser.parse_args()
+
+    if args.mode == "import":
+        import_database(args.sql,*loadDB(args.csv))
+    elif args.mode == "export":
+        export_csv(args.sql,args.csv)
+    else:
+        for row in lookup(args.sql,args.objids):
+            print(",".join(row))
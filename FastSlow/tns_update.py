@@ -1,5 +1,6 @@
 """
-Script that updates the local TNS database with the updates downloaded via curl from the TNS.
+Script that updates the local TNS database with the updates downloaded via curl from the TNS (read straight
+out of their zip files, which are kept in old_updates).
 
 Depends on filter_funcs.py script to operate.
 
@@ -7,6 +8,7 @@ Author: George Hume
 2023
 """
 
+import os
 import csv
 import json
 import numpy as np
@@ -14,54 +16,104 @@ import datetime as dt
 import subprocess
 from functions import *
 
-DBname = "/home/pha17gh/TNS/tns_public_objects.csv" #database file name
-
-#load in string of date, headers and database entries from the database
-DBdate, headers, database = loadDB(DBname)
-
-#datetime dates
-DB_date = dt.datetime.strptime(DBdate, '%Y-%m-%d %H:%M:%S') #date from tns database
-today = dt.datetime.combine(dt.datetime.now(), dt.datetime.min.time()) #today's data at turn of the day
-
-#time difference between the dates
-deltaT = (today - DB_date).days #time diff in days
-
-if deltaT == 0:
-	print("TNS database is already up to date")
-
-elif deltaT == 1:
-	#if only 1 day diff then download yesterday's updates and add to database
-	udate = DB_date.strftime('%Y%m%d')
-	DandU(udate,today,database,headers)
-
-elif (deltaT>1) & (deltaT<=25):
-	#if between 2 and 25days difference then download all previous updates and add then to database
-
-	for i in range(deltaT):
-    	#go from last to most current update
-
-		#date as string to find update file
+def update_database(DBname = "/home/pha17gh/TNS/tns_public_objects.csv", logdir = "/home/pha17gh/TNS/tns_delta", sqlname = "/home/pha17gh/TNS/tns_public_objects.sqlite"):
+	"""
+	Brings the local TNS database up to date and returns it, so it can be passed on to the next stage without loading it in again.
+	Arguments:
+		- DBname: path of the TNS database CSV file (default is '/home/pha17gh/TNS/tns_public_objects.csv')
+		- logdir: path of the append-only log of the database (see deltalog.py). If it exists the database is read
+		          from it and the updates are added to it, rather than rewriting the CSV, which is then only rewritten when
+		          the log is compacted (default is '/home/pha17gh/TNS/tns_delta')
+		- sqlname: path of the SQLite database (see sqlstore.py). If it exists the updates are applied to it instead
+		           of the CSV or log and only the entries in the Fast and Slow windows are loaded from it (the CSV is
+		           then only exported every EXPORT_DAYS days, see sqlstore.refresh_csv)
+		           (default is '/home/pha17gh/TNS/tns_public_objects.sqlite')
+	Outputs:
+		- DBdate: the date the TNS database was updated as a string in the format '%Y-%m-%d %H:%M:%S'
+		- headers: the column headers of the database as a list
+		- database: numpy object array containg all the entries of the TNS database (or only those in the Fast and
+		            Slow windows if the SQLite database is used)
+	"""
+
+	#only use the SQLite database or the log if they have been started (python sqlstore.py import or deltalog.py init)
+	if not os.path.exists(sqlname):
+		sqlname = None
+	if (sqlname is not None) or (not os.path.exists(logdir)):
+		logdir = None
+
+	#load in string of date, headers and database entries from the database (nothing but the date and headers
+	#from SQLite as the updates don't need the database in memory)
+	with stage("load") as record:
+		if sqlname is not None:
+			DBdate, headers = meta(sqlname)
+			database = None
+		elif logdir is None:
+			DBdate, headers, database = loadDB(DBname)
+		else:
+			DBdate, headers, database = load_delta(logdir)
+		record["rows_out"] = None if database is None else len(database)
+
+	#datetime dates
+	DB_date = dt.datetime.strptime(DBdate, '%Y-%m-%d %H:%M:%S') #date from tns database
+	today = dt.datetime.combine(dt.datetime.now(), dt.datetime.min.time()) #today's data at turn of the day
+
+	#time difference between the dates
+	deltaT = (today - DB_date).days #time diff in days
+
+	if deltaT == 0:
+		print("TNS database is already up to date")
+
+	elif deltaT == 1:
+		#if only 1 day diff then download yesterday's updates and add to database
 		udate = DB_date.strftime('%Y%m%d')
-		next_day = DB_date+dt.timedelta(days=1)
-
-    	#do the update for that date
-		DandU(udate,next_day,database,headers)
-
-    	#load new database that was just saved so it can be overwritten again
-		DBdate, headers, database = loadDB(DBname)
-		DB_date = dt.datetime.strptime(DBdate, '%Y-%m-%d %H:%M:%S') #convert next date into datetime object
-
-else:
-	#if over 25days difference then redownload the whole database from the TNS
-
-	#string that constitutes the curl command for downloading
-	cmd = '''curl -X POST -H 'user-agent: tns_marker{"tns_id":142993,"type": "bot", "name":"BillyShears"}' -d 'api_key=SECRET' https://www.wis-tns.org/system/files/tns_public_objects/tns_public_objects.csv.zip > /home/pha17gh/TNS/tns_public_objects.csv.zip'''
-
-	#do the curl command to download the database
-	subprocess.call(cmd,shell=True)
-
-	#unzip the csv and delete the zip file
-	uzip = "unzip /home/pha17gh/TNS/tns_public_objects.csv.zip -d /home/pha17gh/TNS/"
-	rem = "rm /home/pha17gh/TNS/tns_public_objects.csv.zip"
-	subprocess.call(uzip,shell=True)
-	subprocess.call(rem,shell=True)
+		DBdate, headers, database = DandU(udate,today,database,headers,logdir=logdir,sqlname=sqlname)
+
+	elif (deltaT>1) & (deltaT<=25):
+		#if between 2 and 25days difference then download all previous updates and add them to database
+
+		#dates of the missed updates from last to most current (as strings to find the update files)
+		udates = [(DB_date+dt.timedelta(days=i)).strftime('%Y%m%d') for i in range(deltaT)]
+
+		#merge all the updates in memory and save the database once, dated the day after the last update
+		DBdate, headers, database = catch_up(udates,DB_date+dt.timedelta(days=deltaT),database,headers,logdir=logdir,sqlname=sqlname)
+
+	else:
+		#if over 25days difference then redownload the whole database from the TNS
+
+		#string that constitutes the curl command for downloading
+		cmd = '''curl -X POST -H 'user-agent: tns_marker{"tns_id":142993,"type": "bot", "name":"BillyShears"}' -d 'api_key=SECRET' https://www.wis-tns.org/system/files/tns_public_objects/tns_public_objects.csv.zip > /home/pha17gh/TNS/tns_public_objects.csv.zip'''
+
+		#do the curl command to download the database
+		with stage("download"):
+			subprocess.call(cmd,shell=True)
+
+		#read the database straight out of the zip file (decompressed as it is parsed), then delete it
+		zipname = "/home/pha17gh/TNS/tns_public_objects.csv.zip"
+		with stage("unzip") as record:
+			DBdate, headers, database = loadDB(zipname)
+			record["rows_out"] = len(database)
+		os.remove(zipname)
+
+		#save the CSV, columnar copy and cached times of the new database (and start the log again from it),
+		#or replace everything in the SQLite database with it
+		if sqlname is not None:
+			with stage("save",len(database)):
+				import_database(sqlname,DBdate,headers,database)
+		else:
+			save_database(DBdate,headers,database)
+			if logdir is not None:
+				compact(logdir,DBdate,headers,database)
+
+	#only the entries in the Fast and Slow windows are needed from SQLite (indexed range queries), and the CSV is
+	#exported every so often for the scripts that read it directly
+	if sqlname is not None:
+		with stage("save"):
+			refresh_csv(sqlname,DBname)
+		with stage("load") as record:
+			DBdate, headers, database = window_database(sqlname,DBdate)
+			record["rows_out"] = len(database)
+
+	return DBdate, headers, database
+
+if __name__ == "__main__":
+	update_database()
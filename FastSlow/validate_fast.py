@@ -0,0 +1,82 @@
+"""
+Script to check the "fast" visibility method (analytic positions from fastmath.py) against the precise "batch"
+method (skyfield's apparent positions) for a night, using a large random sample of targets spread evenly over the
+sky. Prints the largest and 99th percentile deviations in the transit time, transit altitude, altitude through the
+night and observable time, and how many targets would pass the observable time thresholds in one method but not the
+other.
+
+Depends on functions.py script to operate.
+
+Author: George Hume
+2023
+"""
+
+### IMPORTS ###
+import argparse
+import numpy as np
+import datetime as dt
+from functions import *
+
+### SYSTEM ARGUMENTS ###
+parser = argparse.ArgumentParser(description = """
+Compares the fast visibility method with the precise one over a random sample of the sky.
+""")
+
+#adding arguments to praser object
+parser.add_argument('--n' , type = int, default = 100000, help = 'Number of random targets (default is 100000).')
+parser.add_argument('--nalt' , type = int, default = 10000, help = 'Number of those targets to compare the altitudes through the night of (default is 10000).')
+parser.add_argument('--night' , type = str, default = None, help = 'Date the night starts on (format YYYY-MM-DD, default is tonight).')
+parser.add_argument('--site' , type = str, default = 'LT', help = 'Name of the follow-up telescope in SITES (default is LT).')
+parser.add_argument('--ephm' , type = str, default = 'de421.bsp', help = 'Path to the ephemerides file.')
+parser.add_argument('--seed' , type = int, default = 0, help = 'Seed of the random sample (default is 0).')
+args = parser.parse_args()
+
+if args.night is None:
+    night = dt.datetime.now()
+else:
+    night = dt.datetime.strptime(args.night,"%Y-%m-%d")
+
+if args.site not in SITES:
+    print(f"Fast method not validated - {args.site} is not one of the sites: {', '.join(SITES)}.")
+    exit()
+lat, long, elv = SITES[args.site]
+
+#random targets evenly spread over the sky
+rng = np.random.default_rng(args.seed)
+ra = rng.uniform(0,360,args.n)
+dec = np.degrees(np.arcsin(rng.uniform(-1,1,args.n)))
+
+## both methods ##
+t_obs, l_sep, mill, precise = Visibility(ra, dec, lat, long, elv, args.ephm, method = "batch", night = night, details = True)
+t_obs, l_sep, mill, fast = Visibility(ra, dec, lat, long, elv, args.ephm, method = "fast", night = night, details = True)
+
+## altitudes through the night on a 0.1hr grid ##
+ts, eph = timescale(), ephemeris(args.ephm)
+nightinfo = night_almanac(lat, long, elv, night, args.ephm, None, eph, ts)
+sunset, sunrise = ts.from_datetime(nightinfo["sunset"]).tt, ts.from_datetime(nightinfo["sunrise"]).tt
+times = np.arange(sunset,sunrise,0.1/24)
+sub = slice(0,min(args.nalt,args.n))
+alt_diff = np.abs(altitudes(ra[sub],dec[sub],lat,long,elv,times,eph,ts,fast=True)
+                  - altitudes(ra[sub],dec[sub],lat,long,elv,times,eph,ts))
+
+## deviations ##
+#only targets that transit above the horizon have meaningful transit times, and a transit just after midday can be
+#found a sidereal day later in one method, so the differences are wrapped
+day = 1/1.00273790935
+trans_diff = (fast["trans_time"] - precise["trans_time"] + day/2) % day - day/2
+up = precise["trans_alt"] > 0
+deviations = {
+    "transit time (s)": np.abs(trans_diff)[up]*86400,
+    "transit altitude (deg)": np.abs(fast["trans_alt"] - precise["trans_alt"]),
+    "altitude (deg)": alt_diff.ravel(),
+    "observable time (min)": np.abs(fast["t_obs"] - precise["t_obs"])*60,
+}
+
+print(f"Fast vs precise visibility at {args.site} for the night of {night.strftime('%Y-%m-%d')} ({args.n} targets)")
+for name, diff in deviations.items():
+    print(f"  {name:<24} max {diff.max():10.4f}  99th percentile {np.percentile(diff,99):10.4f}")
+
+for survey in THRESHOLDS:
+    limit = THRESHOLDS[survey]["obs_time"]
+    changed = np.sum((fast["t_obs"] > limit) != (precise["t_obs"] > limit))
+    print(f"  {survey} observable time cut ({limit} hrs): {changed} of {args.n} targets change")
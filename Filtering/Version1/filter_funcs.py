@@ -333,7 +333,48 @@ def Visibility(date, ra, dec, lat, long, elv, ephm = 'de421.bsp'):
 
 ################################################################################
 
-def pscore(database,weights):
+def rank(values,ties="ordinal"):
+    """
+    Ranks an array of values in ascending order (0 for the lowest value) using one sort.
+    Arguments:
+        - values: numpy array of the values to rank (any type numpy can sort, e.g., floats or datetime64)
+        - ties: how equal values are ranked
+            - "ordinal": each value gets a different rank, with equal values ranked in the order they appear (default)
+            - "min": equal values all get the lowest rank of the group (e.g., 0, 1, 1, 3)
+            - "average": equal values all get the mean rank of the group (e.g., 0, 1.5, 1.5, 3)
+    Outputs:
+        - ranks: numpy float array of the rank of each value
+    """
+
+    if ties not in ["ordinal","min","average"]:
+        print("Ranks not calculated - variable ties was not set to 'ordinal', 'min' or 'average'.")
+        exit()
+
+    n = values.size
+    order = np.argsort(values,kind="stable") #stable so equal values stay in the order they appear
+    ranks = np.empty(n,dtype="float")
+
+    if (ties == "ordinal") or (n == 0):
+        ranks[order] = np.arange(n)
+        return ranks
+
+    #find the groups of equal values in the sorted array
+    svals = values[order]
+    first = np.concatenate(([True],svals[1:] != svals[:-1])) #True where a new group starts
+    group = np.cumsum(first) - 1 #group number of each sorted value
+    starts = np.nonzero(first)[0] #rank of the first value in each group
+    ends = np.concatenate((starts[1:],[n])) - 1 #rank of the last value in each group
+
+    if ties == "min":
+        ranks[order] = starts[group]
+    else: #average
+        ranks[order] = ((starts + ends)/2)[group]
+
+    return ranks
+
+################################################################################
+
+def pscore(database,weights,ties="ordinal"):
     """
     Filters a database of targets by removing all those with zero observable time
     and then calculates the rest's priorty score, which depends on the target's
@@ -343,6 +384,7 @@ def pscore(database,weights):
     Arguments:
         - database: numpy object array of the list of targets (ID first column and the observable time, transit altitude, and lunar separation in last 3 columns)
         - weights: list of numbers to weight the contribitions towards the priorty score for the  observable time, transit altitude, and lunar separation
+        - ties: how targets with equal values are ranked, "ordinal", "min" or "average" (default is "ordinal", see rank)
     Outputs:
         - t_targets: new numpy object array with the remaning targets and their priorty scores in the final column
     """
@@ -354,31 +396,13 @@ def pscore(database,weights):
             bad_idx.append(i)
     t_array = np.delete(database,bad_idx,0) #deletes rows with no observable time
 
-    #save remaning IDs
-    newIDs = t_array.T[0]
-    pscores = np.zeros(newIDs.shape)
-
-    #sort the intresting rows in decending order so high pscore = low priorty and vice versa
-    to_sort = np.flip(np.sort(t_array.T[-3]))
-    ms_sort = np.flip(np.sort(t_array.T[-1]))
-    alt_sort = np.flip(np.sort(t_array.T[-2]))
-
-    #ranking loop - may need a better way to rank these
-    for j in tqdm(range(to_sort.size)):
-        #extracts the value of the sorted arrays
-        to = to_sort[j]
-        ms = ms_sort[j]
-        al = alt_sort[j]
-
-        #looks for the indices of the rows these values correpsonds to in the array of targets
-        tID = np.where(t_array.T[-3]==to)[0]
-        mID = np.where(t_array.T[-1]==ms)[0][0]
-        aID = np.where(t_array.T[-2]==al)[0][0]
-
-        #adds the value of j to priorty score for the given index - weighted
-        pscores[tID] += (weights[0]*j)
-        pscores[mID] += (weights[1]*j)
-        pscores[aID] += (weights[2]*j)
+    #rank the intresting rows in decending order (j=0 for the highest value) so high pscore = low priorty and vice versa
+    to_rank = rank(-np.array(t_array.T[-3],dtype="float"),ties)
+    ms_rank = rank(-np.array(t_array.T[-1],dtype="float"),ties)
+    alt_rank = rank(-np.array(t_array.T[-2],dtype="float"),ties)
+
+    #adds the rank of each target to its priorty score - weighted
+    pscores = np.array([to_rank,ms_rank,alt_rank]).T @ np.array(weights[0:3],dtype="float")
 
     #normalise the priority scores so they lie between 0-5 (where 5 is the highest priority)
     pscores=((pscores-np.min(pscores))/np.max(pscores-np.min(pscores)) * 5)
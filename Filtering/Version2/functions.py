@@ -43,6 +43,53 @@ def loadDB(filename):
 
 ################################################################################
 
+def upsert(database,updates):
+    """
+    Function that applies the rows of a TNS update file to the TNS database in a single pass. Rows with an objid
+    already in the database replace that entry in place and rows with a new objid are added to the top of the
+    database (in the same order they appear in the update file) with one concatenation.
+    Arguments:
+        - database: the values of the tns database (minus the date and headers) as numpy object array.
+        - updates: the values of the update file (minus the date and headers) as numpy object array.
+    Outputs:
+        - database: numpy object array of the updated tns database.
+    """
+
+    database = database.copy() #so the array passed in isn't changed
+
+    #map each objid to the first row it is found at (only searches the objid column)
+    index = {}
+    if database.size != 0:
+        for idx, ID in enumerate(database.T[0]):
+            index.setdefault(ID,idx)
+
+    #loop from bottom to top of the updates (same as adding the newest entries to the top one at a time)
+    new_rows = [] #rows of the new IDs (in the order they would have been added to the top)
+    new_index = {} #maps new IDs to their position in new_rows
+    for i in range(len(updates)):
+        row = updates[-(i+1)] #extarcts rows from bottom upwards (index -1 -> -len)
+        ID = row[0] #get the id of the update
+
+        if ID in index: #if it is in database then we need to update the entry
+            database[index[ID]] = row
+        elif ID in new_index: #if already added from this update file then overwrite it
+            new_rows[new_index[ID]] = row
+        else: #if id is not in database then this is a new ID
+            new_index[ID] = len(new_rows)
+            new_rows.append(row)
+
+    #inserts all the new IDs at the top of the database at once (last added goes to the very top)
+    if len(new_rows) != 0:
+        new_rows = np.array(new_rows[::-1],dtype="object")
+        if database.size == 0:
+            database = new_rows
+        else:
+            database = np.concatenate((new_rows,database),axis=0)
+
+    return database
+
+################################################################################
+
 def DandU(udate,date,database,headers):
     """
     This function downloads an update csv file from the TNS server and then uses it to update the local copy of the TNS database.
@@ -75,17 +122,8 @@ def DandU(udate,date,database,headers):
     UDname = f"/home/pha17gh/TNS/{ufile}"
     dummy1,dummy2,updates = loadDB(UDname)
 
-    #now need to loop through each entry in the updates  and find match/ or add if new to the database
-    #need to loop from bottom to top so to add newest entries to the top of the database
-    for i in range(len(updates)):
-        row = updates[-(i+1)] #extarcts rows from bottom upwards (index -1 -> -len)
-        ID = row[0] #get the id of the update
-        IDrow = np.where(database == ID)[0] # looks for row corresponding to ID in the database
-
-        if IDrow.size == 0: #if id is not in database then this is a new ID
-            database = np.vstack([row,database]) #inserts new ID at the top of the database
-        else: #if it is in database then we need to update the entry
-            database[IDrow[0]] = row
+    #find match/ or add if new to the database for each entry in the updates
+    database = upsert(database,updates)
 
     database = np.vstack([headers,database]) #add the headers back to the top
 
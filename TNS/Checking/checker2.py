@@ -1,6 +1,5 @@
 import csv
 import numpy as np
-from tqdm import tqdm
 import argparse
 
 ### SYSTEM ARGUMENTS ###
@@ -67,35 +66,39 @@ else:
     database_name = "local"
     #finding where the ID from the local list is in the official list
 
+#duplicates in the larger list are every appearance of an ID after its first (found with np.unique rather
+#than by checking each ID against a growing list of the IDs already checked)
+uniq1, first1 = np.unique(ids1, return_index=True)
+first = np.zeros(ids1.size, dtype=bool)
+first[first1] = True
+duplicates = ids1[~first].tolist() #in the order they appear
+
+#hash map from each ID in the smaller list to the first row it is at and how many times it is there
+#(so each ID is looked up in constant time rather than searching the whole list with np.where)
+uniq2, first2, counts2 = np.unique(ids2, return_index=True, return_counts=True)
+lookup = dict(zip(uniq2.tolist(), zip(first2.tolist(), counts2.tolist())))
+
 #empty lists
 nomatch = []
 mult = []
-match = []
-rowdifs = []
-checkedIDs = []
-duplicates = []
-
-for idx, iD in enumerate(tqdm(ids1)):
-    #idx is the index that the id is located at in the list of ids, id is the value of the id
-    #check if new id is already been called (i.e., duplicate in ID list we are looping thru)
-    if iD in checkedIDs:
-        duplicates.append(iD) #add id to list of duplicates if it is
-    else:
-        index = np.where(ids2==iD)[0] #looks for index that the id is at in the smaller id list
-        if index.size == 0: #if no index produced then there is no match
-            nomatch.append(iD)
-        elif index.size == 1: #if one index then there has been a match
-            if (np.prod(db1[idx] == db2[index[0]]) == 1):
-                #checks if the row with the ID we were searching for is the same as the row where the ID is located in the other database
-                #if all entries in this row comparison for this ID are true then the rows are the same
-                #this means the product of this comparison will be 1 (or True)
-                match.append(iD)
-            else: #else the rows for this ID have different entries
-                rowdifs.append(iD)
-        else: #else multiple indices so multiple matches
-            mult.append(iD)
-
-        checkedIDs.append(iD) #add id to the list of ids that have been checked
+pairs = [] #(index in larger list, index in smaller list) of the IDs with one match
+
+for idx in np.sort(first1): #first appearance of each ID, in the order they appear
+    iD = ids1[idx]
+    index, count = lookup.get(iD, (None, 0)) #where the id is in the smaller id list
+    if count == 0: #if no index then there is no match
+        nomatch.append(iD)
+    elif count == 1: #if one index then there has been a match (rows compared below all at once)
+        pairs.append((idx, index))
+    else: #else multiple indices so multiple matches
+        mult.append(iD)
+
+#checks if the rows with the matched IDs are the same in both databases
+#if all entries in a row comparison are true then the rows are the same
+pairs = np.array(pairs, dtype=int).reshape(-1, 2)
+same = (db1[pairs.T[0]] == db2[pairs.T[1]]).all(axis=1) if pairs.size != 0 else np.zeros(0, dtype=bool)
+match = ids1[pairs.T[0][same]].tolist()
+rowdifs = ids1[pairs.T[0][~same]].tolist() #the rows for these IDs have different entries
 
 print(f"Number of full matches: {len(match)}")
 print(f"Number of ID matches with different row entries: {len(rowdifs)}")
@@ -36,17 +36,30 @@ for row in csvreader2:
 #convert list into numpy array
 updates = np.array(updates,dtype="object")
 
+#map each objid in the database to the first row it is found at (only searches the objid column)
+index = {}
+for idx, ID in enumerate(database.T[0]):
+    index.setdefault(ID,idx)
+
 #now need to loop through each entry in the updates  and find match/ or add if new to the database
 #need to loop from bottom to top so to add newest entries to the top of the database
+new_rows = [] #rows of the new IDs (in the order they would have been added to the top)
+new_index = {} #maps new IDs to their position in new_rows
 for i in range(len(updates)):
     row = updates[-(i+1)] #extarcts rows from bottom upwards (index -1 -> -len)
     ID = row[0] #get the id of the update
-    IDrow = np.where(database == ID)[0] # looks for row corresponding to ID in the database
 
-    if IDrow.size == 0: #if id is not in database then this is a new ID
-        database = np.vstack([row,database]) #inserts new ID at the top of the database
-    else: #if it is in database then we need to update the entry
-        database[IDrow[0]] = row
+    if ID in index: #if it is in database then we need to update the entry
+        database[index[ID]] = row
+    elif ID in new_index: #if already added from this update file then overwrite it
+        new_rows[new_index[ID]] = row
+    else: #if id is not in database then this is a new ID
+        new_index[ID] = len(new_rows)
+        new_rows.append(row)
+
+#inserts all the new IDs at the top of the database at once (last added goes to the very top)
+if len(new_rows) != 0:
+    database = np.concatenate((np.array(new_rows[::-1],dtype="object"),database),axis=0)
 
 database = np.vstack([headers,database]) #add the headers back to the top
 